@@ -1,21 +1,63 @@
-from flask import Flask, request, jsonify
-import pandas as pd
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import hmac
+
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 
-from preprocessor import load_assets, preprocess_input, make_prediction
-from config import USER_INPUT_COLUMNS
+import preprocessor
+import startup
+import metrics
+import thread_plan
+import model_reload
+import columnar
+import sweep
+import fast_json
+import request_schema
+from preprocessor import current_predictor
+from batcher import MicroBatcher
+from prediction_cache import create_prediction_cache
+from config import (
+    MAX_BATCH_SIZE, MICROBATCH_ENABLED, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_US, MICROBATCH_TIMEOUT_SECONDS,
+    PREDICTION_CACHE_ENABLED, PREDICTION_CACHE_BACKEND, PREDICTION_CACHE_MAX_SIZE,
+    PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_SHARED_PATH, STARTUP_MODE, ADMIN_TOKEN, EARLY_EXIT_MARGIN
+)
 
 app = Flask(__name__)
+# orjson for request bodies and responses when it is installed
+JSON_ENGINE = fast_json.install(app)
+# Input record checks, compiled once from the column lists and the form's field specs
+REQUEST_SCHEMA = request_schema.compile_schema()
 
-# Load assets when the application starts
-try:
-    load_assets()
-    print("Model and preprocessors loaded successfully.")
-except Exception:
+# Load assets and warm up the model when the application starts (or in the
+# background with STARTUP_MODE=background). A failure does not stop the app:
+# / and /ready report it, and the prediction routes return errors.
+startup.start(STARTUP_MODE, started_at=_IMPORT_STARTED)
+if startup.STATE["status"] == "failed":
     print("Application will not start without required model assets.")
-    # In a production environment, you might stop the application here or run it 
-    # with a health check that fails. For this example, we proceed but allow 
-    # preprocessor.py to handle the runtime error.
+# Picks up new files in MODELS_DIR (MODEL_RELOAD_POLL_SECONDS); preloaded gunicorn workers start it after the fork
+if not startup.FORK_PENDING:
+    model_reload.watch()
+
+
+def _predict_records_versioned(records: list) -> list:
+    """predict_records on the active predictor, each result paired with the bundle version that produced it."""
+    predictor = current_predictor()
+    return [(predictor.version, result) for result in predictor.predict_records(records, EARLY_EXIT_MARGIN)]
+
+
+# Optional micro-batching of concurrent /predict calls (one scheduler thread per worker process)
+PREDICTION_BATCHER = (
+    MicroBatcher(_predict_records_versioned, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_US, MICROBATCH_TIMEOUT_SECONDS)
+    if MICROBATCH_ENABLED else None
+)
+
+# Optional cache of /predict results for repeated payloads
+PREDICTION_CACHE = create_prediction_cache(
+    PREDICTION_CACHE_BACKEND, PREDICTION_CACHE_MAX_SIZE, PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_SHARED_PATH
+) if PREDICTION_CACHE_ENABLED else None
 
 # CORS(app, resources={r"/predict": {"origins": ["http://localhost:5173", "https://disease-risk-prediction-frontend.vercel.app/"]}})
 
@@ -28,53 +70,425 @@ CORS(app, resources={r"/predict": {"origins": [
 ]}})
 
 
+def _explain_requested() -> bool:
+    """?explain=1 (or true/yes) on a prediction route."""
+    return request.args.get("explain", "").lower() in ("1", "true", "yes")
+
+
+def _not_ready_response():
+    """503 while startup is still running (STARTUP_MODE=background), otherwise None."""
+    if startup.in_progress():
+        response = jsonify({"error": "Model is still loading", "status": startup.STATE["status"]})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    return None
+
+
+@app.after_request
+def add_model_version(response):
+    """Every response names the bundle version that served it (or that is active)."""
+    version = g.get("model_version")
+    if version is None and preprocessor.ACTIVE_PREDICTOR is not None:
+        version = preprocessor.ACTIVE_PREDICTOR.version
+    if version is not None:
+        response.headers["X-Model-Version"] = version
+    return response
+
+
 @app.route('/')
 def home():
-    """Simple status check for root URL."""
+    """Status check for root URL; reports startup progress and load failures."""
+    state = startup.STATE
+    if state["status"] == "failed":
+        return jsonify({"status": "Model assets failed to load", "error": state["error"], "version": "1.0"}), 503
+    if not startup.is_ready():
+        return jsonify({"status": "API is starting", "startup": state["status"], "version": "1.0"}), 200
     return jsonify({"status": "API is operational", "version": "1.0"}), 200
 
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: succeeds only once the assets are loaded and the model is warmed up."""
+    state = startup.STATE
+    body = {"ready": startup.is_ready(), "status": state["status"], "timings": state["timings"]}
+    if state["error"]:
+        body["error"] = state["error"]
+    return jsonify(body), 200 if startup.is_ready() else 503
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """
     Accepts user data via POST request, preprocesses it, and returns the prediction.
+    With ?explain=1 the response also attributes the result to the input fields.
     """
     # 1. Input Validation
-    if not request.json:
+    data = request.json
+    if not data:
         return jsonify({"error": "No JSON data received"}), 400
 
-    data = request.json
+    not_ready = _not_ready_response()
+    if not_ready is not None:
+        return not_ready
 
-    # Check for missing required features
-    if not all(col in data for col in USER_INPUT_COLUMNS):
-        missing = [col for col in USER_INPUT_COLUMNS if col not in data]
-        return jsonify({
-            "error": "Missing required features in input data",
-            "missing": missing
-        }), 400
+    # Required features, types and ranges, in one pass; data becomes the typed record
+    data, errors = REQUEST_SCHEMA.parse(data)
+    if errors:
+        return jsonify(request_schema.error_body(errors)), 400
 
     try:
-        # 2. Prepare Data
-        # Create a single-row DataFrame from the input data in the correct order
-        input_df = pd.DataFrame([data], columns=USER_INPUT_COLUMNS)
+        # 2. Preprocessing and Prediction
+        # One predictor for the whole request, so a bundle swapped in meanwhile is not mixed in.
+        # preprocess_records only reads the USER_INPUT_COLUMNS keys of the record
+        predictor = current_predictor()
+        g.model_version = predictor.version
+        explain = _explain_requested()
+        results = None
+        if PREDICTION_CACHE is not None:
+            cache_key = predictor.cache_key(data, EARLY_EXIT_MARGIN, explain)
+            results = PREDICTION_CACHE.get(cache_key, predictor.version)
 
-        # 3. Preprocessing and Prediction
-        X_pca = preprocess_input(input_df)
-        results = make_prediction(X_pca)
+        if results is None:
+            if explain:
+                # Explained results are cached with their explanation, under their own key
+                results = predictor.explain_records([data])[0]
+            elif PREDICTION_BATCHER is not None:
+                # The batch runs on whichever predictor is active when it is dispatched
+                g.model_version, results = PREDICTION_BATCHER.submit(data)
+            else:
+                X_pca = predictor.preprocess_records([data])
+                results = predictor.make_prediction(X_pca, EARLY_EXIT_MARGIN)
+            if PREDICTION_CACHE is not None and g.model_version == predictor.version:
+                PREDICTION_CACHE.set(cache_key, results, predictor.version)
 
-        # 4. Return Results
-        return jsonify({
+        # 3. Return Results
+        response = {
             "status": "success",
             "prediction_label": results['prediction_label'],
-            "probability_of_disease": results['probability_of_disease']
-        })
+            "probability_of_disease": results['probability_of_disease'],
+            "model_version": g.model_version
+        }
+        if "trees_used" in results:
+            response["trees_used"] = results["trees_used"]
+        if "explanation" in results:
+            response["explanation"] = results["explanation"]
+        return jsonify(response)
+
+    except RuntimeError as e:
+        # Handles errors from preprocessor (e.g., assets not loaded)
+        metrics.record_error(str(e))
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        # Catch any unexpected errors during processing
+        metrics.record_error(str(e))
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Accepts a list of user records (either a bare JSON array or {"records": [...]})
+    and scores all valid records in a single vectorized preprocessing/prediction pass.
+    Each record gets its own result entry; invalid records are reported per row
+    instead of failing the whole batch. ?explain=1 adds an explanation to each
+    result (JSON batches only).
+    """
+    not_ready = _not_ready_response()
+    if not_ready is not None:
+        return not_ready
+
+    kind = columnar.media_kind(request.mimetype)
+    if kind is not None:
+        if _explain_requested():
+            return jsonify({"error": "explain is only supported for JSON batches"}), 400
+        return _predict_batch_columnar(kind)
+
+    # 1. Input Validation
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({"error": "No JSON data received"}), 400
+
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        return jsonify({"error": "Expected a JSON array of records or an object with a 'records' array"}), 400
+
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({
+            "error": f"Batch too large: {len(records)} records (maximum is {MAX_BATCH_SIZE})"
+        }), 413
+
+    results = [None] * len(records)
+    valid_indices = []
+    valid_records = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[i] = {"index": i, "status": "error", "error": "Record must be a JSON object"}
+            continue
+        record, errors = REQUEST_SCHEMA.parse(record)
+        if errors:
+            results[i] = {"index": i, "status": "error", **request_schema.error_body(errors)}
+            continue
+        valid_indices.append(i)
+        valid_records.append(record)
+
+    try:
+        # 2. Preprocessing and Prediction (one pass over all valid rows)
+        predictor = current_predictor()
+        g.model_version = predictor.version
+        if _explain_requested():
+            scored = predictor.explain_batch(valid_records)
+        else:
+            scored = predictor.score_batch(valid_records, EARLY_EXIT_MARGIN)
 
     except RuntimeError as e:
         # Handles errors from preprocessor (e.g., assets not loaded)
+        metrics.record_error(str(e))
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         # Catch any unexpected errors during processing
+        metrics.record_error(str(e))
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+    # 3. Return Results
+    for i, result in zip(valid_indices, scored):
+        if "error" in result:
+            metrics.record_error(result["error"])
+            results[i] = {"index": i, "status": "error", "error": result["error"]}
+        else:
+            results[i] = {"index": i, "status": "success", **result}
+
+    return jsonify({
+        "status": "success",
+        "count": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "success"),
+        "model_version": g.model_version,
+        "results": results
+    })
+
+
+def _predict_batch_columnar(kind: str):
+    """
+    /predict_batch for an Arrow IPC stream or MessagePack body: one column per
+    input field instead of one object per record, answered in the same format.
+    The columns are scored as they are, without building a dict per row.
+    """
+    if not columnar.available(kind):
+        return jsonify({"error": f"Unsupported Content-Type {request.mimetype}: "
+                                 f"{columnar.LIBRARIES[kind]} is not installed"}), 415
+
+    # 1. Input Validation
+    try:
+        columns, n_rows = columnar.decode(kind, request.get_data())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if n_rows > MAX_BATCH_SIZE:
+        return jsonify({
+            "error": f"Batch too large: {n_rows} records (maximum is {MAX_BATCH_SIZE})"
+        }), 413
+
+    # The same field checks as JSON records, a column at a time; rejected rows are reported per row
+    columns, valid_indices, row_errors = REQUEST_SCHEMA.parse_columns(columns, n_rows)
+
+    try:
+        # 2. Preprocessing and Prediction (one pass over all valid rows)
+        predictor = current_predictor()
+        g.model_version = predictor.version
+        scored = predictor.score_columns(columns, len(valid_indices), EARLY_EXIT_MARGIN)
+
+    except RuntimeError as e:
+        metrics.record_error(str(e))
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        metrics.record_error(str(e))
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+    # 3. Return Results
+    results = [None] * n_rows
+    for i, errors in row_errors.items():
+        results[i] = {"index": i, "status": "error", **request_schema.error_body(errors)}
+    for i, result in zip(valid_indices.tolist(), scored):
+        if "error" in result:
+            metrics.record_error(result["error"])
+            results[i] = {"index": i, "status": "error", "error": result["error"]}
+        else:
+            results[i] = {"index": i, "status": "success", **result}
+
+    body = columnar.encode(kind, results, g.model_version)
+    return Response(body, mimetype=columnar.CONTENT_TYPES[kind])
+
+
+@app.route('/predict_sweep', methods=['POST'])
+def predict_sweep():
+    """
+    What-if sensitivity: scores one record with one field swept over a range
+    (a risk curve) or two fields over a grid, all points in a single batch.
+
+    {"record": {...}, "sweep": [{"field": "bmi", "start": 18, "stop": 40, "steps": 50}]}
+    A sweep may list explicit "values" instead (also for categorical fields).
+    """
+    not_ready = _not_ready_response()
+    if not_ready is not None:
+        return not_ready
+
+    # 1. Input Validation
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "No JSON data received"}), 400
+
+    record = payload.get("record")
+    if not isinstance(record, dict):
+        return jsonify({"error": "Expected a 'record' object"}), 400
+    record, errors = REQUEST_SCHEMA.parse(record)
+    if errors:
+        return jsonify(request_schema.error_body(errors)), 400
+
+    try:
+        axes = sweep.parse_sweeps(payload.get("sweep"))
+    except sweep.SweepTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Every point must pass the checks a record would: an out-of-range value is a 400, not a pipeline error
+    errors = []
+    for field, values in axes:
+        _, point_errors = REQUEST_SCHEMA.parse_values(field, values)
+        errors += [{"index": i, **error} for i, field_errors in sorted(point_errors.items())
+                   for error in field_errors]
+    if errors:
+        return jsonify(request_schema.error_body(errors)), 400
+
+    try:
+        # 2. Preprocessing and Prediction (the base record, then every point in one batch)
+        predictor = current_predictor()
+        g.model_version = predictor.version
+        base = predictor.score_batch([record], EARLY_EXIT_MARGIN)[0]
+        varied, n_points = sweep.grid(axes)
+        scored = predictor.score_sweep(record, varied, n_points, EARLY_EXIT_MARGIN)
+
+    except RuntimeError as e:
+        metrics.record_error(str(e))
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        metrics.record_error(str(e))
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+    # 3. Return Results
+    errors = []
+    for i, result in enumerate(scored):
+        if "error" in result:
+            metrics.record_error(result["error"])
+            errors.append({"index": sweep.point_index(i, axes), "error": result["error"]})
+    response = {
+        "status": "success",
+        "model_version": g.model_version,
+        "base": base,
+        "axes": [{"field": field, "values": values.tolist()} for field, values in axes],
+        "probability_of_disease": sweep.reshape([r.get("probability_of_disease") for r in scored], axes),
+        "prediction_label": sweep.reshape([r.get("prediction_label") for r in scored], axes),
+    }
+    if errors:
+        response["errors"] = errors
+    return jsonify(response)
+
+
+@app.route('/batching_stats')
+def batching_stats():
+    """Batch size and queue wait histograms of the /predict micro-batcher."""
+    if PREDICTION_BATCHER is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **PREDICTION_BATCHER.stats()}), 200
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Hit/miss/eviction counters of the /predict result cache (per worker process)."""
+    if PREDICTION_CACHE is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **PREDICTION_CACHE.stats()}), 200
+
+
+@app.route('/diagnostics')
+def diagnostics():
+    """CPU/thread plan of this worker and the BLAS/OpenMP thread pools actually loaded."""
+    return jsonify(thread_plan.diagnostics()), 200
+
+
+def _admin_denied():
+    """Error response unless the request carries the ADMIN_TOKEN bearer token, otherwise None."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Model administration is disabled (set ADMIN_TOKEN to enable it)"}), 403
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return jsonify({"error": "Invalid or missing admin token"}), 401
+    return None
+
+
+@app.route('/model')
+def model_info():
+    """Active and rollback bundles of this worker process, and the state of the latest reload."""
+    active = preprocessor.ACTIVE_PREDICTOR
+    return jsonify({
+        "active": active.info() if active is not None else None,
+        "previous": [predictor.info() for predictor in reversed(preprocessor.PREVIOUS_PREDICTORS)],
+        "reload": dict(model_reload.RELOAD, in_progress=model_reload.in_progress()),
+    }), 200
+
+
+@app.route('/model/reload', methods=['POST'])
+def reload_model():
+    """
+    Loads and warms up a bundle ({"models_dir": ...}, default MODELS_DIR) in the
+    background, then swaps it in; requests keep being served meanwhile. With
+    {"wait": true} it answers once the new bundle is active. Acts on this worker
+    process only: see MODEL_RELOAD_POLL_SECONDS for reloading every worker.
+    """
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    options = request.get_json(silent=True) or {}
+    models_dir = options.get("models_dir")
+
+    if options.get("wait"):
+        if model_reload.in_progress():
+            return jsonify({"error": "A reload is already in progress"}), 409
+        try:
+            predictor = model_reload.reload(models_dir)
+        except Exception as e:
+            return jsonify({"error": str(e) or type(e).__name__, "reload": model_reload.RELOAD}), 500
+        return jsonify({"status": "active", "active": predictor.info()}), 200
+
+    if not model_reload.start_reload(models_dir):
+        return jsonify({"error": "A reload is already in progress"}), 409
+    return jsonify({"status": "reloading", "reload": model_reload.RELOAD}), 202
+
+
+@app.route('/model/rollback', methods=['POST'])
+def rollback_model():
+    """Switches this worker process back to the bundle the last reload replaced."""
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    try:
+        predictor = preprocessor.rollback()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    print(f"Rolled back to model bundle {predictor.version} from {predictor.source}")
+    return jsonify({"status": "active", "active": predictor.info()}), 200
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage latencies, batch sizes, errors by stage and process memory in Prometheus text format."""
+    histograms = []
+    if PREDICTION_BATCHER is not None:
+        histograms += [PREDICTION_BATCHER.batch_size_histogram, PREDICTION_BATCHER.queue_wait_histogram]
+    counters = {}
+    if PREDICTION_CACHE is not None:
+        stats = PREDICTION_CACHE.stats()
+        counters = {f"prediction_cache_{name}_total": stats[name]
+                    for name in ("hits", "misses", "evictions", "expirations", "invalidations")}
+    return Response(metrics.render_prometheus(histograms, counters), mimetype="text/plain; version=0.0.4")
+
 
 # if __name__ == '__main__':
 #     # Ensure all model artifacts are saved in a 'models' directory relative to the app.py
@@ -0,0 +1,239 @@
+# asgi.py
+#
+# Async entry point serving the same routes as app.py:
+#
+#     SERVER_INTERFACE=asgi gunicorn --config gunicorn.conf.py asgi:app   (needs uvicorn)
+#
+# Network I/O runs on the worker's event loop: request bodies are read and responses
+# written there, so a slow client or a large upload holds a connection, not a thread.
+# Once a request's body is complete, the Flask app handles it (parsing, preprocessing,
+# scoring) on a thread pool. Scoring requests get ASYNC_WORKER_THREADS threads and may
+# queue up to ASYNC_QUEUE_LIMIT deep; past that they are answered 503 with Retry-After
+# at once instead of waiting behind an unbounded queue. The other routes (/ready,
+# /metrics, /model, ...) run on a separate small pool, so health checks still answer
+# while scoring is saturated.
+
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from config import ASYNC_WORKER_THREADS, ASYNC_QUEUE_LIMIT, ASYNC_RETRY_AFTER_SECONDS, ASYNC_MAX_BODY_BYTES
+
+# POST routes whose handlers score records
+SCORING_PATHS = ("/predict", "/predict_batch", "/predict_sweep")
+CONTROL_THREADS = 2
+
+OVERLOADED_ERROR = "Server is at capacity, retry later"
+
+_TOO_LARGE = object()
+
+
+class Overloaded(Exception):
+    """Every handler thread is busy and the queue is full."""
+
+
+class BoundedExecutor:
+    """
+    A thread pool that runs at most `threads` calls at a time, lets at most
+    `queue_limit` more wait, and refuses anything beyond that with Overloaded.
+    run() is called from the event loop only, which serializes the admission
+    bookkeeping without a lock.
+    """
+
+    def __init__(self, threads: int, queue_limit: int, name: str = "handler"):
+        if threads < 1:
+            raise ValueError("threads must be at least 1")
+        self.threads = threads
+        self.queue_limit = max(queue_limit, 0)
+        self.name = name
+        self.in_flight = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.threads + self.queue_limit
+
+    def saturated(self) -> bool:
+        return self.in_flight >= self.capacity
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the pool and returns its result; raises Overloaded when full."""
+        if self.saturated():
+            raise Overloaded()
+        self.in_flight += 1
+        admitted = time.perf_counter()
+
+        def call():
+            metrics.HANDLER_QUEUE_WAIT.observe(time.perf_counter() - admitted)
+            return fn(*args)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), call)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created lazily, and again in every forked gunicorn worker (threads do not survive fork)
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix=self.name)
+        return self._executor
+
+
+def _environ(scope: dict, body: bytes) -> dict:
+    """The WSGI environ of an ASGI HTTP request whose body has been read."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] if server[1] is not None else 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for raw_name, raw_value in scope.get("headers", ()):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        if name == "CONTENT_LENGTH":
+            continue
+        key = name if name == "CONTENT_TYPE" else f"HTTP_{name}"
+        value = raw_value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(wsgi_app, environ: dict) -> tuple:
+    """Runs a WSGI app to completion: (status code, [(name, value)], body)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = int(status.split(" ", 1)[0]), headers
+
+    chunks = wsgi_app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return started["status"], started["headers"], body
+
+
+def _json_response(status: int, body: dict, headers=()) -> tuple:
+    return status, [("Content-Type", "application/json"), *headers], json.dumps(body).encode()
+
+
+class AsgiApp:
+    """ASGI application handing each HTTP request to `wsgi_app` on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, threads: int = ASYNC_WORKER_THREADS, queue_limit: int = ASYNC_QUEUE_LIMIT,
+                 retry_after: int = ASYNC_RETRY_AFTER_SECONDS, max_body_bytes: int = ASYNC_MAX_BODY_BYTES):
+        self.wsgi_app = wsgi_app
+        self.scoring = BoundedExecutor(threads, queue_limit, "scoring")
+        # Unbounded queue: these routes are cheap and must not be refused under load
+        self.control = BoundedExecutor(CONTROL_THREADS, sys.maxsize, "control")
+        self.retry_after = retry_after
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+
+    async def _http(self, scope, receive, send):
+        path = scope["path"]
+        executor = self.scoring if scope["method"] == "POST" and path in SCORING_PATHS else self.control
+        # Refused before the body is read, and again once it is (the pool may have filled meanwhile)
+        if executor.saturated():
+            await self._send(send, self._overloaded(path))
+            return
+
+        body = await self._read_body(receive)
+        if body is None:  # the client went away
+            return
+        if body is _TOO_LARGE:
+            await self._send(send, _json_response(413, {"error": "Request body too large",
+                                                        "max_bytes": self.max_body_bytes}))
+            return
+        try:
+            response = await executor.run(_call_wsgi, self.wsgi_app, _environ(scope, body))
+        except Overloaded:
+            response = self._overloaded(path)
+        await self._send(send, response)
+
+    async def _read_body(self, receive):
+        """The request body; None if the client disconnected, _TOO_LARGE once it exceeds max_body_bytes."""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return _TOO_LARGE
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    def _overloaded(self, path: str) -> tuple:
+        metrics.OVERLOAD_REJECTIONS.inc(path)
+        return _json_response(503, {"error": OVERLOADED_ERROR, "status": "overloaded"},
+                              [("Retry-After", str(self.retry_after))])
+
+    @staticmethod
+    async def _send(send, response: tuple):
+        status, headers, body = response
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.scoring.shutdown()
+                self.control.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_app(wsgi_app=None, **options) -> AsgiApp:
+    """AsgiApp around `wsgi_app` (default: the Flask app of app.py)."""
+    if wsgi_app is None:
+        from app import app as wsgi_app
+    return AsgiApp(wsgi_app, **options)
+
+
+app = create_app()
@@ -0,0 +1,128 @@
+# batcher.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from metrics import Histogram, BATCH_SIZE_BUCKETS, LATENCY_BUCKETS_SECONDS
+
+
+class MicroBatcher:
+    """
+    Collects items submitted concurrently by request threads and hands them to
+    `batch_fn` in one call.
+
+    A batch is closed when it reaches `max_batch_size` items or when
+    `max_wait_us` microseconds have passed since its first item arrived,
+    whichever comes first. `batch_fn(items)` must return one result per item,
+    in order. If it raises, the batch is bisected so that every caller gets
+    either its own result or the exception raised by its own item.
+    A caller waits at most `timeout_s` seconds for its result.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 32, max_wait_us: int = 2000, timeout_s: float = 30.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_us, 0) / 1e6
+        self.timeout = timeout_s
+        self.batch_size_histogram = Histogram("microbatch_size", BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram("microbatch_queue_wait_seconds", LATENCY_BUCKETS_SECONDS)
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item):
+        """
+        Queues one item and blocks until its result is available (or re-raises its
+        error). Raises RuntimeError if no result arrives within the timeout.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RuntimeError(f"Micro-batch timed out: no result after {self.timeout:g} s")
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_us": int(self.max_wait * 1e6),
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_seconds": self.queue_wait_histogram.snapshot(),
+        }
+
+    def _ensure_worker(self):
+        # Started lazily, again in every forked gunicorn worker (threads do not survive fork),
+        # and again if the scheduler thread died
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # From here on a caller that times out can no longer cancel its future (cancel()
+            # returns False), so results can always be set; futures already cancelled are dropped
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                started = time.perf_counter()
+                self.batch_size_histogram.observe(len(batch))
+                for _, _, enqueued in batch:
+                    self.queue_wait_histogram.observe(started - enqueued)
+                self._dispatch(batch)
+            except Exception as e:
+                _fail(batch, e)
+            except BaseException as e:
+                # The thread stops; the next submit() starts a new one
+                with self._lock:
+                    self._thread = None
+                _fail(batch, RuntimeError(f"Micro-batcher stopped: {e!r}"))
+                raise
+
+    def _dispatch(self, batch):
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _fail(batch, e)
+                return
+            middle = len(batch) // 2
+            self._dispatch(batch[:middle])
+            self._dispatch(batch[middle:])
+            return
+        if len(results) != len(batch):
+            _fail(batch, RuntimeError(f"Micro-batch returned {len(results)} results for {len(batch)} items"))
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+
+def _fail(batch, error: BaseException):
+    """Fails every future of `batch` that has no result yet."""
+    for _, future, _ in batch:
+        if not future.done():  # already answered by a bisected half
+            future.set_exception(error)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+How far early exit moves predictions, and how much time it saves.
+
+Scores the sample with every tree as the reference, then with each margin and
+check frequency (EARLY_EXIT_FREQ is patched for the run), and reports per
+setting:
+
+  label_agreement          share of rows with the same predicted label
+  max/mean_probability_error  |p_early - p_full| over the sample
+  mean/max_trees_used      trees evaluated per row
+  single_row_ms            make_prediction on one row (median), full vs early exit
+  batch_ms                 make_batch_prediction on the whole sample
+
+    python benchmarks/early_exit_report.py --rows 2000 --margins 2 4 6 8 --freqs 10 25 50
+
+A smaller margin stops more rows early (fewer mean_trees_used) and moves more
+labels; a larger freq checks the margin less often. Take the smallest margin
+whose label_agreement the traffic tolerates as EARLY_EXIT_MARGIN. Run from the
+server/ directory.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from synthetic import add_sample_arguments, sample_records  # noqa: E402
+
+DEFAULT_MARGINS = (2.0, 4.0, 6.0, 8.0, 10.0)
+DEFAULT_FREQS = (10, 25, 50)
+
+
+def _median_ms(fn, inputs: list) -> float:
+    fn(inputs[0])
+    durations = []
+    for x in inputs:
+        started = time.perf_counter()
+        fn(x)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+
+def _batch_ms(fn, repeats: int = 3) -> float:
+    fn()
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return min(durations) * 1000
+
+
+def evaluate(predictor, X: np.ndarray, margin: float, freq: int, single_rows: int = 200) -> dict:
+    """Early exit at (margin, freq) compared with full evaluation on the rows of X."""
+    import preprocessor
+
+    saved_freq = preprocessor.EARLY_EXIT_FREQ
+    preprocessor.EARLY_EXIT_FREQ = freq
+    try:
+        full, _ = predictor._predict_early_exit(X, float("inf"))
+        early, trees_used = predictor._predict_early_exit(X, margin)
+        rows = [X[i:i + 1] for i in range(min(single_rows, len(X)))]
+        report = {
+            "margin": margin,
+            "freq": freq,
+            "rows": len(X),
+            "label_agreement": float(((full > 0.5) == (early > 0.5)).mean()),
+            "max_probability_error": float(np.abs(full - early).max()),
+            "mean_probability_error": float(np.abs(full - early).mean()),
+            "mean_trees_used": None if trees_used is None else float(trees_used.mean()),
+            "max_trees_used": None if trees_used is None else int(trees_used.max()),
+            "single_row_full_ms": _median_ms(predictor.make_prediction, rows),
+            "single_row_ms": _median_ms(lambda x: predictor.make_prediction(x, margin), rows),
+            "batch_full_ms": _batch_ms(lambda: predictor.make_batch_prediction(X)),
+            "batch_ms": _batch_ms(lambda: predictor.make_batch_prediction(X, margin)),
+        }
+    finally:
+        preprocessor.EARLY_EXIT_FREQ = saved_freq
+    return report
+
+
+def print_report(reports: list, n_trees: int):
+    print(f"{'margin':>7} {'freq':>5} {'agree':>8} {'max_err':>8} {'mean_err':>9} {'trees':>7}"
+          f" {'1-row ms':>15} {'batch ms':>17}")
+    for r in reports:
+        trees = "n/a" if r["mean_trees_used"] is None else f"{r['mean_trees_used']:.0f}/{n_trees}"
+        print(f"{r['margin']:>7g} {r['freq']:>5} {r['label_agreement']:>8.2%} {r['max_probability_error']:>8.4f}"
+              f" {r['mean_probability_error']:>9.5f} {trees:>7}"
+              f" {r['single_row_full_ms']:>6.3f} -> {r['single_row_ms']:<6.3f}"
+              f" {r['batch_full_ms']:>7.1f} -> {r['batch_ms']:<7.1f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_sample_arguments(parser)
+    parser.add_argument("--margins", nargs="+", type=float, default=list(DEFAULT_MARGINS))
+    parser.add_argument("--freqs", nargs="+", type=int, default=list(DEFAULT_FREQS))
+    args = parser.parse_args(argv)
+
+    from preprocessor import load_assets
+
+    predictor = load_assets()
+    X = predictor.preprocess_records(sample_records(args))
+    reports = [evaluate(predictor, X, margin, freq) for margin in args.margins for freq in args.freqs]
+
+    n_trees = predictor.tree_evaluator.n_trees if predictor.tree_evaluator is not None else "?"
+    print_report(reports, n_trees)
+    if args.output:
+        Path(args.output).write_text(json.dumps(reports, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
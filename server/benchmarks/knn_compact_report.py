@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Cost of replacing the fitted KNNImputer with a CompactKNNImputer.
+
+Leaves KNN-imputed fields empty at --missing-rate (0.3 by default, so most rows
+exercise the imputer), imputes them with the full training set and with each
+prototype count and method, and compares the two on the imputed values and on
+the final prediction. Size 0 keeps every training row, only cast to float32.
+
+  reference_kib              memory held by the reference set
+  build_s                    time to build the imputer from the fitted KNNImputer
+  imputation_error           mean |compact - full| over the imputed values, per
+                             column, in units of the column's training std
+  max_imputation_error       the same, worst value
+  label_agreement            share of rows with the same predicted label
+  max/mean_probability_error  |p_compact - p_full| over the sample
+  impute_ms                  transform() of the sample's KNN columns
+
+    python benchmarks/knn_compact_report.py --rows 2000 --sizes 0 20000 5000 1000 --methods random kmeans
+
+Weigh reference_kib against imputation_error and label_agreement when setting
+KNN_COMPACT_SIZE; kmeans spreads the prototypes over the training data at the
+cost of a MiniBatchKMeans fit, which shows in build_s. Run from the server/
+directory.
+"""
+
+import argparse
+import dataclasses
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from synthetic import add_sample_arguments, sample_records  # noqa: E402
+
+DEFAULT_SIZES = (0, 20000, 5000, 1000)
+DEFAULT_METHODS = ("random", "kmeans")
+
+
+def _timed(fn) -> tuple:
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def knn_block(records: list) -> np.ndarray:
+    """The KNN_IMPUTE_COLS of the records as floats, NaN where empty."""
+    from config import KNN_IMPUTE_COLS
+    from transform_plan import _to_number
+
+    return np.array([[_to_number(record.get(col)) for col in KNN_IMPUTE_COLS] for record in records])
+
+
+def with_imputer(predictor, imputer):
+    """A copy of `predictor` that imputes with `imputer` on both pipelines."""
+    from transform_plan import compile_transform_plan
+
+    plan = compile_transform_plan(
+        predictor.one_hot_encoder, predictor.ordinal_encoder, predictor.standard_scaler, imputer,
+        predictor.pca_transformer, predictor.final_features_list
+    )
+    return dataclasses.replace(predictor, knn_imputer=imputer, knn_index=imputer, transform_plan=plan)
+
+
+def evaluate(predictor, records: list, size: int, method: str, seed: int = 0) -> dict:
+    """CompactKNNImputer(size, method) compared with the predictor's own imputer on `records`."""
+    from knn_compact import build_compact_knn
+
+    full_imputer = predictor.knn_index or predictor.knn_imputer
+    X = knn_block(records)
+    missing = np.isnan(X)
+    full = full_imputer.transform(X)
+    full_probabilities = predictor._predict_probabilities(predictor.preprocess_records(records))
+
+    compact, build_s = _timed(lambda: build_compact_knn(predictor.knn_imputer, size or None, method, seed))
+    imputed, impute_s = _timed(lambda: compact.transform(X))
+    scale = np.nanstd(np.asarray(predictor.knn_imputer._fit_X, dtype=np.float64), axis=0)
+    errors = np.abs(imputed - full) / scale
+    variant = with_imputer(predictor, compact)
+    probabilities = variant._predict_probabilities(variant.preprocess_records(records))
+
+    from config import KNN_IMPUTE_COLS
+
+    return {
+        "size": size,
+        "method": compact.method or "all",
+        "rows": len(records),
+        "reference_rows": len(compact.reference),
+        "reference_kib": round(compact.nbytes / 1024, 1),
+        "build_s": round(build_s, 3),
+        "imputation_error": {
+            col: float(errors[missing[:, i], i].mean()) if missing[:, i].any() else 0.0
+            for i, col in enumerate(KNN_IMPUTE_COLS)
+        },
+        "max_imputation_error": float(errors[missing].max()) if missing.any() else 0.0,
+        "label_agreement": float(((full_probabilities > 0.5) == (probabilities > 0.5)).mean()),
+        "max_probability_error": float(np.abs(full_probabilities - probabilities).max()),
+        "mean_probability_error": float(np.abs(full_probabilities - probabilities).mean()),
+        "impute_ms": impute_s * 1000,
+    }
+
+
+def print_report(reports: list, full_kib: float):
+    print(f"Full imputer reference set: {full_kib:.1f} KiB (float64)")
+    print(f"{'size':>6} {'method':>7} {'KiB':>8} {'build s':>8} {'mean err (std)':>15} {'max err':>8}"
+          f" {'agree':>8} {'max_p_err':>9} {'mean_p_err':>10} {'impute ms':>10}")
+    for r in reports:
+        mean_error = float(np.mean(list(r["imputation_error"].values())))
+        print(f"{r['size']:>6} {r['method']:>7} {r['reference_kib']:>8.1f} {r['build_s']:>8.2f}"
+              f" {mean_error:>15.4f} {r['max_imputation_error']:>8.3f} {r['label_agreement']:>8.2%}"
+              f" {r['max_probability_error']:>9.4f} {r['mean_probability_error']:>10.5f} {r['impute_ms']:>10.1f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_sample_arguments(parser, missing_rate=0.3)
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+                        help="Prototype counts; 0 keeps every training row as float32")
+    parser.add_argument("--methods", nargs="+", default=list(DEFAULT_METHODS))
+    args = parser.parse_args(argv)
+
+    from preprocessor import load_assets
+
+    predictor = load_assets()
+    records = sample_records(args)
+    reports = []
+    for size in args.sizes:
+        # Without prototypes the method makes no difference
+        for method in (args.methods[:1] if size == 0 else args.methods):
+            reports.append(evaluate(predictor, records, size, method))
+
+    print_report(reports, np.asarray(predictor.knn_imputer._fit_X).nbytes / 1024)
+    if args.output:
+        Path(args.output).write_text(json.dumps(reports, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
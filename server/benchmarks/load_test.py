@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Load generator: latency/throughput curves for the API under gunicorn.
+
+Starts the app locally once per (workers, threads, OMP threads) combination
+and drives it in steps of increasing load:
+
+  closed  N clients each send their next request as soon as the previous one
+          answers (--concurrency 1 2 4 8 ...)
+  open    requests arrive at a fixed rate whether or not earlier ones finished
+          (--rates 100 200 400 ...); latency is measured from the scheduled
+          send time, so a server falling behind shows up as queueing delay
+
+Every step reports throughput, p50/p90/p99 latency and error rate, and each
+combination gets a saturation point: the heaviest step that still met the
+latency SLO and error budget, before throughput stopped growing.
+
+    python benchmarks/load_test.py --mode closed --concurrency 1 2 4 8 16 --duration 10
+    python benchmarks/load_test.py --mode open --rates 100 200 400 800 --endpoint predict_batch --batch-size 50
+    python benchmarks/load_test.py --workers 1 2 4 --threads 1 4 --omp-threads 1 2 --json sweep.json
+
+Payloads are random records from the frontend's field ranges (see synthetic.py).
+The generator itself uses CPU: on small machines, run it from another host with
+--url, or treat the numbers as relative. Run from the server/ directory.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from local_server import SERVER_DIR, LocalServer
+from synthetic import generate_records
+
+sys.path.insert(0, str(SERVER_DIR))
+
+ENDPOINTS = ("predict", "predict_batch")
+# A step counts as saturated once throughput grows by less than this over the previous step
+MIN_THROUGHPUT_GAIN = 0.05
+
+
+class Client:
+    """Keep-alive HTTP connection per thread, posting pre-encoded JSON bodies."""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def post(self, path: str, body: bytes) -> int:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port,
+                                                                             timeout=self.timeout)
+        try:
+            connection.request("POST", path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            return 0
+
+
+def make_payloads(endpoint: str, batch_size: int, count: int, seed: int, missing_rate: float) -> list:
+    """Pre-encoded request bodies, so the generator spends no time on JSON while measuring."""
+    if endpoint == "predict":
+        return [json.dumps(r).encode() for r in generate_records(count, seed=seed, missing_rate=missing_rate)]
+    records = generate_records(count * batch_size, seed=seed, missing_rate=missing_rate)
+    return [json.dumps({"records": records[i:i + batch_size]}).encode() for i in range(0, len(records), batch_size)]
+
+
+def _percentile_ms(ordered: list, q: float):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+
+def _step_report(load: dict, latencies: list, errors: int, elapsed: float, rows_per_request: int) -> dict:
+    ordered = sorted(latencies)
+    total = len(ordered)
+    return {
+        **load,
+        "requests": total,
+        "throughput_rps": round((total - errors) / elapsed, 1) if elapsed > 0 else 0.0,
+        "rows_per_second": round((total - errors) * rows_per_request / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": _percentile_ms(ordered, 0.50),
+        "p90_ms": _percentile_ms(ordered, 0.90),
+        "p99_ms": _percentile_ms(ordered, 0.99),
+        "max_ms": _percentile_ms(ordered, 1.0),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+    }
+
+
+def run_closed_step(client: Client, path: str, payloads: list, concurrency: int, duration: float,
+                    rows_per_request: int) -> dict:
+    """`concurrency` clients in a loop for `duration` seconds."""
+    deadline = time.perf_counter() + duration
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker():
+        local_latencies, local_errors = [], 0
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            status = client.post(path, payloads[next(counter) % len(payloads)])
+            local_latencies.append(time.perf_counter() - started)
+            local_errors += status != 200
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return _step_report({"concurrency": concurrency}, latencies, errors[0], elapsed, rows_per_request)
+
+
+def run_open_step(client: Client, path: str, payloads: list, rate: float, duration: float,
+                  rows_per_request: int, max_in_flight: int) -> dict:
+    """Requests sent at `rate` per second for `duration` seconds, up to `max_in_flight` at once."""
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def send(scheduled: float, body: bytes):
+        status = client.post(path, body)
+        latency = time.perf_counter() - scheduled  # includes any wait for a free sender
+        with lock:
+            latencies.append(latency)
+            errors[0] += status != 200
+
+    n_requests = max(1, int(rate * duration))
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for i in range(n_requests):
+            scheduled = started + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, scheduled, payloads[i % len(payloads)])
+    elapsed = time.perf_counter() - started
+    report = _step_report({"rate": rate}, latencies, errors[0], elapsed, rows_per_request)
+    report["achieved_rate"] = round(n_requests / elapsed, 1)
+    return report
+
+
+def saturation_point(steps: list, slo_ms: float, max_error_rate: float) -> dict:
+    """
+    The heaviest step that met the p99 SLO and error budget while throughput
+    was still growing (by at least MIN_THROUGHPUT_GAIN over the step before).
+    """
+    best = None
+    for step in steps:
+        healthy = (step["p99_ms"] is not None and step["p99_ms"] <= slo_ms
+                   and step["error_rate"] <= max_error_rate)
+        if not healthy:
+            break
+        if best is not None and step["throughput_rps"] < best["throughput_rps"] * (1 + MIN_THROUGHPUT_GAIN):
+            break
+        best = step
+    return best
+
+
+def run_combination(args, workers: int, threads: int, omp_threads: int, payloads: list) -> dict:
+    # The thread plan would size the pools (and LightGBM's num_threads) itself; off, the
+    # server runs with the OMP_NUM_THREADS being measured
+    env = {"OMP_NUM_THREADS": str(omp_threads), "THREAD_PLAN_ENABLED": "0"}
+    # Repeated payloads would otherwise be answered from the prediction cache
+    if not args.cache:
+        env["PREDICTION_CACHE_ENABLED"] = "0"
+    path = "/" + args.endpoint
+    rows_per_request = 1 if args.endpoint == "predict" else args.batch_size
+
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        server = LocalServer(workers=workers, threads=threads, env=env, timeout=args.timeout).start()
+        base_url = server.url
+    try:
+        client = Client(base_url, args.timeout)
+        for body in payloads[:max(10, (workers or 1) * (threads or 1))]:  # warm every worker
+            client.post(path, body)
+        steps = []
+        loads = args.concurrency if args.mode == "closed" else args.rates
+        for load in loads:
+            if args.mode == "closed":
+                step = run_closed_step(client, path, payloads, load, args.duration, rows_per_request)
+            else:
+                step = run_open_step(client, path, payloads, load, args.duration, rows_per_request,
+                                     args.max_in_flight)
+            steps.append(step)
+            if not args.quiet:
+                print(f"  {args.mode} {load:>6}: {step['throughput_rps']:>8} req/s  p50 {step['p50_ms']} ms  "
+                      f"p99 {step['p99_ms']} ms  errors {step['error_rate']:.1%}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.stop()
+
+    return {
+        "workers": workers, "threads": threads, "omp_threads": omp_threads,
+        "mode": args.mode, "endpoint": args.endpoint, "steps": steps,
+        "saturation": saturation_point(steps, args.slo_ms, args.max_error_rate),
+    }
+
+
+def print_summary(results: list, mode: str):
+    load_key = "concurrency" if mode == "closed" else "rate"
+    print(f"\n{'workers':>8}{'threads':>8}{'omp':>5}{load_key:>13}{'req/s':>10}{'rows/s':>10}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for result in results:
+        point = result["saturation"]
+        prefix = f"{result['workers'] or '-':>8}{result['threads'] or '-':>8}{result['omp_threads'] or '-':>5}"
+        if point is None:
+            print(f"{prefix}   no step met the SLO")
+            continue
+        print(f"{prefix}{point[load_key]:>13}{point['throughput_rps']:>10}{point['rows_per_second']:>10}"
+              f"{point['p50_ms']:>9}{point['p99_ms']:>9}{point['error_rate']:>8.1%}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32],
+                        help="Client counts for closed-loop steps")
+    parser.add_argument("--rates", nargs="+", type=float, default=[50, 100, 200, 400, 800],
+                        help="Requests per second for open-loop steps")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="predict")
+    parser.add_argument("--batch-size", type=int, default=50, help="Records per /predict_batch request")
+    parser.add_argument("--workers", nargs="+", type=int, default=[2], help="gunicorn worker counts to sweep")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1], help="gunicorn thread counts to sweep")
+    parser.add_argument("--omp-threads", nargs="+", type=int, default=[1], help="OMP_NUM_THREADS values to sweep")
+    parser.add_argument("--url", help="Drive an already running server instead of starting one (no sweep)")
+    parser.add_argument("--slo-ms", type=float, default=100.0, help="p99 latency objective (default 100 ms)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Open-loop concurrent request limit")
+    parser.add_argument("--cache", action="store_true", help="Keep the prediction cache enabled")
+    parser.add_argument("--payloads", type=int, default=2000, help="Distinct request bodies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--json", help="Write all steps and saturation points to this file")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    payloads = make_payloads(args.endpoint, args.batch_size, args.payloads, args.seed, args.missing_rate)
+    combinations = [(None, None, None)] if args.url else list(
+        itertools.product(args.workers, args.threads, args.omp_threads)
+    )
+    results = []
+    for workers, threads, omp_threads in combinations:
+        if not args.quiet:
+            print(f"workers={workers} threads={threads} OMP_NUM_THREADS={omp_threads}", file=sys.stderr)
+        results.append(run_combination(args, workers, threads, omp_threads, payloads))
+
+    print_summary(results, args.mode)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Runs the API under gunicorn on a free local port, for benchmarks and load tests.
+
+    with LocalServer(workers=2, env={"ASSET_MMAP_MODE": "none"}) as server:
+        requests.post(server.url + "/predict", json=record)
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def child_pids(parent: int) -> list:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; the ppid is the 2nd field after it
+        if int(stat.rsplit(")", 1)[1].split()[1]) == parent:
+            children.append(int(entry))
+    return sorted(children)
+
+
+class LocalServer:
+    """
+    gunicorn (with gunicorn.conf.py) serving app:app. Entering the context starts
+    it and waits until `/ready` answers and all workers are up; leaving stops it.
+    """
+
+    def __init__(self, workers: int = 1, threads: int = 1, env: dict = None, timeout: float = 180.0):
+        self.workers = workers
+        self.threads = threads
+        self.env = env or {}
+        self.timeout = timeout
+        self.port = None
+        self.process = None
+        self.ready_seconds = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def start(self):
+        self.port = free_port()
+        env = {
+            **os.environ, **self.env,
+            "WEB_CONCURRENCY": str(self.workers), "GUNICORN_THREADS": str(self.threads), "PORT": str(self.port),
+        }
+        started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "app:app"],
+            cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"gunicorn exited with code {self.process.returncode}")
+                if time.perf_counter() - started > self.timeout:
+                    raise RuntimeError("Timed out waiting for gunicorn to start")
+                try:
+                    ready = requests.get(self.url + "/ready", timeout=1).ok
+                    if ready and len(child_pids(self.pid)) >= self.workers:
+                        break
+                except requests.RequestException:
+                    pass
+                time.sleep(0.2)
+        except BaseException:
+            self.stop()
+            raise
+        self.ready_seconds = time.perf_counter() - started
+        return self
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Resident memory per gunicorn worker, with and without shared assets.
+
+Starts the API under gunicorn once per configuration, sends a few /predict
+requests so that every worker has scored at least once, and reads
+/proc/<pid>/smaps_rollup for the master and each worker:
+
+    python benchmarks/memory_report.py --workers 4
+
+"before": per-worker load_assets(), artifacts deserialized into private memory
+          (GUNICORN_PRELOAD=0, ASSET_MMAP_MODE=none)
+"after":  assets loaded once in the master and shared by the forked workers,
+          NumPy arrays memory-mapped (GUNICORN_PRELOAD=1, ASSET_MMAP_MODE=r)
+
+RSS counts shared pages in full for every process; PSS splits them between the
+processes sharing them, so the PSS total is the real footprint of the deployment.
+Linux only.
+"""
+
+import argparse
+import json
+import sys
+
+import requests
+
+from local_server import SERVER_DIR, LocalServer, child_pids
+
+sys.path.insert(0, str(SERVER_DIR))
+
+from config import WARMUP_RECORDS  # noqa: E402
+
+CONFIGURATIONS = {
+    "before": {"GUNICORN_PRELOAD": "0", "ASSET_MMAP_MODE": "none"},
+    "after": {"GUNICORN_PRELOAD": "1", "ASSET_MMAP_MODE": "r"},
+}
+
+
+def read_memory(pid: int) -> dict:
+    """RSS, PSS and shared/private split of one process, in MiB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mib": round(fields.get("Rss", 0.0), 1),
+        "pss_mib": round(fields.get("Pss", 0.0), 1),
+        "shared_mib": round(fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0), 1),
+        "private_mib": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def measure(name: str, workers: int, requests_per_worker: int, timeout: float) -> dict:
+    with LocalServer(workers=workers, env=CONFIGURATIONS[name], timeout=timeout) as server:
+        session = requests.Session()
+        for _ in range(workers * requests_per_worker):
+            session.post(server.url + "/predict", json=WARMUP_RECORDS[0], timeout=timeout).raise_for_status()
+
+        master_memory = read_memory(server.pid)
+        worker_memory = [read_memory(pid) for pid in child_pids(server.pid)]
+        return {
+            "configuration": name,
+            "settings": CONFIGURATIONS[name],
+            "workers": workers,
+            "ready_seconds": round(server.ready_seconds, 2),
+            "master": master_memory,
+            "per_worker": worker_memory,
+            "total_rss_mib": round(sum(w["rss_mib"] for w in worker_memory), 1),
+            "total_pss_mib": round(master_memory["pss_mib"] + sum(w["pss_mib"] for w in worker_memory), 1),
+        }
+
+
+def print_report(report: dict):
+    print(f"\n{report['configuration']} {report['settings']}")
+    print(f"  ready after {report['ready_seconds']} s")
+    print(f"  {'process':<10}{'RSS':>10}{'PSS':>10}{'shared':>10}{'private':>10}   (MiB)")
+    rows = [("master", report["master"])] + [(f"worker {i}", w) for i, w in enumerate(report["per_worker"])]
+    for label, m in rows:
+        print(f"  {label:<10}{m['rss_mib']:>10}{m['pss_mib']:>10}{m['shared_mib']:>10}{m['private_mib']:>10}")
+    print(f"  total PSS (master + workers): {report['total_pss_mib']} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests-per-worker", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--configurations", nargs="+", choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    reports = [measure(name, args.workers, args.requests_per_worker, args.timeout) for name in args.configurations]
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Differential parity of every scoring engine against the reference pipeline.
+
+The reference is the pandas DataFrame pipeline (preprocess_input's original
+implementation) with KNNImputer and LightGBM's predict_proba. Each engine
+(compiled transform plan with the indexed or sklearn KNN engine, flattened
+tree evaluator, and their combinations) scores:
+
+  edge cases   boundary values on BMI_BINS / AGE_BINS (and one ulp either side),
+               glucose at GLUCOSE_RISK_THRESHOLD, every missingness pattern of
+               KNN_IMPUTE_COLS, each field absent or None, unknown or oddly typed
+               categories, numbers sent as strings
+  random       synthetic records from the frontend's field ranges (fixed seed),
+               each with a few of the mutations above applied at random
+
+Every record is scored alone; a record the reference rejects must be rejected
+in the same stage. The accepted ones are then scored in batches of
+--batch-size, as records and as columns. PCA vectors and probabilities must
+match the reference within PCA_TOLERANCE / PROBABILITY_TOLERANCE. Finally the
+rows/s of each engine at batch size 1 and N are reported next to the reference's.
+
+    python benchmarks/parity_report.py --random 2000 --batch-size 256
+
+Exits with status 1 on any mismatch, listing the offending records.
+Run from the server/ directory.
+"""
+
+import argparse
+import dataclasses
+import json
+import math
+import random
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from run_benchmarks import time_calls, summarize  # noqa: E402
+from synthetic import generate_records, load_field_specs  # noqa: E402
+
+PCA_TOLERANCE = 1e-9
+PROBABILITY_TOLERANCE = 1e-9
+REFERENCE = "pandas+booster"
+# Mismatching records listed per engine in the report
+MAX_EXAMPLES = 5
+
+MISSING_VALUES = (None, float("nan"), "", "n/a")
+ODD_CATEGORIES = ("Unknown", "Martian", "", " Male", "male", 3, None)
+
+
+def _around(value: float) -> list:
+    """value and its float neighbours."""
+    return [math.nextafter(value, -math.inf), value, math.nextafter(value, math.inf)]
+
+
+def _base_record() -> dict:
+    from config import WARMUP_RECORDS
+
+    return dict(WARMUP_RECORDS[0])
+
+
+def edge_case_records() -> list:
+    """Deterministic records exercising the boundaries and fallbacks of the pipeline."""
+    from config import (
+        USER_INPUT_COLUMNS, KNN_IMPUTE_COLS, CAT_COLS, BMI_BINS, AGE_BINS, GLUCOSE_RISK_THRESHOLD,
+        STRESS_LEVEL_MAPPING, SMOKING_LEVEL_MAPPING, DIET_TYPE_MAPPING
+    )
+
+    base = _base_record()
+    records = []
+    for col, bins in (("bmi", BMI_BINS), ("age", AGE_BINS)):
+        for edge in bins:
+            if math.isfinite(edge):
+                records += [{**base, col: value} for value in _around(float(edge))]
+    records += [{**base, "glucose": value} for value in _around(float(GLUCOSE_RISK_THRESHOLD))]
+    records.append({**base, "glucose": str(GLUCOSE_RISK_THRESHOLD)})
+
+    # Every missingness pattern of the imputed columns, with each kind of missing value
+    for pattern in range(1, 1 << len(KNN_IMPUTE_COLS)):
+        for i, missing in enumerate(MISSING_VALUES):
+            record = dict(base)
+            for j, col in enumerate(KNN_IMPUTE_COLS):
+                if pattern & (1 << j):
+                    record[col] = MISSING_VALUES[(i + j) % len(MISSING_VALUES)]
+            records.append(record)
+
+    for col in USER_INPUT_COLUMNS:
+        records.append({key: value for key, value in base.items() if key != col})
+        records.append({**base, col: None})
+    for col in set(CAT_COLS) & set(USER_INPUT_COLUMNS) | {"smoking_status", "dietary_habits", "stress_level"}:
+        records += [{**base, col: value} for value in ODD_CATEGORIES]
+    records += [{**base, "smoking_status": value} for value in SMOKING_LEVEL_MAPPING]
+    records += [{**base, "dietary_habits": value} for value in DIET_TYPE_MAPPING]
+    records += [{**base, "stress_level": value} for value in list(STRESS_LEVEL_MAPPING) + [1, 2, 3]]
+    records += [
+        {**base, "age": "45", "bmi": "28.5", "income": " 65000 ", "insulin": "1.25e1"},
+        {**base, "age": "forty", "heart_rate": "82bpm"},
+        {**base, "age": True},
+        {**base, "extra_field": "ignored"},
+    ]
+    return records
+
+
+def _mutate(record: dict, rng: random.Random, specs: dict) -> dict:
+    """record with one random mutation drawn from the same families as edge_case_records."""
+    from config import KNN_IMPUTE_COLS, BMI_BINS, AGE_BINS, GLUCOSE_RISK_THRESHOLD
+
+    record = dict(record)
+    field = rng.choice(sorted(specs))
+    kind = rng.randrange(6)
+    if kind == 0:
+        record.pop(field, None)
+    elif kind == 1:
+        record[rng.choice(KNN_IMPUTE_COLS)] = rng.choice(MISSING_VALUES)
+    elif kind == 2 and specs[field]["type"] == "select":
+        record[field] = rng.choice(ODD_CATEGORIES)
+    elif kind == 3:
+        col, edges = rng.choice([("bmi", BMI_BINS[:-1]), ("age", AGE_BINS[:-1]),
+                                 ("glucose", [GLUCOSE_RISK_THRESHOLD])])
+        record[col] = rng.choice(_around(float(rng.choice(edges))))
+    elif kind == 4 and specs[field]["type"] == "number" and record.get(field) is not None:
+        record[field] = rng.choice([str(record[field]), f" {record[field]} ", f"{float(record[field]):e}"])
+    else:
+        record[field] = None
+    return record
+
+
+def random_records(n: int, seed: int = 0, max_mutations: int = 3) -> list:
+    """n synthetic records, each with up to max_mutations random mutations."""
+    specs = load_field_specs()
+    rng = random.Random(seed)
+    records = []
+    for record in generate_records(n, seed=seed, missing_rate=0.1, specs=specs):
+        for _ in range(rng.randint(0, max_mutations)):
+            record = _mutate(record, rng, specs)
+        records.append(record)
+    return records
+
+
+def engines(predictor) -> dict:
+    """Engine name -> Predictor, the reference first."""
+    from transform_plan import compile_transform_plan
+
+    def plan(knn):
+        return compile_transform_plan(
+            predictor.one_hot_encoder, predictor.ordinal_encoder, predictor.standard_scaler, knn,
+            predictor.pca_transformer, predictor.final_features_list
+        )
+
+    reference = dataclasses.replace(predictor, transform_plan=None, knn_index=None, tree_evaluator=None)
+    variants = {REFERENCE: reference, "compiled+booster": dataclasses.replace(reference, transform_plan=plan(
+        predictor.knn_imputer))}
+    if predictor.knn_index is not None:
+        variants["compiled-indexed+booster"] = dataclasses.replace(
+            reference, knn_index=predictor.knn_index, transform_plan=plan(predictor.knn_index)
+        )
+    if predictor.tree_evaluator is not None:
+        variants["pandas+flat"] = dataclasses.replace(reference, tree_evaluator=predictor.tree_evaluator)
+        if predictor.transform_plan is not None:
+            variants["served"] = predictor
+    return variants
+
+
+def _score(engine, records: list) -> tuple:
+    X = engine.preprocess_records(records)
+    return X, engine._predict_probabilities(X)
+
+
+def _score_columns(engine, records: list) -> tuple:
+    from config import USER_INPUT_COLUMNS
+
+    columns = {col: [record.get(col) for record in records] for col in USER_INPUT_COLUMNS}
+    X = engine.preprocess_columns(columns, len(records))
+    return X, engine._predict_probabilities(X)
+
+
+def _stage(fn) -> tuple:
+    """(result, None) or (None, stage of the RuntimeError)."""
+    try:
+        return fn(), None
+    except RuntimeError as e:
+        return None, str(e).split(":")[0]
+
+
+def score_reference(variants: dict, records: list) -> list:
+    """(result, None) or (None, failing stage) of the reference for each record alone."""
+    reference = variants[REFERENCE]
+    return [_stage(lambda r=record: _score(reference, [r])) for record in records]
+
+
+def check_parity(variants: dict, records: list, batch_size: int, expected: list = None) -> dict:
+    """Per engine: worst PCA / probability differences and the mismatching records."""
+    reference = variants[REFERENCE]
+    expected = expected or score_reference(variants, records)
+    accepted = [i for i, (_, stage) in enumerate(expected) if stage is None]
+    batches = [accepted[i:i + batch_size] for i in range(0, len(accepted), batch_size)]
+    batch_expected = [_score(reference, [records[i] for i in batch]) for batch in batches]
+
+    report = {}
+    for name, engine in variants.items():
+        if name == REFERENCE:
+            continue
+        worst_pca = worst_probability = 0.0
+        mismatches = []
+
+        def compare(label, record_ids, want, got):
+            nonlocal worst_pca, worst_probability
+            pca_error = np.abs(want[0] - got[0]).max(axis=1)
+            probability_error = np.abs(want[1] - got[1])
+            worst_pca = max(worst_pca, float(pca_error.max()))
+            worst_probability = max(worst_probability, float(probability_error.max()))
+            bad = (pca_error > PCA_TOLERANCE) | (probability_error > PROBABILITY_TOLERANCE)
+            for row in np.flatnonzero(bad):
+                mismatches.append({"check": label, "record": records[record_ids[row]],
+                                   "pca_error": float(pca_error[row]),
+                                   "probability_error": float(probability_error[row])})
+
+        for i, (record, (want, stage)) in enumerate(zip(records, expected)):
+            got, got_stage = _stage(lambda: _score(engine, [record]))
+            if stage != got_stage:
+                mismatches.append({"check": "batch_1 stage", "record": record,
+                                   "expected": stage, "actual": got_stage})
+            elif stage is None:
+                compare("batch_1", [i], want, got)
+        for batch, want in zip(batches, batch_expected):
+            chunk = [records[i] for i in batch]
+            compare(f"batch_{batch_size} records", batch, want, _score(engine, chunk))
+            compare(f"batch_{batch_size} columns", batch, want, _score_columns(engine, chunk))
+
+        report[name] = {
+            "records": len(records),
+            "rejected": len(records) - len(accepted),
+            "max_pca_error": worst_pca,
+            "max_probability_error": worst_probability,
+            "mismatches": len(mismatches),
+            "examples": mismatches[:MAX_EXAMPLES],
+        }
+    return report
+
+
+def measure_throughput(variants: dict, records: list, batch_size: int, min_seconds: float = 0.5) -> dict:
+    """rows/s of each engine at batch size 1 and batch_size, and the ratio to the reference's."""
+    batch = (records * (batch_size // max(1, len(records)) + 1))[:batch_size]
+    single = iter(range(1 << 62))
+
+    results = {}
+    for name, engine in variants.items():
+        one = summarize(time_calls(lambda: _score(engine, [records[next(single) % len(records)]]),
+                                   min_seconds=min_seconds))
+        many = summarize(time_calls(lambda: _score(engine, batch), min_seconds=min_seconds), batch_size)
+        results[name] = {"batch_1_rows_per_second": one["rows_per_second"],
+                         f"batch_{batch_size}_rows_per_second": many["rows_per_second"]}
+    for name, result in results.items():
+        for key in list(result):
+            base = results[REFERENCE][key]
+            result[key.replace("rows_per_second", "speedup")] = round(result[key] / base, 2) if base else None
+    return results
+
+
+def print_report(parity: dict, throughput: dict):
+    print(f"{'engine':>26} {'records':>8} {'rejected':>8} {'mismatches':>10} {'max_pca_err':>12} {'max_p_err':>10}")
+    for name, r in parity.items():
+        print(f"{name:>26} {r['records']:>8} {r['rejected']:>8} {r['mismatches']:>10} {r['max_pca_error']:>12.2e} {r['max_probability_error']:>10.2e}")
+        for example in r["examples"]:
+            print(f"{'':>28}{json.dumps(example, default=str)}")
+    print()
+    for name, r in throughput.items():
+        print(f"{name:>26} " + "  ".join(f"{key}={value}" for key, value in r.items()))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--random", type=int, default=500, help="Random records on top of the edge cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="Timing budget per engine and batch size")
+    parser.add_argument("-o", "--output", help="Write the report JSON here")
+    args = parser.parse_args(argv)
+    # The pandas pipeline's dtype-casting warnings would drown the report
+    warnings.simplefilter("ignore", FutureWarning)
+
+    from preprocessor import load_assets
+
+    variants = engines(load_assets())
+    records = edge_case_records() + random_records(args.random, seed=args.seed)
+    expected = score_reference(variants, records)
+    parity = check_parity(variants, records, args.batch_size, expected)
+    accepted = [record for record, (_, stage) in zip(records, expected) if stage is None]
+    throughput = measure_throughput(variants, accepted, args.batch_size, args.min_seconds)
+
+    print_report(parity, throughput)
+    if args.output:
+        Path(args.output).write_text(json.dumps({"parity": parity, "throughput": throughput}, indent=2,
+                                                default=str))
+    return 1 if any(r["mismatches"] for r in parity.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Reproducible performance benchmarks for the scoring pipeline.
+
+Suites:
+  stages        preprocess_input per stage (sanitize, imputation, ..., pca) at each
+                batch size, for the compiled plan and the pandas reference pipeline
+  predict       make_prediction on one row and make_batch_prediction per batch size,
+                for the flattened tree evaluator and the LightGBM booster
+  cold_start    import + load_assets() in a fresh interpreter
+  http_flask    /predict and /predict_batch through the Flask test client
+  http_gunicorn /predict against a local gunicorn (sequential and concurrent clients)
+
+Inputs are synthetic records drawn from the frontend's field ranges
+(client/src/validate_fields.js) with a fixed seed, so runs are comparable.
+
+    python benchmarks/run_benchmarks.py run -o baseline.json
+    python benchmarks/run_benchmarks.py run --suites stages predict --baseline baseline.json
+    python benchmarks/run_benchmarks.py compare baseline.json results.json --threshold 0.2
+
+Results are JSON: {"meta": {...}, "results": {"<suite>/<case>": {"<metric>": value}}}.
+Metrics ending in _ms/_seconds are lower-is-better, *_per_second higher-is-better;
+`compare` (and `run --baseline`) exits with status 1 if any of them got worse
+by more than the threshold. Run from the server/ directory.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from synthetic import generate_records  # noqa: E402
+
+SUITES = ("stages", "predict", "cold_start", "http_flask", "http_gunicorn")
+DEFAULT_BATCH_SIZES = (1, 10, 100, 10000)
+DEFAULT_THRESHOLD = 0.25
+LOWER_IS_BETTER = ("_ms", "_seconds")
+HIGHER_IS_BETTER = ("_per_second",)
+
+
+# --- Timing ---
+
+def time_calls(fn, min_repeats: int = 5, min_seconds: float = 0.5, max_repeats: int = 10000,
+               warmup: int = 1) -> list:
+    """Durations (seconds) of repeated fn() calls: at least min_repeats and min_seconds of work."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < max_repeats and (len(durations) < min_repeats
+                                            or time.perf_counter() - started < min_seconds):
+        t = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t)
+    return durations
+
+
+def summarize(durations: list, rows_per_call: int = 1) -> dict:
+    ordered = sorted(durations)
+    median = statistics.median(ordered)
+    return {
+        "calls": len(ordered),
+        "median_ms": round(median * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 4),
+        "rows_per_second": round(rows_per_call / median, 1) if median > 0 else 0.0,
+    }
+
+
+def percentile_ms(latencies: list, q: float) -> float:
+    ordered = sorted(latencies)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+
+@contextmanager
+def engine(name: str):
+    """Temporarily switches the loaded pipeline to one of its engines."""
+    import preprocessor
+
+    saved = preprocessor.current_predictor()
+    if name == "pandas":
+        switched = dataclasses.replace(saved, transform_plan=None)
+    elif name == "booster":
+        switched = dataclasses.replace(saved, tree_evaluator=None)
+    elif (name == "compiled" and saved.transform_plan is None) or (name == "flat" and saved.tree_evaluator is None):
+        raise RuntimeError(f"The '{name}' engine is not active (check PREPROCESS_MODE / MODEL_EVALUATOR)")
+    else:
+        switched = saved
+    # Swapped in directly, not through activate(), so the rollback history is left alone
+    preprocessor.ACTIVE_PREDICTOR = switched
+    try:
+        yield
+    finally:
+        preprocessor.ACTIVE_PREDICTOR = saved
+
+
+# --- Suites ---
+
+def bench_stages(batch_sizes: list, seed: int, missing_rate: float, min_seconds: float) -> dict:
+    import pandas as pd
+    from config import USER_INPUT_COLUMNS
+    from metrics import STAGE_LATENCY
+    from preprocessor import load_assets, preprocess_input
+
+    load_assets()
+    records = generate_records(max(batch_sizes), seed=seed, missing_rate=missing_rate)
+    results = {}
+    for engine_name in ("compiled", "pandas"):
+        with engine(engine_name):
+            for n in batch_sizes:
+                df = pd.DataFrame(records[:n], columns=USER_INPUT_COLUMNS)
+                # Large pandas batches take seconds per call: fewer repeats, no warm-up call
+                warmup = 0 if n >= 1000 else 1
+                STAGE_LATENCY.reset()
+                durations = time_calls(lambda: preprocess_input(df), min_seconds=min_seconds,
+                                       min_repeats=2 if n >= 1000 else 5, warmup=warmup)
+                result = summarize(durations, n)
+                for stage, (total, count) in sorted(STAGE_LATENCY.totals().items()):
+                    if count:
+                        result[f"stage_{stage}_ms"] = round(total / (len(durations) + warmup) * 1000, 4)
+                results[f"stages/{engine_name}/batch_{n}"] = result
+    return results
+
+
+def bench_predict(batch_sizes: list, seed: int, missing_rate: float, min_seconds: float) -> dict:
+    from preprocessor import load_assets, make_batch_prediction, make_prediction, preprocess_records
+
+    load_assets()
+    records = generate_records(max(batch_sizes), seed=seed, missing_rate=missing_rate)
+    X = preprocess_records(records)
+    results = {}
+    for engine_name in ("flat", "booster"):
+        with engine(engine_name):
+            single = X[:1]
+            results[f"predict/{engine_name}/make_prediction"] = summarize(
+                time_calls(lambda: make_prediction(single), min_seconds=min_seconds)
+            )
+            for n in batch_sizes:
+                batch = X[:n]
+                results[f"predict/{engine_name}/batch_{n}"] = summarize(
+                    time_calls(lambda: make_batch_prediction(batch), min_seconds=min_seconds), n
+                )
+    return results
+
+
+_COLD_START_SCRIPT = """
+import json, time
+t0 = time.perf_counter()
+import preprocessor
+t1 = time.perf_counter()
+preprocessor.load_assets()
+t2 = time.perf_counter()
+print(json.dumps({"import_seconds": t1 - t0, "load_assets_seconds": t2 - t1}))
+"""
+
+
+def bench_cold_start(repeats: int) -> dict:
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", _COLD_START_SCRIPT], cwd=SERVER_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process_seconds"] = time.perf_counter() - started
+        runs.append(timings)
+    return {"cold_start/load_assets": {
+        key: round(statistics.median(run[key] for run in runs), 4)
+        for key in ("import_seconds", "load_assets_seconds", "process_seconds")
+    } | {"runs": repeats}}
+
+
+def bench_http_flask(n_requests: int, seed: int, missing_rate: float) -> dict:
+    import startup
+    from app import app
+
+    if not startup.is_ready():
+        raise RuntimeError(f"The app failed to start: {startup.STATE.get('error')}")
+    client = app.test_client()
+    records = generate_records(n_requests, seed=seed, missing_rate=missing_rate)  # distinct: no cache hits
+    client.post("/predict", json=records[0])
+
+    results = {}
+    latencies = []
+    started = time.perf_counter()
+    for record in records:
+        t = time.perf_counter()
+        response = client.post("/predict", json=record)
+        latencies.append(time.perf_counter() - t)
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}: {response.get_data(as_text=True)}")
+    elapsed = time.perf_counter() - started
+    results["http_flask/predict"] = {
+        "requests": n_requests,
+        "requests_per_second": round(n_requests / elapsed, 1),
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p99_ms": percentile_ms(latencies, 0.99),
+    }
+
+    batch = generate_records(100, seed=seed + 1, missing_rate=missing_rate)
+    durations = time_calls(lambda: client.post("/predict_batch", json=batch), min_seconds=0.5)
+    results["http_flask/predict_batch_100"] = summarize(durations, len(batch))
+    return results
+
+
+def _run_clients(url: str, records: list, concurrency: int) -> tuple:
+    import requests
+
+    def client(chunk):
+        session = requests.Session()
+        latencies, errors = [], 0
+        for record in chunk:
+            t = time.perf_counter()
+            try:
+                ok = session.post(url, json=record, timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            latencies.append(time.perf_counter() - t)
+            errors += not ok
+        return latencies, errors
+
+    chunks = [records[i::concurrency] for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(client, chunks))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for chunk_latencies, _ in outcomes for latency in chunk_latencies]
+    return latencies, sum(errors for _, errors in outcomes), elapsed
+
+
+def bench_http_gunicorn(n_requests: int, seed: int, missing_rate: float, workers: int, threads: int,
+                        concurrency: int) -> dict:
+    from local_server import LocalServer
+
+    records = generate_records(2 * n_requests, seed=seed, missing_rate=missing_rate)
+    results = {}
+    with LocalServer(workers=workers, threads=threads) as server:
+        url = server.url + "/predict"
+        results["http_gunicorn/startup"] = {"ready_seconds": round(server.ready_seconds, 3)}
+        for name, clients, sample in (("sequential", 1, records[:n_requests]),
+                                      (f"concurrency_{concurrency}", concurrency, records[n_requests:])):
+            latencies, errors, elapsed = _run_clients(url, sample, clients)
+            results[f"http_gunicorn/{name}"] = {
+                "workers": workers, "threads": threads, "clients": clients, "requests": len(sample),
+                "errors": errors,
+                "requests_per_second": round(len(sample) / elapsed, 1),
+                "p50_ms": percentile_ms(latencies, 0.5),
+                "p99_ms": percentile_ms(latencies, 0.99),
+            }
+    return results
+
+
+# --- Results ---
+
+def collect_meta(args) -> dict:
+    import config
+
+    versions = {"python": platform.python_version()}
+    for package in ("numpy", "pandas", "scikit-learn", "lightgbm", "scipy", "flask", "gunicorn"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+        "config": {key: getattr(config, key) for key in (
+            "PREPROCESS_MODE", "KNN_ENGINE", "MODEL_EVALUATOR", "ASSET_MMAP_MODE", "METRICS_ENABLED",
+            "PREDICTION_CACHE_ENABLED", "MICROBATCH_ENABLED",
+        )},
+        "arguments": {key: value for key, value in vars(args).items() if key not in ("func",)},
+    }
+
+
+def _direction(metric: str) -> int:
+    """-1 if lower is better, +1 if higher is better, 0 if not a performance metric."""
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Every performance metric present in both result sets, with its relative
+    change; entries worse than `threshold` (e.g. 0.25 = 25%) are marked as regressions.
+    """
+    rows = []
+    for case, metrics in sorted(current.get("results", {}).items()):
+        base_metrics = baseline.get("results", {}).get(case)
+        if base_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            direction = _direction(metric)
+            base = base_metrics.get(metric)
+            if direction == 0 or not isinstance(base, (int, float)) or not isinstance(value, (int, float)) or base <= 0:
+                continue
+            change = (value - base) / base
+            rows.append({
+                "case": case, "metric": metric, "baseline": base, "current": value,
+                "change": round(change, 4),
+                "regression": change * direction < -threshold,
+            })
+    return rows
+
+
+def print_results(report: dict):
+    for case, metrics in report["results"].items():
+        values = ", ".join(f"{key}={value}" for key, value in metrics.items())
+        print(f"{case:<40} {values}")
+
+
+def print_comparison(rows: list, threshold: float) -> int:
+    regressions = [row for row in rows if row["regression"]]
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['case']:<40} {row['metric']:<26} {row['baseline']:>12} -> {row['current']:>12} "
+              f"({row['change']:+.1%}) {flag}")
+    print(f"\n{len(rows)} metrics compared, {len(regressions)} regressed by more than {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+# --- CLI ---
+
+def run(args) -> int:
+    batch_sizes = sorted(set(args.batch_sizes))
+    results = {}
+    for suite in args.suites:
+        print(f"Running {suite}...", file=sys.stderr)
+        if suite == "stages":
+            results.update(bench_stages(batch_sizes, args.seed, args.missing_rate, args.min_seconds))
+        elif suite == "predict":
+            results.update(bench_predict(batch_sizes, args.seed, args.missing_rate, args.min_seconds))
+        elif suite == "cold_start":
+            results.update(bench_cold_start(args.cold_start_repeats))
+        elif suite == "http_flask":
+            results.update(bench_http_flask(args.requests, args.seed, args.missing_rate))
+        elif suite == "http_gunicorn":
+            results.update(bench_http_gunicorn(args.requests, args.seed, args.missing_rate, args.workers,
+                                               args.threads, args.concurrency))
+
+    report = {"meta": collect_meta(args), "results": results}
+    print_results(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline}:")
+        return print_comparison(compare_results(baseline, report, args.threshold), args.threshold)
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return print_comparison(compare_results(baseline, current, args.threshold), args.threshold)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmark suites")
+    run_parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    run_parser.add_argument("--batch-sizes", nargs="+", type=int, default=list(DEFAULT_BATCH_SIZES))
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--missing-rate", type=float, default=0.1,
+                            help="Probability of each KNN-imputed field being empty (default 0.1)")
+    run_parser.add_argument("--min-seconds", type=float, default=1.0, help="Minimum timed work per case")
+    run_parser.add_argument("--cold-start-repeats", type=int, default=3)
+    run_parser.add_argument("--requests", type=int, default=500, help="Requests per HTTP case")
+    run_parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    run_parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Concurrent HTTP clients")
+    run_parser.add_argument("-o", "--output", help="Write the results JSON here")
+    run_parser.add_argument("--baseline", help="Compare with this results JSON")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Relative change that counts as a regression (default 0.25)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    # The pandas reference pipeline emits dtype FutureWarnings on every call
+    warnings.simplefilter("ignore", FutureWarning)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Synthetic input records for benchmarks and load tests.
+
+The field ranges and options are read from the frontend's field definitions
+(client/src/validate_fields.js), so generated records look like what the form
+can actually submit and stay in sync with it.
+"""
+
+import random
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+FIELD_DEFINITIONS_PATH = SERVER_DIR.parent / "client" / "src" / "validate_fields.js"
+
+
+def load_field_specs(path=FIELD_DEFINITIONS_PATH) -> dict:
+    """
+    Field id -> {"type": "number", "min", "max", "step"} or {"type": "select", "options"},
+    parsed from the FIELD_DEFINITIONS object of validate_fields.js.
+    """
+    from request_schema import parse_field_definitions
+
+    try:
+        source = Path(path).read_text()
+    except OSError as e:
+        raise RuntimeError(f"Cannot read the frontend field definitions at {path}: {e}")
+    return parse_field_definitions(source, path)
+
+
+def _random_value(spec: dict, rng: random.Random):
+    if spec["type"] == "select":
+        return rng.choice(spec["options"])
+    steps = int(round((spec["max"] - spec["min"]) / spec["step"]))
+    value = spec["min"] + rng.randint(0, steps) * spec["step"]
+    # Integer steps give ints, as the frontend's number inputs send them
+    return int(round(value)) if float(spec["step"]).is_integer() else round(value, 4)
+
+
+def generate_records(n: int, seed: int = 0, missing_rate: float = 0.0, specs: dict = None,
+                     optional_fields: tuple = None) -> list:
+    """
+    `n` random input dicts with every field of the frontend form. With
+    `missing_rate` > 0, each of `optional_fields` (default: the KNN-imputed
+    columns) is left empty (None) with that probability.
+    """
+    from config import KNN_IMPUTE_COLS
+
+    specs = specs or load_field_specs()
+    optional_fields = KNN_IMPUTE_COLS if optional_fields is None else optional_fields
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n):
+        record = {field: _random_value(spec, rng) for field, spec in specs.items()}
+        if missing_rate > 0:
+            for field in optional_fields:
+                if rng.random() < missing_rate:
+                    record[field] = None
+        records.append(record)
+    return records
+
+
+def add_sample_arguments(parser, missing_rate: float = 0.1):
+    """The --rows/--seed/--missing-rate/-o options of the offline validation reports."""
+    parser.add_argument("--rows", type=int, default=2000, help="Validation sample size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--missing-rate", type=float, default=missing_rate,
+                        help=f"Probability of each KNN-imputed field being empty (default {missing_rate})")
+    parser.add_argument("-o", "--output", help="Write the report JSON here")
+
+
+def sample_records(args) -> list:
+    """The validation sample described by the options of add_sample_arguments."""
+    return generate_records(args.rows, seed=args.seed, missing_rate=args.missing_rate)
@@ -0,0 +1,166 @@
+# columnar.py
+#
+# Column-oriented request/response bodies for /predict_batch, as an alternative to
+# a JSON array of records. Decoded columns go to Predictor.score_columns without
+# building a dict per row. pyarrow and msgpack are optional: a request in a
+# format whose library is not installed gets 415 Unsupported Media Type.
+
+import numpy as np
+
+from config import USER_INPUT_COLUMNS
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+
+MEDIA_TYPES = {
+    ARROW_STREAM: "arrow",
+    MSGPACK: "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+CONTENT_TYPES = {"arrow": ARROW_STREAM, "msgpack": MSGPACK}
+LIBRARIES = {"arrow": "pyarrow", "msgpack": "msgpack"}
+
+RESULT_COLUMNS = ["index", "status", "prediction_label", "probability_of_disease", "error", "errors"]
+
+
+def media_kind(mimetype):
+    """"arrow" or "msgpack" for a columnar Content-Type, None for anything else (e.g. JSON)."""
+    return MEDIA_TYPES.get((mimetype or "").lower())
+
+
+def available(kind: str) -> bool:
+    """True if the library for `kind` can be imported."""
+    try:
+        _library(kind)
+    except RuntimeError:
+        return False
+    return True
+
+
+def _library(kind: str):
+    try:
+        if kind == "arrow":
+            import pyarrow
+            import pyarrow.ipc  # noqa: F401
+            return pyarrow
+        import msgpack
+        return msgpack
+    except ImportError:
+        raise RuntimeError(f"{CONTENT_TYPES[kind]} requires {LIBRARIES[kind]} (pip install {LIBRARIES[kind]})")
+
+
+# --- Requests ---
+
+def decode(kind: str, body: bytes) -> tuple:
+    """
+    Decodes a request body into (columns, n_rows), columns mapping each name to
+    n_rows values. Raises ValueError for a malformed body, with a message fit
+    for a 400 response.
+    """
+    columns, n_rows = decode_arrow(body) if kind == "arrow" else decode_msgpack(body)
+    missing = [col for col in USER_INPUT_COLUMNS if col not in columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return columns, n_rows
+
+
+def decode_arrow(body: bytes) -> tuple:
+    """
+    Reads an Arrow IPC stream (one or more record batches, one schema). Numeric
+    columns come back as float64/int64 arrays (nulls as NaN), strings as object
+    arrays (nulls as None); dictionary-encoded columns are decoded first.
+    """
+    pa = _library("arrow")
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    except (pa.ArrowInvalid, OSError) as e:
+        raise ValueError(f"Invalid Arrow IPC stream: {e}")
+
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        columns[name] = column.to_numpy(zero_copy_only=False)
+    return columns, table.num_rows
+
+
+def decode_msgpack(body: bytes) -> tuple:
+    """
+    Reads {"columns": {name: values}} from a MessagePack body. values is either an
+    array (numbers, strings, nil) or binary data holding little-endian float64s.
+    """
+    msgpack = _library("msgpack")
+    try:
+        payload = msgpack.unpackb(body, raw=False, strict_map_key=False)
+    except Exception as e:
+        raise ValueError(f"Invalid MessagePack body: {e}")
+
+    raw = payload.get("columns") if isinstance(payload, dict) else None
+    if not isinstance(raw, dict):
+        raise ValueError("Expected a MessagePack map with a 'columns' map")
+
+    columns, lengths = {}, set()
+    for name, values in raw.items():
+        if isinstance(values, bytes):
+            if len(values) % 8:
+                raise ValueError(f"Column '{name}': binary data is not a whole number of float64 values")
+            values = np.frombuffer(values, dtype="<f8")
+        elif not isinstance(values, list):
+            raise ValueError(f"Column '{name}' must be an array or float64 binary data")
+        columns[str(name)] = values
+        lengths.add(len(values))
+    if len(lengths) > 1:
+        raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+    return columns, lengths.pop() if lengths else 0
+
+
+# --- Responses ---
+
+def result_columns(results: list) -> dict:
+    """Transposes /predict_batch result dicts into RESULT_COLUMNS (None where a row has no value)."""
+    return {col: [result.get(col) for result in results] for col in RESULT_COLUMNS}
+
+
+def encode(kind: str, results: list, model_version: str) -> bytes:
+    """Encodes /predict_batch results in the request's format, one column per RESULT_COLUMNS entry."""
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    columns = result_columns(results)
+    if kind == "arrow":
+        return encode_arrow(columns, {"model_version": model_version, "count": len(results),
+                                      "succeeded": succeeded})
+    return _library("msgpack").packb({
+        "status": "success",
+        "count": len(results),
+        "succeeded": succeeded,
+        "model_version": model_version,
+        "columns": columns,
+    })
+
+
+def encode_arrow(columns: dict, metadata: dict) -> bytes:
+    """One-batch Arrow IPC stream; the summary fields go into the schema metadata."""
+    pa = _library("arrow")
+    table = pa.table({
+        "index": pa.array(columns["index"], type=pa.int64()),
+        "status": pa.array(columns["status"], type=pa.string()),
+        "prediction_label": pa.array(columns["prediction_label"], type=pa.string()),
+        "probability_of_disease": pa.array(columns["probability_of_disease"], type=pa.float64()),
+        "error": pa.array(columns["error"], type=pa.string()),
+        "errors": pa.array(columns["errors"], type=_arrow_field_errors_type(pa)),
+    }).replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _arrow_field_errors_type(pa):
+    """Arrow type of the "errors" column: the field errors of request_schema, one list per row."""
+    return pa.list_(pa.struct([
+        ("field", pa.string()),
+        ("code", pa.string()),
+        ("message", pa.string()),
+        ("min", pa.float64()),
+        ("max", pa.float64()),
+        ("allowed", pa.list_(pa.string())),
+    ]))
@@ -1,9 +1,11 @@
 # config.py
 
+import os
 from pathlib import Path
 
 # --- Model & Preprocessor File Paths ---
-MODELS_DIR = Path("models")
+# Directory of the model bundle loaded at startup (every file below lives in it)
+MODELS_DIR = Path(os.environ.get("MODELS_DIR", "models"))
 FINAL_MODEL_PATH = MODELS_DIR/'final_diseased_prediction_model_lgbm_tuned.joblib'
 STANDARD_SCALER_PATH = MODELS_DIR/'standard_scaler.joblib'
 ORDINAL_ENCODER_PATH = MODELS_DIR/'ordinal_encoder.joblib'
@@ -11,6 +13,8 @@ ONE_HOT_ENCODER_PATH = MODELS_DIR/'one_hot_encoder.joblib'
 KNN_IMPUTER_PATH = MODELS_DIR/'knn_imputer.joblib'
 PCA_TRANSFORMER_PATH = MODELS_DIR/'pca_90_variance.joblib'
 FINAL_FEATURES_LIST_PATH = MODELS_DIR/'final_features_list.json'
+# Single-file bundle of all of the above (python model_bundle.py convert)
+MODEL_BUNDLE_PATH = MODELS_DIR/'model.bundle'
 
 # --- User Input & Feature Lists ---
 
@@ -69,4 +73,204 @@ BMI_LABELS = ['Underweight', 'Normal', 'Overweight', 'Obese']
 AGE_BINS = [18, 26, 41, 61, float('inf')]
 AGE_LABELS = ['Young', 'Adult', 'Middle-aged', 'Senior']
 HOMA_IR_DIVISOR = 405.0
-GLUCOSE_RISK_THRESHOLD = 125
\ No newline at end of file
+GLUCOSE_RISK_THRESHOLD = 125
+
+# --- Input Mapping Parameters ---
+# Maps user-facing inputs onto the features the model was trained on.
+STRESS_LEVEL_MAPPING = {'Low': 1, 'Medium': 2, 'High': 3}
+STRESS_LEVEL_DEFAULT = 2  # Medium
+
+SMOKING_LEVEL_MAPPING = {
+    'Never': 'Non-smoker',
+    'Former Smoker': 'Non-smoker',
+    'Current Smoker': 'Light',
+    'Heavy Smoker': 'Heavy'
+}
+SMOKING_LEVEL_DEFAULT = 'Non-smoker'
+
+DIET_TYPE_MAPPING = {
+    'Balanced': 'Omnivore',
+    'Vegetarian': 'Vegetarian',
+    'Vegan': 'Vegan',
+    'Keto': 'Keto',
+    'High Protein': 'Omnivore',
+    'Low Carb': 'Keto'
+}
+DIET_TYPE_DEFAULT = 'Omnivore'
+
+# Training features that are not collected from the user, with the value assumed for them
+CATEGORICAL_DEFAULTS = {
+    'sleep_quality': 'Good',
+    'occupation': 'Engineer',
+    'device_usage': 'Moderate',
+    'healthcare_access': 'Moderate',
+    'insurance': 'Yes',
+    'sunlight_exposure': 'Moderate',
+    'family_history': 'No',
+    'pet_owner': 'No'
+}
+
+# Preferred replacement values for categories the one-hot encoder has never seen
+CATEGORY_FALLBACK_CANDIDATES = ["Unknown", "Other", "Undefined", "missing"]
+
+# --- Asset Loading ---
+
+# mmap_mode passed to joblib.load for the artifacts ("r" = read-only memory maps).
+# Set to "none" to deserialize everything into private process memory. A mapped file
+# must never be overwritten in place while it is loaded (the live model would change
+# under the workers, or they would crash with SIGBUS), only replaced by a rename; so
+# with MODEL_RELOAD_POLL_SECONDS on, mapping is off unless ASSET_MMAP_MODE asks for it.
+ASSET_MMAP_MODE = os.environ.get(
+    "ASSET_MMAP_MODE", "none" if float(os.environ.get("MODEL_RELOAD_POLL_SECONDS", "0")) > 0 else "r")
+ASSET_MMAP_MODE = None if ASSET_MMAP_MODE.lower() in ("", "none", "off") else ASSET_MMAP_MODE
+
+# Which artifacts load_assets() reads: "auto" (the bundle when MODEL_BUNDLE_PATH exists and
+# no .joblib file next to it is newer, else the .joblib files), "bundle" (fail without it) or "joblib"
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "auto")
+
+# --- Model Reload ---
+
+# Replaced bundles kept loaded (and in memory) so POST /model/rollback can switch back
+MODEL_HISTORY_SIZE = int(os.environ.get("MODEL_HISTORY_SIZE", "1"))
+# Seconds between checks of MODELS_DIR for new files; each worker reloads on its own
+# when they change (0 = off). The way to roll a new bundle out to every gunicorn worker.
+MODEL_RELOAD_POLL_SECONDS = float(os.environ.get("MODEL_RELOAD_POLL_SECONDS", "0"))
+# Bearer token for POST /model/reload and /model/rollback; unset keeps both disabled
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# --- Startup ---
+
+# "eager": load and warm up the model while the app is imported (default).
+# "background": import returns immediately and loading runs in a background thread;
+# /ready fails until it is done. Not combined with gunicorn preload (threads do not survive fork).
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager")
+
+# Synthetic records scored once after loading, so one-time costs (first calls into
+# the encoders, KNN index, evaluator, thread pools) are not paid by the first request.
+WARMUP_RECORDS = [
+    {
+        "gender": "Male", "age": 45, "blood_pressure": 135, "heart_rate": 82, "glucose": 110,
+        "insulin": 12.5, "cholesterol": 210.5, "bmi": 28.5, "physical_activity": 5, "waist_size": 95.0,
+        "calorie_intake": 2200, "mental_health_score": 78, "sugar_intake": 55.0,
+        "smoking_status": "Former Smoker", "alcohol_consumption": "Moderate", "stress_level": "Medium",
+        "income": 65000.0, "marital_status": "Married", "exercise_type": "Cardio",
+        "dietary_habits": "Balanced", "caffeine_intake": "2 cups daily", "water_intake": 2.5, "work_hours": 45
+    },
+    {
+        "gender": "Female", "age": 67, "blood_pressure": None, "heart_rate": 74, "glucose": 160,
+        "insulin": None, "cholesterol": 245.0, "bmi": 31.2, "physical_activity": 1, "waist_size": 104.0,
+        "calorie_intake": 2600, "mental_health_score": 55, "sugar_intake": 90.0,
+        "smoking_status": "Heavy Smoker", "alcohol_consumption": "High", "stress_level": "High",
+        "income": None, "marital_status": "Widowed", "exercise_type": "None",
+        "dietary_habits": "High Sugar", "caffeine_intake": "None", "water_intake": 1.2, "work_hours": 20
+    },
+]
+
+# --- Preprocessing Engine ---
+
+# "compiled": NumPy transform plan compiled from the fitted artifacts at load time (fast path).
+# "pandas": the original DataFrame pipeline, kept as the reference implementation.
+PREPROCESS_MODE = os.environ.get("PREPROCESS_MODE", "compiled")
+
+# KNN imputation engine used by the compiled path.
+# "indexed": KD-trees per missingness pattern built from the imputer's fit data; complete rows skip imputation.
+# "sklearn": KNNImputer.transform (brute force over the whole training matrix).
+# "compact": CompactKNNImputer, a float32 reference set that replaces KNNImputer on both
+#            pipelines; approximate, see benchmarks/knn_compact_report.py.
+KNN_ENGINE = os.environ.get("KNN_ENGINE", "indexed")
+# Reference rows kept by the compact engine: 0 keeps every training row (float32 only),
+# N keeps N prototypes picked from the complete training rows by KNN_COMPACT_METHOD
+# ("random" sample, or "kmeans": the row closest to each cluster centre, slow to build for large N).
+KNN_COMPACT_SIZE = int(os.environ.get("KNN_COMPACT_SIZE", "0"))
+KNN_COMPACT_METHOD = os.environ.get("KNN_COMPACT_METHOD", "random")
+
+# Engine used to evaluate the LightGBM model.
+# "flat": the booster's trees flattened into NumPy arrays at load time (checked against LightGBM on startup).
+# "booster": LGBMClassifier.predict_proba.
+MODEL_EVALUATOR = os.environ.get("MODEL_EVALUATOR", "flat")
+
+# Opt-in early exit for /predict, /predict_batch and /predict_sweep (e.g. triage traffic): trees stop being added once the
+# partial margin m has 2 * |m| > EARLY_EXIT_MARGIN, checked every EARLY_EXIT_FREQ trees
+# (LightGBM's pred_early_stop_margin / pred_early_stop_freq). 0 evaluates every tree.
+# benchmarks/early_exit_report.py measures the agreement with full evaluation.
+EARLY_EXIT_MARGIN = float(os.environ.get("EARLY_EXIT_MARGIN", "0"))
+EARLY_EXIT_FREQ = int(os.environ.get("EARLY_EXIT_FREQ", "10"))
+
+# Attributions behind /predict?explain=1, per PCA component before they are mapped back
+# onto the features and input fields: "path" (walks the flattened trees, about twice
+# the cost of predicting) or "tree_shap" (LightGBM's pred_contrib, exact SHAP values,
+# tens of times the cost of predicting). Without the flat evaluator it is always "tree_shap".
+EXPLAIN_METHOD = os.environ.get("EXPLAIN_METHOD", "path")
+
+# --- Thread Planning ---
+
+# At startup, size the BLAS/OpenMP thread pools and LightGBM's num_threads from the
+# CPUs actually available (affinity and cgroup quota) and the server concurrency
+# (gunicorn workers x threads), so that concurrent requests do not oversubscribe the cores.
+THREAD_PLAN_ENABLED = os.environ.get("THREAD_PLAN_ENABLED", "1").lower() in ("1", "true", "yes")
+# CPUs to plan for; empty means detect them
+THREAD_PLAN_CPUS = os.environ.get("THREAD_PLAN_CPUS", "")
+# Calls scoring fewer rows than this run LightGBM on a single thread
+THREAD_PLAN_BATCH_ROWS = int(os.environ.get("THREAD_PLAN_BATCH_ROWS", "512"))
+
+# --- Micro-batching ---
+
+# When enabled, concurrent /predict calls within a worker are collected into one
+# batched preprocess-and-predict pass (see batcher.py).
+MICROBATCH_ENABLED = os.environ.get("MICROBATCH_ENABLED", "0").lower() in ("1", "true", "yes")
+# A batch is closed at this many records...
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", "32"))
+# ...or this many microseconds after its first record arrived.
+MICROBATCH_MAX_WAIT_US = int(os.environ.get("MICROBATCH_MAX_WAIT_US", "2000"))
+# A caller gives up on its result after this many seconds (its request fails instead of hanging)
+MICROBATCH_TIMEOUT_SECONDS = float(os.environ.get("MICROBATCH_TIMEOUT_SECONDS", "30"))
+
+# --- Async Serving ---
+
+# "asgi": gunicorn.conf.py runs uvicorn workers for asgi.py (start gunicorn with asgi:app), which read
+# and answer requests on an event loop and run the route handlers on a thread pool. "wsgi": sync workers.
+SERVER_INTERFACE = os.environ.get("SERVER_INTERFACE", "wsgi")
+# Handler threads per worker for /predict, /predict_batch and /predict_sweep
+ASYNC_WORKER_THREADS = int(os.environ.get("ASYNC_WORKER_THREADS", "4"))
+# Scoring requests that may wait for a free handler thread; beyond that they get 503 at once
+ASYNC_QUEUE_LIMIT = int(os.environ.get("ASYNC_QUEUE_LIMIT", "16"))
+# Retry-After (seconds) sent with those 503s
+ASYNC_RETRY_AFTER_SECONDS = int(os.environ.get("ASYNC_RETRY_AFTER_SECONDS", "1"))
+# Largest request body read from a client; larger ones get 413
+ASYNC_MAX_BODY_BYTES = int(os.environ.get("ASYNC_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+
+# --- Metrics ---
+
+# Per-stage timers and batch-size histograms served on /metrics. When off, the
+# timers are skipped entirely (error counters and process metrics remain).
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# --- Prediction Cache ---
+
+# Caches /predict results keyed on the canonicalized input record.
+PREDICTION_CACHE_ENABLED = os.environ.get("PREDICTION_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+# "local": in-process LRU per worker. "shared": SQLite database shared by all workers on the host.
+PREDICTION_CACHE_BACKEND = os.environ.get("PREDICTION_CACHE_BACKEND", "local")
+PREDICTION_CACHE_MAX_SIZE = int(os.environ.get("PREDICTION_CACHE_MAX_SIZE", "10000"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get("PREDICTION_CACHE_TTL_SECONDS", "300"))
+# Location of the shared backend; /dev/shm keeps it in memory
+PREDICTION_CACHE_SHARED_PATH = os.environ.get(
+    "PREDICTION_CACHE_SHARED_PATH", "/dev/shm/disease_risk_prediction_cache.sqlite3"
+)
+
+# --- API Settings ---
+
+# Upper bound on the number of records accepted by a single /predict_batch call.
+MAX_BATCH_SIZE = 10000
+
+# Input record validation (request_schema.py), against the frontend form's fields
+# (field_specs.json, a snapshot of client/src/validate_fields.js):
+# "ranges": numbers must parse and lie in the form's min/max; categories must be strings
+#           (unknown ones still fall back to the encoder's "Unknown"-style category).
+# "strict": also rejects categories the form does not offer.
+# "off": only checks that every USER_INPUT_COLUMNS field is present.
+REQUEST_VALIDATION = os.environ.get("REQUEST_VALIDATION", "ranges")
+FIELD_SPECS_PATH = Path(__file__).resolve().parent/'field_specs.json'
+
+# JSON library for request bodies and responses: "orjson" (used when installed) or "json" (the stdlib).
+JSON_LIBRARY = os.environ.get("JSON_LIBRARY", "orjson")
@@ -0,0 +1,123 @@
+# explain.py
+#
+# Explanations for /predict?explain=1: the model's contributions per PCA component
+# (path attributions from the flattened trees, or LightGBM's TreeSHAP values from
+# pred_contrib) mapped back through the PCA loadings onto the FINAL_FEATURES_LIST
+# features, and from there onto the user's input fields.
+
+import numpy as np
+
+from config import USER_INPUT_COLUMNS, NUM_COLS, CAT_COLS, CAT_ORDINAL_COLS, CATEGORICAL_DEFAULTS
+from transform_plan import DERIVED_CAT_COLS, ORDINAL_BINNING
+
+# Model features computed from differently named inputs; a feature with several
+# sources credits them equally
+ENGINEERED_SOURCES = {
+    'HOMA_IR': ('glucose', 'insulin'),
+    'caffeine_missing_flag': ('caffeine_intake',),
+    'diabetes_risk_flag': ('glucose',),
+    **{col: (source,) for col, (source, _, _) in DERIVED_CAT_COLS.items()},
+    **{col: (source,) for col, (source, _, _) in ORDINAL_BINNING.items()},
+}
+
+# The training-only categoricals (CATEGORICAL_DEFAULTS) take the same value in every
+# request; their share of the margin is reported under this field
+DEFAULTS_FIELD = "training_defaults"
+
+# A component score this small relative to the sum of its terms is not split by ratio
+RATIO_TOLERANCE = 1e-6
+
+
+class Explainer:
+    """
+    Splits per-component contributions over the features and input fields.
+
+    A component's score is z_k = sum_f (x_f - mean_f) * W_kf over the scaled
+    features x, so its contribution phi_k is shared out in proportion to those
+    terms:
+
+        attribution_f = sum_k phi_k * (x_f - mean_f) * W_kf / z_k
+
+    which keeps the feature attributions summing to the same margin. Components
+    scored too close to zero for the ratio are split by their squared loadings.
+    All of it is two matrix products over the batch.
+    """
+
+    def __init__(self, pca_transformer, final_features_list):
+        if getattr(pca_transformer, "whiten", False):
+            raise ValueError("Whitened PCA is not supported")
+        self.feature_names = list(final_features_list)
+        self.components = np.asarray(pca_transformer.components_, dtype=np.float64)
+        self.mean = np.asarray(pca_transformer.mean_, dtype=np.float64)
+        if self.components.shape[1] != len(self.feature_names):
+            raise ValueError("PCA input width does not match FINAL_FEATURES_LIST")
+        self.n_components = self.components.shape[0]
+        self.abs_components_t = np.ascontiguousarray(np.abs(self.components).T)
+        squared = self.components ** 2
+        self.loading_shares = squared / squared.sum(axis=1, keepdims=True)
+        self.field_names, self.field_matrix = _field_matrix(self.feature_names)
+
+    def feature_attributions(self, X_features: np.ndarray, contributions: np.ndarray) -> np.ndarray:
+        """
+        (rows, features) attributions from the scaled FINAL_FEATURES_LIST matrix and
+        the (rows, components + 1) contributions laid out like pred_contrib.
+        """
+        phi = contributions[:, :self.n_components]
+        centered = X_features - self.mean
+        scores = centered @ self.components.T
+        stable = np.abs(scores) > RATIO_TOLERANCE * (np.abs(centered) @ self.abs_components_t)
+        ratios = np.divide(phi, scores, out=np.zeros_like(phi), where=stable)
+        attributions = centered * (ratios @ self.components)
+        attributions += np.where(stable, 0.0, phi) @ self.loading_shares
+        return attributions
+
+    def explain(self, X_features: np.ndarray, contributions: np.ndarray, method: str) -> list:
+        """One explanation dict per row, in raw score (log-odds) units."""
+        features = self.feature_attributions(X_features, contributions)
+        fields = np.round(features @ self.field_matrix, 6).tolist()
+        features = np.round(features, 6).tolist()
+        base_values = contributions[:, -1].round(6).tolist()
+        return [
+            {
+                "method": method,
+                "base_value": base_values[i],
+                "fields": dict(zip(self.field_names, fields[i])),
+                "features": dict(zip(self.feature_names, features[i])),
+            }
+            for i in range(len(features))
+        ]
+
+
+def _feature_column(name: str) -> str:
+    """The NUM_COLS / CAT_ORDINAL_COLS / CAT_COLS column a FINAL_FEATURES_LIST entry comes from."""
+    if name in NUM_COLS or name in CAT_ORDINAL_COLS:
+        return name
+    # One-hot columns are "<column>_<category>"; take the longest matching column
+    matches = [col for col in CAT_COLS if name.startswith(col + "_")]
+    if not matches:
+        raise ValueError(f"Cannot trace feature '{name}' back to an input column")
+    return max(matches, key=len)
+
+
+def _field_matrix(feature_names: list) -> tuple:
+    """(field names, (features, fields) matrix) crediting every feature to the input fields it is built from."""
+    field_names = USER_INPUT_COLUMNS + [DEFAULTS_FIELD]
+    matrix = np.zeros((len(feature_names), len(field_names)), dtype=np.float64)
+    for i, name in enumerate(feature_names):
+        col = _feature_column(name)
+        if col in USER_INPUT_COLUMNS:
+            sources = (col,)
+        elif col in ENGINEERED_SOURCES:
+            sources = ENGINEERED_SOURCES[col]
+        elif col in CATEGORICAL_DEFAULTS:
+            sources = (DEFAULTS_FIELD,)
+        else:
+            raise ValueError(f"Cannot trace feature '{name}' back to an input field")
+        for source in sources:
+            matrix[i, field_names.index(source)] = 1.0 / len(sources)
+    return field_names, matrix
+
+
+def compile_explainer(pca_transformer, final_features_list) -> Explainer:
+    """Builds the Explainer of a fitted PCA and feature list."""
+    return Explainer(pca_transformer, final_features_list)
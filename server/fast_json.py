@@ -0,0 +1,51 @@
+# fast_json.py
+#
+# orjson behind Flask's JSON provider, so request.get_json() and jsonify() parse and
+# serialize in C. orjson is optional: without it (or with JSON_LIBRARY=json) Flask's
+# default provider is left in place.
+
+from flask.json.provider import DefaultJSONProvider
+
+from config import JSON_LIBRARY
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask's default JSON provider with orjson doing the work. Output keeps the
+    default provider's key sorting and debug-mode indentation; it differs in
+    writing non-ASCII characters as UTF-8 instead of \\u escapes and NaN as null.
+    Types orjson does not know fall back to the default provider's conversions.
+    """
+
+    def _options(self, pretty: bool = False) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(pretty))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def install(app, library: str = JSON_LIBRARY) -> str:
+    """Puts the JSON provider for `library` on the app; returns the library actually used."""
+    if library == "orjson" and orjson is not None:
+        app.json = OrjsonProvider(app)
+        return "orjson"
+    return "json"
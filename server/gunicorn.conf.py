@@ -0,0 +1,64 @@
+# gunicorn.conf.py
+#
+# Picked up automatically when gunicorn is started from this directory
+# (or explicitly with `--config gunicorn.conf.py`).
+
+import gc
+import os
+import sys
+
+# The server modules use flat imports; make them importable from the config too
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import startup  # noqa: E402
+import thread_plan  # noqa: E402
+from config import SERVER_INTERFACE, ASYNC_WORKER_THREADS  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+if SERVER_INTERFACE == "asgi":
+    # Event-loop workers for asgi.py (start with asgi:app); handlers run on its thread pool
+    worker_class = "uvicorn.workers.UvicornWorker"
+    threads = ASYNC_WORKER_THREADS
+# Thread pools are sized for this many concurrent requests (see thread_plan.py)
+thread_plan.SERVER.update(workers=workers, threads=threads)
+# Before the app (and NumPy/LightGBM) is imported, so every pool and thread starts at the planned size
+thread_plan.export_environment()
+
+# Import the app (and run load_assets()) once in the master. Forked workers then
+# share the loaded model, encoders and KNN index copy-on-write instead of each
+# deserializing its own copy. GUNICORN_PRELOAD=0 restores per-worker loading.
+# Background startup loads in a thread, which would not survive the fork, so it
+# always loads per worker.
+preload_app = (
+    os.environ.get("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+    and os.environ.get("STARTUP_MODE", "eager") != "background"
+)
+startup.FORK_PENDING = preload_app
+
+
+def when_ready(server):
+    # Move everything allocated so far out of the garbage collector's reach, so that
+    # collections in the workers do not write to (and un-share) the preloaded objects
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # The master warmed up single-threaded; size and spin up this worker's own
+    # thread pools before it accepts requests
+    startup.FORK_PENDING = False
+    plan = thread_plan.apply_plan()
+    if plan is not None:
+        worker.log.info(f"Thread plan: {plan['blas_threads']} BLAS/OpenMP thread(s), LightGBM "
+                        f"{plan['lightgbm_single_row_threads']}/{plan['lightgbm_batch_threads']} "
+                        f"(single row/batch) on {plan['cpus']:g} CPUs ({plan['cpu_source']})")
+    if startup.is_ready():
+        try:
+            startup.warm_up()
+        except Exception as e:
+            worker.log.warning(f"Worker warm-up failed: {e}")
+    if preload_app:
+        # Not started in the master (app.py), where the thread would not survive the fork
+        import model_reload
+        model_reload.watch()
@@ -0,0 +1,128 @@
+# knn_compact.py
+
+import numpy as np
+
+# Prototype selection for CompactKNNImputer:
+# "random": a uniform sample of the complete training rows
+# "kmeans": the complete training row closest to each MiniBatchKMeans centre
+PROTOTYPE_METHODS = ("random", "kmeans")
+
+# Query rows x reference rows per block of distance computations
+BLOCK_ELEMENTS = 1 << 21
+
+
+class CompactKNNImputer:
+    """
+    Stand-in for a fitted `KNNImputer.transform` (uniform weights, nan_euclidean
+    metric) that keeps a smaller reference set: the training rows as float32,
+    or, with `size`, only that many prototype rows picked from the complete
+    training rows (see PROTOTYPE_METHODS).
+
+    Imputations are approximate: float32 distances can order near-tied donors
+    differently, and prototypes change the neighbourhoods themselves.
+    benchmarks/knn_compact_report.py measures the cost against the full imputer.
+    Rows without missing values are returned untouched.
+    """
+
+    def __init__(self, knn_imputer, size: int = None, method: str = "random", seed: int = 0):
+        if getattr(knn_imputer, "metric", None) != "nan_euclidean" or knn_imputer.weights != "uniform":
+            raise ValueError("Only KNNImputer(metric='nan_euclidean', weights='uniform') can be compacted")
+        if knn_imputer.add_indicator or not np.all(knn_imputer._valid_mask):
+            raise ValueError("KNNImputer with indicator or all-missing training columns cannot be compacted")
+        if method not in PROTOTYPE_METHODS:
+            raise ValueError(f"Unknown prototype method '{method}' (expected one of {PROTOTYPE_METHODS})")
+
+        fit_X = np.asarray(knn_imputer._fit_X, dtype=np.float64)
+        fit_mask = np.isnan(fit_X)
+        self.n_neighbors = knn_imputer.n_neighbors
+        self.n_features = fit_X.shape[1]
+        self.method = method if size else None
+        # Means over the full training data, as KNNImputer uses for rows without donors
+        self.col_means = np.array([
+            fit_X[~fit_mask[:, col], col].mean() for col in range(self.n_features)
+        ])
+
+        if size:
+            complete = fit_X[~fit_mask.any(axis=1)]
+            if not self.n_neighbors <= size <= len(complete):
+                raise ValueError(
+                    f"Prototype count must be between n_neighbors ({self.n_neighbors}) "
+                    f"and the {len(complete)} complete training rows"
+                )
+            fit_X = _select_prototypes(complete, size, method, seed)
+        self.reference = np.ascontiguousarray(fit_X, dtype=np.float32)
+        self.present = ~np.isnan(self.reference)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the reference set."""
+        return self.reference.nbytes + self.present.nbytes
+
+    def transform(self, X) -> np.ndarray:
+        """Imputes the missing values of X from the reference set."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[-1]} features, but the imputer expects {self.n_features}")
+        if np.isinf(X).any():
+            raise ValueError("Input X contains infinity or a value too large for dtype('float64').")
+        missing = np.isnan(X)
+        incomplete = np.flatnonzero(missing.any(axis=1))
+        if not len(incomplete):
+            return X
+
+        out = X.copy()
+        block = max(1, BLOCK_ELEMENTS // len(self.reference))
+        for start in range(0, len(incomplete), block):
+            rows = incomplete[start:start + block]
+            out[rows] = self._impute_block(X[rows], missing[rows])
+        return out
+
+    def _impute_block(self, Q: np.ndarray, missing: np.ndarray) -> np.ndarray:
+        """nan_euclidean distances from the rows of Q to every reference row, then the k-nearest means."""
+        n_ref = len(self.reference)
+        squared = np.zeros((len(Q), n_ref), dtype=np.float32)
+        shared = np.zeros((len(Q), n_ref), dtype=np.float32)
+        query = Q.astype(np.float32)
+        for col in range(self.n_features):
+            both = ~missing[:, col, None] & self.present[:, col]
+            diff = np.subtract(query[:, col, None], self.reference[:, col], where=both, out=np.zeros_like(squared))
+            squared += diff * diff
+            shared += both
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distances = np.where(shared > 0, squared * (self.n_features / shared), np.inf)
+
+        out = Q.copy()
+        k = min(self.n_neighbors, n_ref)
+        for col in np.flatnonzero(missing.any(axis=0)):
+            rows = np.flatnonzero(missing[:, col])
+            # Donors must have the value being imputed
+            candidates = np.where(self.present[:, col], distances[rows], np.inf)
+            nearest = np.argpartition(candidates, k - 1, axis=1)[:, :k]
+            usable = np.isfinite(np.take_along_axis(candidates, nearest, axis=1))
+            values = np.where(usable, self.reference[nearest, col], 0.0).astype(np.float64)
+            counts = usable.sum(axis=1)
+            out[rows, col] = np.divide(values.sum(axis=1), counts, out=np.full(len(rows), self.col_means[col]),
+                                       where=counts > 0)
+        return out
+
+
+def _select_prototypes(complete: np.ndarray, size: int, method: str, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    if method == "random" or size == len(complete):
+        return complete[np.sort(rng.choice(len(complete), size, replace=False))]
+
+    from sklearn.cluster import MiniBatchKMeans  # deferred: only needed when prototypes are built
+
+    # Clustered in the imputer's own (unscaled) distance space
+    kmeans = MiniBatchKMeans(n_clusters=size, random_state=seed, n_init=1, batch_size=max(1024, 2 * size))
+    labels = kmeans.fit_predict(complete)
+    # The member closest to each centre, so every prototype is a real training row
+    gaps = np.sum((complete - kmeans.cluster_centers_[labels]) ** 2, axis=1)
+    order = np.lexsort((gaps, labels))
+    first = order[np.r_[True, labels[order][1:] != labels[order][:-1]]]
+    return complete[np.sort(first)]
+
+
+def build_compact_knn(knn_imputer, size: int = None, method: str = "random", seed: int = 0) -> CompactKNNImputer:
+    """Builds the compact imputation engine from a fitted KNNImputer."""
+    return CompactKNNImputer(knn_imputer, size=size, method=method, seed=seed)
@@ -0,0 +1,153 @@
+# knn_index.py
+
+import itertools
+import numpy as np
+
+# Neighbour sets whose k-th and (k+1)-th distances are closer than this (relative to the
+# magnitude of the squared distances involved) could be ordered differently by the
+# expanded-form arithmetic of nan_euclidean_distances. Such rows are re-imputed by the
+# fitted KNNImputer itself so that both engines always pick the same donors.
+TIE_RELATIVE_TOLERANCE = 4e-15  # ~18 machine epsilons
+
+
+class IndexedKNNImputer:
+    """
+    Drop-in replacement for a fitted `KNNImputer.transform` (uniform weights,
+    nan_euclidean metric) backed by prebuilt KD-trees instead of a brute-force
+    distance matrix over the whole training set.
+
+    Rows without missing values are returned untouched. For incomplete rows,
+    the nan_euclidean distance to a donor only depends on the coordinates both
+    have present, so the training rows are grouped by their own missingness
+    pattern and one tree is built per (donor pattern, shared coordinates) pair.
+    Every incomplete row then queries the few trees that match its own pattern.
+    """
+
+    def __init__(self, knn_imputer):
+        if getattr(knn_imputer, "metric", None) != "nan_euclidean" or knn_imputer.weights != "uniform":
+            raise ValueError("Only KNNImputer(metric='nan_euclidean', weights='uniform') can be indexed")
+        if knn_imputer.add_indicator or not np.all(knn_imputer._valid_mask):
+            raise ValueError("KNNImputer with indicator or all-missing training columns cannot be indexed")
+        if not (isinstance(knn_imputer.missing_values, float) and np.isnan(knn_imputer.missing_values)):
+            raise ValueError("Only NaN missing values are supported")
+
+        from scipy.spatial import cKDTree  # deferred with pandas in preprocessor.py (see there)
+
+        self.knn_imputer = knn_imputer
+        self.n_neighbors = knn_imputer.n_neighbors
+        fit_X = np.asarray(knn_imputer._fit_X, dtype=np.float64)
+        fit_mask = np.asarray(knn_imputer._mask_fit_X, dtype=bool)
+        self.n_features = fit_X.shape[1]
+        self._bits = 1 << np.arange(self.n_features)
+
+        # Mean of every column over the training rows where it is present
+        # (used by KNNImputer when a row shares no coordinate with any donor)
+        self.col_means = np.array([
+            np.ma.array(fit_X[:, col], mask=fit_mask[:, col]).mean() for col in range(self.n_features)
+        ])
+
+        # Donor groups by missingness pattern, and one tree per subset of their present columns
+        fit_patterns = fit_mask @ self._bits
+        self.groups = {}
+        self.trees = {}
+        for pattern in np.unique(fit_patterns).tolist():
+            rows = fit_X[fit_patterns == pattern]
+            present = tuple(j for j in range(self.n_features) if not pattern & (1 << j))
+            max_norm2 = float(np.sum(rows[:, present] ** 2, axis=1).max())
+            self.groups[pattern] = (present, rows, max_norm2)
+            for size in range(1, len(present) + 1):
+                for subset in itertools.combinations(present, size):
+                    self.trees[(pattern, subset)] = cKDTree(rows[:, subset])
+
+    def transform(self, X) -> np.ndarray:
+        """Imputes the missing values of X exactly like the wrapped KNNImputer would."""
+        X = np.asarray(X, dtype=np.float64)
+        missing = np.isnan(X)
+        if np.isinf(X).any() or X.ndim != 2 or X.shape[1] != self.n_features:
+            # Let sklearn raise its usual validation error
+            return self._transform_exact(X)
+        if not missing.any():
+            return X
+
+        out = X.copy()
+        exact_rows = []
+        row_patterns = missing @ self._bits
+        for pattern in np.unique(row_patterns[row_patterns > 0]).tolist():
+            rows = np.flatnonzero(row_patterns == pattern)
+            values, needs_exact = self._impute_pattern(X[rows], pattern)
+            out[rows] = values
+            exact_rows.extend(rows[needs_exact].tolist())
+
+        if exact_rows:
+            # Identical rows get identical imputations, so each distinct row is sent once
+            # (NaN is swapped for +inf, which never reaches this point, so np.unique can group them)
+            keys = np.where(missing[exact_rows], np.inf, X[exact_rows])
+            _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+            imputed = self._transform_exact(X[np.asarray(exact_rows)[first]])
+            out[exact_rows] = imputed[inverse.reshape(-1)]
+        return out
+
+    def _transform_exact(self, X: np.ndarray) -> np.ndarray:
+        """The wrapped KNNImputer's own transform, given X with the column names it was fitted on."""
+        names = getattr(self.knn_imputer, "feature_names_in_", None)
+        if names is not None and X.ndim == 2 and X.shape[1] == len(names):
+            import pandas as pd  # deferred: only needed on the exact path
+
+            # A bare array would make sklearn warn about missing feature names on every call
+            X = pd.DataFrame(X, columns=names)
+        return self.knn_imputer.transform(X)
+
+    def _impute_pattern(self, Q: np.ndarray, pattern: int) -> tuple:
+        """Imputes rows that all share the missingness `pattern`; also flags near-tie rows."""
+        k = self.n_neighbors
+        present = [j for j in range(self.n_features) if not pattern & (1 << j)]
+        out = Q.copy()
+        needs_exact = np.zeros(len(Q), dtype=bool)
+        query_norm2 = np.sum(Q[:, present] ** 2, axis=1)[:, None]
+
+        for col in range(self.n_features):
+            if not pattern & (1 << col):
+                continue
+
+            distances, donor_values, tolerances = [], [], []
+            for donor_pattern, (donor_present, rows, max_norm2) in self.groups.items():
+                if donor_pattern & (1 << col):
+                    continue  # donor lacks the value being imputed
+                shared = tuple(j for j in present if j in donor_present)
+                if not shared:
+                    continue  # nan distance: never used as a donor
+                n_query = min(k + 1, len(rows))
+                dist, idx = self.trees[(donor_pattern, shared)].query(Q[:, shared], k=n_query)
+                dist = dist.reshape(len(Q), n_query)
+                idx = idx.reshape(len(Q), n_query)
+                distances.append(dist ** 2 * (self.n_features / len(shared)))
+                donor_values.append(rows[idx, col])
+                # Rounding error of the expanded form grows with the squared norms involved
+                tolerances.append(np.broadcast_to(
+                    TIE_RELATIVE_TOLERANCE * self.n_features * (query_norm2 + max_norm2), dist.shape
+                ))
+
+            if not distances:
+                out[:, col] = self.col_means[col]
+                continue
+
+            distances = np.concatenate(distances, axis=1)
+            donor_values = np.concatenate(donor_values, axis=1)
+            tolerances = np.concatenate(tolerances, axis=1)
+            order = np.argsort(distances, axis=1, kind="stable")
+            distances = np.take_along_axis(distances, order, axis=1)
+            donor_values = np.take_along_axis(donor_values, order, axis=1)
+            tolerances = np.take_along_axis(tolerances, order, axis=1)
+
+            n_donors = min(k, distances.shape[1])
+            out[:, col] = donor_values[:, :n_donors].sum(axis=1) / n_donors
+            if distances.shape[1] > n_donors:
+                gap = distances[:, n_donors] - distances[:, n_donors - 1]
+                needs_exact |= gap <= np.maximum(tolerances[:, n_donors], tolerances[:, n_donors - 1])
+
+        return out, needs_exact
+
+
+def build_knn_index(knn_imputer) -> IndexedKNNImputer:
+    """Builds the indexed imputation engine from a fitted KNNImputer."""
+    return IndexedKNNImputer(knn_imputer)
@@ -0,0 +1,309 @@
+# metrics.py
+
+import bisect
+import os
+import resource
+import threading
+import time
+
+from config import METRICS_ENABLED
+
+# Default bucket upper bounds
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 10000)
+TREES_USED_BUCKETS = (10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+LATENCY_BUCKETS_SECONDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+STAGE_LATENCY_BUCKETS_SECONDS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0, 2.5,
+)
+REPORTED_QUANTILES = (0.5, 0.95, 0.99)
+
+# Prefix of the RuntimeError messages raised by the pipeline -> stage label
+ERROR_STAGES = {
+    "Model assets not loaded": "assets",
+    "Input validation/coercion failed": "sanitize",
+    "KNN imputation failed": "imputation",
+    "Feature engineering failed": "feature_engineering",
+    "Standard scaling failed": "scaling",
+    "Ordinal encoding failed": "ordinal_encoding",
+    "One-hot encoding failed": "one_hot_encoding",
+    "Final feature reindexing failed": "reindex",
+    "PCA transformation failed": "pca",
+    "Explanation failed": "explain",
+}
+
+METRIC_PREFIX = "disease_api_"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram (Prometheus-style buckets: every observation
+    is counted in the first bucket whose upper bound it does not exceed).
+    """
+
+    def __init__(self, name: str, buckets: tuple, labels: dict = None):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.labels = labels or {}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+            self._sum = 0.0
+            self._count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        """Cumulative bucket counts, sum and count, as a JSON-serializable dict."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+            running += n
+            cumulative.append({"le": bound, "count": running})
+        return {"name": self.name, "buckets": cumulative, "sum": total, "count": count}
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile by linear interpolation within its bucket (the way
+        Prometheus' histogram_quantile does). NaN without observations.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count = self._count
+        if count == 0:
+            return float("nan")
+        rank = q * count
+        running = 0
+        for i, n in enumerate(counts):
+            if running + n >= rank and n > 0:
+                if i == len(self.buckets):
+                    return float(self.buckets[-1])  # in the +Inf bucket: best known bound
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - running) / n
+            running += n
+        return float(self.buckets[-1])
+
+    def render(self, name: str = None) -> list:
+        """Prometheus text exposition lines (_bucket, _sum, _count) without HELP/TYPE."""
+        name = name or self.name
+        snapshot = self.snapshot()
+        lines = []
+        for bucket in snapshot["buckets"]:
+            labels = {**self.labels, "le": bucket["le"] if bucket["le"] == "+Inf" else repr(float(bucket["le"]))}
+            lines.append(f"{name}_bucket{_format_labels(labels)} {bucket['count']}")
+        lines.append(f"{name}_sum{_format_labels(self.labels)} {snapshot['sum']!r}")
+        lines.append(f"{name}_count{_format_labels(self.labels)} {snapshot['count']}")
+        return lines
+
+
+class LabeledHistogram:
+    """A family of histograms sharing a name and buckets, one per value of `label`."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> Histogram:
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(value, Histogram(self.name, self.buckets, {self.label: value}))
+        return child
+
+    def reset(self):
+        for child in list(self._children.values()):
+            child.reset()
+
+    def totals(self) -> dict:
+        """{label value: (sum, count)} over every child histogram."""
+        totals = {}
+        for value, child in list(self._children.items()):
+            snapshot = child.snapshot()
+            totals[value] = (snapshot["sum"], snapshot["count"])
+        return totals
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value in sorted(self._children):
+            lines.extend(self._children[value].render())
+        return lines
+
+    def render_quantiles(self, name: str, help_text: str) -> list:
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for value in sorted(self._children):
+            for q in REPORTED_QUANTILES:
+                estimate = self._children[value].quantile(q)
+                labels = _format_labels({self.label: value, "quantile": q})
+                lines.append(f"{name}{labels} {estimate!r}")
+        return lines
+
+
+class LabeledCounter:
+    """Monotonic counters, one per value of `label`."""
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: str, amount: int = 1):
+        with self._lock:
+            self._values[value] = self._values.get(value, 0) + amount
+
+    def get(self, value: str) -> int:
+        return self._values.get(value, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for value in sorted(values):
+            lines.append(f"{self.name}{_format_labels({self.label: value})} {values[value]}")
+        return lines
+
+
+# --- Pipeline metrics ---
+
+STAGE_LATENCY = LabeledHistogram(
+    METRIC_PREFIX + "stage_latency_seconds", "Time spent per preprocessing stage and in model inference.",
+    STAGE_LATENCY_BUCKETS_SECONDS, "stage",
+)
+PIPELINE_BATCH_SIZE = Histogram(METRIC_PREFIX + "pipeline_batch_size", BATCH_SIZE_BUCKETS)
+EARLY_EXIT_TREES = Histogram(METRIC_PREFIX + "early_exit_trees_used", TREES_USED_BUCKETS)
+STAGE_ERRORS = LabeledCounter(
+    METRIC_PREFIX + "stage_errors_total", "Pipeline failures by the stage that raised them.", "stage"
+)
+
+# --- Async serving (asgi.py) ---
+
+HANDLER_QUEUE_WAIT = Histogram(METRIC_PREFIX + "handler_queue_wait_seconds", LATENCY_BUCKETS_SECONDS)
+OVERLOAD_REJECTIONS = LabeledCounter(
+    METRIC_PREFIX + "overload_rejections_total",
+    "Requests answered 503 because every handler thread was busy and the queue was full.", "path"
+)
+
+
+def stage_clock() -> float:
+    """Start time for record_stage (0.0 when timers are disabled)."""
+    return time.perf_counter() if METRICS_ENABLED else 0.0
+
+
+def record_stage(stage: str, started: float) -> float:
+    """
+    Records the time since `started` for `stage` and returns the current time,
+    so consecutive stages can be chained. A no-op when METRICS_ENABLED is off.
+    """
+    if not METRICS_ENABLED:
+        return 0.0
+    now = time.perf_counter()
+    STAGE_LATENCY.labels(stage).observe(now - started)
+    return now
+
+
+def record_batch_size(n_rows: int):
+    if METRICS_ENABLED:
+        PIPELINE_BATCH_SIZE.observe(n_rows)
+
+
+def record_trees_used(trees_used):
+    """Trees evaluated per row by an early-exit prediction."""
+    if METRICS_ENABLED:
+        for n_trees in trees_used:
+            EARLY_EXIT_TREES.observe(int(n_trees))
+
+
+def error_stage(message: str) -> str:
+    """Stage label of a pipeline error message ("other" if it names no known stage)."""
+    prefix = str(message).split(":", 1)[0].rstrip(". ")
+    for known, stage in ERROR_STAGES.items():
+        if prefix.startswith(known):
+            return stage
+    return "other"
+
+
+def record_error(message: str):
+    """Counts a pipeline failure under the stage named by its RuntimeError message prefix."""
+    STAGE_ERRORS.inc(error_stage(message))
+
+
+# --- Exposition ---
+
+def _process_metrics() -> list:
+    lines = []
+    rss_bytes = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss_bytes = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    if rss_bytes is not None:
+        lines += ["# HELP process_resident_memory_bytes Resident memory size in bytes.",
+                  "# TYPE process_resident_memory_bytes gauge",
+                  f"process_resident_memory_bytes {rss_bytes}"]
+    lines += ["# HELP process_max_resident_memory_bytes Peak resident memory size in bytes.",
+              "# TYPE process_max_resident_memory_bytes gauge",
+              f"process_max_resident_memory_bytes {usage.ru_maxrss * 1024}",
+              "# HELP process_cpu_seconds_total Total user and system CPU time in seconds.",
+              "# TYPE process_cpu_seconds_total counter",
+              f"process_cpu_seconds_total {usage.ru_utime + usage.ru_stime!r}",
+              "# HELP " + METRIC_PREFIX + "process_info Worker process serving this scrape.",
+              "# TYPE " + METRIC_PREFIX + "process_info gauge",
+              f"{METRIC_PREFIX}process_info{_format_labels({'pid': os.getpid()})} 1"]
+    return lines
+
+
+def render_prometheus(histograms: list = (), counters: dict = None) -> str:
+    """
+    Renders the pipeline metrics, process memory/CPU, and any extra `histograms`
+    (e.g. the micro-batcher's) and `counters` ({name: value}) in Prometheus text format.
+    """
+    lines = STAGE_LATENCY.render()
+    lines += STAGE_LATENCY.render_quantiles(
+        METRIC_PREFIX + "stage_latency_quantile_seconds",
+        "p50/p95/p99 per stage, estimated from the stage_latency_seconds buckets.",
+    )
+    lines += [f"# HELP {PIPELINE_BATCH_SIZE.name} Rows per preprocessing call.",
+              f"# TYPE {PIPELINE_BATCH_SIZE.name} histogram"] + PIPELINE_BATCH_SIZE.render()
+    if EARLY_EXIT_TREES.snapshot()["count"]:
+        lines += [f"# HELP {EARLY_EXIT_TREES.name} Trees evaluated per row in early-exit mode.",
+                  f"# TYPE {EARLY_EXIT_TREES.name} histogram"] + EARLY_EXIT_TREES.render()
+    lines += STAGE_ERRORS.render()
+    if HANDLER_QUEUE_WAIT.snapshot()["count"]:
+        lines += [f"# HELP {HANDLER_QUEUE_WAIT.name} Time scoring requests waited for a handler thread.",
+                  f"# TYPE {HANDLER_QUEUE_WAIT.name} histogram"] + HANDLER_QUEUE_WAIT.render()
+    lines += OVERLOAD_REJECTIONS.render()
+    for histogram in histograms:
+        name = METRIC_PREFIX + histogram.name
+        lines += [f"# TYPE {name} histogram"] + histogram.render(name)
+    for name, value in (counters or {}).items():
+        lines += [f"# TYPE {METRIC_PREFIX}{name} counter", f"{METRIC_PREFIX}{name} {value}"]
+    lines += _process_metrics()
+    return "\n".join(lines) + "\n"
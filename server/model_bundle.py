@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Single-file model bundle: every artifact of a Predictor in one versioned,
+checksummed file that loads without unpickling.
+
+Layout:
+
+  header     b"DRBUNDLE", manifest length (uint64 LE), SHA-256 of the manifest
+  manifest   UTF-8 JSON: format version, bundle version, library versions, the
+             column lists of config.py, the final feature list, the state of every
+             estimator, and offset/shape/dtype/SHA-256 of every array
+  arrays     raw little-endian C-contiguous buffers, each aligned to 64 bytes
+
+Estimators are stored as their class name plus attribute dict (what pickle
+stores, minus the code): NumPy arrays go to the array section and are read back
+zero-copy from a memory map, the LightGBM booster as its model text, and the
+flattened trees of tree_evaluator.py as arrays, so no dump or parity run against
+LightGBM is needed at load. Only scikit-learn and LightGBM classes can be named.
+
+Loading fails on any mismatch: header, manifest checksum, format version,
+column lists, scikit-learn/LightGBM version, file size, array checksums, or the
+stored tree parity sample.
+
+    python model_bundle.py convert models                 # -> models/model.bundle
+    python model_bundle.py convert /srv/models/v2 -o /srv/models/v2/model.bundle
+    python model_bundle.py inspect models/model.bundle
+
+Run from the server/ directory.
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    USER_INPUT_COLUMNS, KNN_IMPUTE_COLS, NUM_COLS, CAT_COLS, CAT_ORDINAL_COLS, MODEL_BUNDLE_PATH, ASSET_MMAP_MODE
+)
+
+MAGIC = b"DRBUNDLE"
+FORMAT_VERSION = 2  # 2: flattened trees store node_value
+HEADER = struct.Struct("<8sQ32s")  # magic, manifest length, manifest SHA-256
+ALIGNMENT = 64
+
+# Predictor fields stored as estimators (final_features_list is stored as JSON)
+ESTIMATORS = ("final_model", "standard_scaler", "ordinal_encoder", "one_hot_encoder", "knn_imputer",
+              "pca_transformer")
+# A bundle is only valid for the column lists it was converted under
+BUNDLE_COLUMNS = {
+    "USER_INPUT_COLUMNS": USER_INPUT_COLUMNS,
+    "KNN_IMPUTE_COLS": KNN_IMPUTE_COLS,
+    "NUM_COLS": NUM_COLS,
+    "CAT_COLS": CAT_COLS,
+    "CAT_ORDINAL_COLS": CAT_ORDINAL_COLS,
+}
+# Estimator attributes are library internals: these must match major.minor to load
+STRICT_LIBRARIES = ("scikit-learn", "lightgbm")
+RECORDED_LIBRARIES = ("numpy", "scipy", "scikit-learn", "lightgbm")
+# The only modules estimator classes are imported from
+ALLOWED_MODULES = ("sklearn.", "lightgbm.")
+PARITY_TOLERANCE = 1e-9
+
+
+def _library_versions() -> dict:
+    versions = {}
+    for name in RECORDED_LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _minor(version: str) -> str:
+    return ".".join((version or "").split(".")[:2])
+
+
+# --- Writing ---
+
+def _encode(value, path: str, arrays: dict):
+    """JSON-able form of an estimator attribute; arrays are moved to `arrays` under `path`."""
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, np.generic):
+        return {"__scalar__": value.dtype.str, "value": value.item()}
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, np.ndarray):
+        if not value.dtype.hasobject:
+            arrays[path] = value
+            return {"__array__": path}
+        if value.ndim != 1:
+            raise ValueError(f"Cannot store {path}: object arrays must be 1-D")
+        return {"__object_array__": [_encode(item, f"{path}[{i}]", arrays) for i, item in enumerate(value)]}
+    if isinstance(value, type) and issubclass(value, np.generic):
+        return {"__dtype__": np.dtype(value).str}
+    if isinstance(value, (list, tuple)):
+        key = "__list__" if isinstance(value, list) else "__tuple__"
+        return {key: [_encode(item, f"{path}[{i}]", arrays) for i, item in enumerate(value)]}
+    if isinstance(value, dict):
+        return {"__dict__": [[_encode(k, f"{path}.key{i}", arrays), _encode(v, f"{path}[{i}]", arrays)]
+                             for i, (k, v) in enumerate(value.items())]}
+    cls = type(value)
+    if cls.__module__.startswith("lightgbm.") and cls.__name__ == "Booster":
+        arrays[path] = np.frombuffer(value.model_to_string().encode(), dtype=np.uint8)
+        return {"__lightgbm_booster__": path}
+    if hasattr(value, "get_params") and cls.__module__.startswith(ALLOWED_MODULES):
+        return {
+            "__estimator__": f"{cls.__module__}.{cls.__qualname__}",
+            "state": {name: _encode(attr, f"{path}.{name}", arrays) for name, attr in vars(value).items()},
+        }
+    raise ValueError(f"Cannot store {path} of type {cls.__name__} in a bundle")
+
+
+def _file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_bundle(path, artifacts: dict, tree_evaluator=None, sources: dict = None) -> dict:
+    """
+    Writes a bundle of `artifacts` ({Predictor field: fitted object}, plus
+    final_features_list) and optionally a parity-checked FlatTreeEnsemble.
+    The file is written next to `path` and renamed into place. Returns the manifest.
+    """
+    arrays = {}
+    manifest = {
+        "format": "disease-risk-model-bundle",
+        "format_version": FORMAT_VERSION,
+        "columns": BUNDLE_COLUMNS,
+        "final_features_list": list(artifacts["final_features_list"]),
+        "estimators": {name: _encode(artifacts[name], name, arrays) for name in ESTIMATORS},
+        "tree_evaluator": None,
+    }
+    if tree_evaluator is not None:
+        state_arrays, scalars = tree_evaluator.state()
+        X = tree_evaluator.parity_sample()
+        manifest["tree_evaluator"] = {
+            "arrays": {name: _encode(array, f"tree_evaluator.{name}", arrays) for name, array in state_arrays.items()},
+            "scalars": {name: _encode(value, name, arrays) for name, value in scalars.items()},
+            # Raw scores the booster gave for a sample; checked again after every load
+            "parity_X": _encode(X, "tree_evaluator.parity_X", arrays),
+            "parity_raw": _encode(tree_evaluator.predict_raw(X), "tree_evaluator.parity_raw", arrays),
+        }
+
+    # Array section: offsets relative to its (aligned) start
+    table, offset = {}, 0
+    for name, array in arrays.items():
+        array = arrays[name] = np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<"), copy=False)
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset,
+                       "nbytes": array.nbytes, "sha256": hashlib.sha256(memoryview(array).cast("B")).hexdigest()}
+        offset += array.nbytes
+    manifest["arrays"] = table
+    manifest["data_nbytes"] = offset
+
+    # The version covers content only, so converting the same files twice gives the same version
+    content = json.dumps(manifest, sort_keys=True).encode()
+    manifest["bundle_version"] = hashlib.sha256(content).hexdigest()[:16]
+    manifest["libraries"] = _library_versions()
+    manifest["created_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    manifest["sources"] = sources or {}
+
+    manifest_bytes = json.dumps(manifest).encode()
+    header = HEADER.pack(MAGIC, len(manifest_bytes), hashlib.sha256(manifest_bytes).digest())
+    data_start = -(-(len(header) + len(manifest_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        os.chmod(tmp_path, 0o644)  # mkstemp creates it owner-only
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(manifest_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + table[name]["offset"])
+                f.write(memoryview(array).cast("B"))
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return manifest
+
+
+# --- Reading ---
+
+def _fail(path, message: str):
+    raise RuntimeError(f"Model bundle {path} rejected: {message}")
+
+
+def read_manifest(path) -> tuple:
+    """(manifest, offset of the array section). Checks header, manifest checksum and format version."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            _fail(path, "file is truncated")
+        magic, length, digest = HEADER.unpack(header)
+        if magic != MAGIC:
+            _fail(path, "not a model bundle")
+        manifest_bytes = f.read(length)
+    if len(manifest_bytes) != length or hashlib.sha256(manifest_bytes).digest() != digest:
+        _fail(path, "manifest checksum mismatch")
+    manifest = json.loads(manifest_bytes)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        _fail(path, f"format version {manifest.get('format_version')} (this loader reads {FORMAT_VERSION})")
+    data_start = -(-(HEADER.size + length) // ALIGNMENT) * ALIGNMENT
+    return manifest, data_start
+
+
+def _check_compatible(path, manifest: dict):
+    for name, columns in BUNDLE_COLUMNS.items():
+        if manifest["columns"].get(name) != columns:
+            _fail(path, f"{name} in config.py differs from the bundle's")
+    installed = _library_versions()
+    for name in STRICT_LIBRARIES:
+        if _minor(manifest["libraries"].get(name)) != _minor(installed[name]):
+            _fail(path, f"converted with {name} {manifest['libraries'].get(name)}, running {installed[name]}; "
+                        f"convert it again under this version")
+
+
+def _map_arrays(path, manifest: dict, data_start: int, mmap_mode) -> dict:
+    """Every array of the bundle as a read-only view of the file (memory-mapped unless mmap_mode is None)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size != data_start + manifest["data_nbytes"]:
+            _fail(path, f"file is {size} bytes, the manifest describes {data_start + manifest['data_nbytes']}")
+        if size == 0:
+            return {}
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if mmap_mode else f.read()
+
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        if count * dtype.itemsize != spec["nbytes"]:
+            _fail(path, f"array {name} has an inconsistent size")
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec["offset"])
+        if hashlib.sha256(memoryview(array).cast("B")).hexdigest() != spec["sha256"]:
+            _fail(path, f"checksum mismatch in array {name}")
+        arrays[name] = array.reshape(spec["shape"])
+    return arrays
+
+
+def _decode(value, arrays: dict):
+    if not isinstance(value, dict):
+        return value
+    if "__array__" in value:
+        return arrays[value["__array__"]]
+    if "__scalar__" in value:
+        return np.dtype(value["__scalar__"]).type(value["value"])
+    if "__object_array__" in value:
+        items = [_decode(item, arrays) for item in value["__object_array__"]]
+        array = np.empty(len(items), dtype=object)
+        array[:] = items
+        return array
+    if "__dtype__" in value:
+        return np.dtype(value["__dtype__"]).type
+    if "__list__" in value:
+        return [_decode(item, arrays) for item in value["__list__"]]
+    if "__tuple__" in value:
+        return tuple(_decode(item, arrays) for item in value["__tuple__"])
+    if "__dict__" in value:
+        return {_decode(k, arrays): _decode(v, arrays) for k, v in value["__dict__"]}
+    if "__lightgbm_booster__" in value:
+        import lightgbm
+        return lightgbm.Booster(model_str=arrays[value["__lightgbm_booster__"]].tobytes().decode())
+    if "__estimator__" in value:
+        module_name, _, class_name = value["__estimator__"].rpartition(".")
+        if not module_name.startswith(ALLOWED_MODULES):
+            raise ValueError(f"Estimator class {value['__estimator__']} is not allowed in a bundle")
+        cls = getattr(importlib.import_module(module_name), class_name)
+        # What unpickling does: a bare instance with its attributes restored
+        estimator = cls.__new__(cls)
+        estimator.__dict__.update({name: _decode(attr, arrays) for name, attr in value["state"].items()})
+        return estimator
+    raise ValueError(f"Unknown bundle entry: {sorted(value)}")
+
+
+def load_bundle(path, mmap_mode=ASSET_MMAP_MODE) -> tuple:
+    """
+    Reads and verifies a bundle. Returns (manifest, artifacts, tree_evaluator):
+    artifacts maps Predictor fields to the restored objects, and tree_evaluator
+    is the stored FlatTreeEnsemble (None if the bundle has none).
+    Raises RuntimeError on any mismatch.
+    """
+    manifest, data_start = read_manifest(path)
+    _check_compatible(path, manifest)
+    arrays = _map_arrays(path, manifest, data_start, mmap_mode)
+
+    try:
+        artifacts = {name: _decode(manifest["estimators"][name], arrays) for name in ESTIMATORS}
+    except Exception as e:
+        _fail(path, f"could not restore the estimators: {e}")
+    artifacts["final_features_list"] = manifest["final_features_list"]
+
+    tree_evaluator = None
+    stored = manifest.get("tree_evaluator")
+    if stored is not None:
+        from tree_evaluator import FlatTreeEnsemble
+
+        tree_evaluator = FlatTreeEnsemble.from_state(
+            {name: _decode(array, arrays) for name, array in stored["arrays"].items()},
+            {name: _decode(value, arrays) for name, value in stored["scalars"].items()},
+        )
+        error = np.abs(tree_evaluator.predict_raw(_decode(stored["parity_X"], arrays))
+                       - _decode(stored["parity_raw"], arrays)).max()
+        if not error <= PARITY_TOLERANCE:
+            _fail(path, f"stored trees fail their parity sample (max raw score error {error:g})")
+    return manifest, artifacts, tree_evaluator
+
+
+# --- Command line ---
+
+def convert(models_dir, output) -> dict:
+    """Converts the .joblib artifacts of models_dir into a bundle and checks it scores identically."""
+    import joblib
+    import preprocessor
+    from config import WARMUP_RECORDS
+    from tree_evaluator import compile_tree_ensemble
+
+    paths = preprocessor.artifact_paths(models_dir)
+    artifacts = {name: joblib.load(paths[name]) for name in ESTIMATORS}
+    with open(paths["final_features_list"]) as f:
+        artifacts["final_features_list"] = json.load(f)
+    tree_evaluator = compile_tree_ensemble(artifacts["final_model"])  # parity-checked against the booster
+    sources = {Path(path).name: _file_sha256(path) for path in paths.values()}
+    manifest = write_bundle(output, artifacts, tree_evaluator, sources)
+
+    # Same probabilities, bit for bit, through both loaders and both model evaluators
+    reference = preprocessor.load_predictor(models_dir, model_format="joblib")
+    candidate = preprocessor.load_predictor(output, model_format="bundle")
+    X = reference.preprocess_records(WARMUP_RECORDS)
+    checks = {
+        "preprocessing": (X, candidate.preprocess_records(WARMUP_RECORDS)),
+        "booster": (reference.final_model.predict_proba(X), candidate.final_model.predict_proba(X)),
+        "flat trees": (tree_evaluator.predict_proba(X), candidate.tree_evaluator.predict_proba(X)),
+    }
+    for name, (expected, actual) in checks.items():
+        if not np.array_equal(expected, actual):
+            os.unlink(output)
+            raise RuntimeError(f"Bundle check failed: {name} differs from the .joblib artifacts")
+    return manifest
+
+
+def inspect(path) -> dict:
+    started = time.perf_counter()
+    manifest, _, _ = load_bundle(path)
+    return {
+        "path": str(path),
+        "bundle_version": manifest["bundle_version"],
+        "created_at": manifest["created_at"],
+        "libraries": manifest["libraries"],
+        "arrays": len(manifest["arrays"]),
+        "array_bytes": manifest["data_nbytes"],
+        "tree_evaluator": manifest["tree_evaluator"] is not None,
+        "sources": manifest["sources"],
+        "load_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="Convert a directory of .joblib artifacts")
+    convert_parser.add_argument("models_dir", nargs="?", default=str(Path(MODEL_BUNDLE_PATH).parent))
+    convert_parser.add_argument("-o", "--output", help="Bundle file (default: <models_dir>/model.bundle)")
+    inspect_parser = commands.add_parser("inspect", help="Verify a bundle and print its manifest summary")
+    inspect_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "convert":
+            output = args.output or str(Path(args.models_dir) / Path(MODEL_BUNDLE_PATH).name)
+            manifest = convert(args.models_dir, output)
+            print(f"Wrote {output} (version {manifest['bundle_version']}, "
+                  f"{len(manifest['arrays'])} arrays, {manifest['data_nbytes']} bytes)")
+        else:
+            print(json.dumps(inspect(args.path), indent=2))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# model_reload.py
+
+import threading
+import time
+
+import preprocessor
+import startup
+from config import MODELS_DIR, MODEL_RELOAD_POLL_SECONDS
+
+# Latest reload in this process, reported by GET /model.
+# status: "idle" -> "loading" -> "warming_up" -> "done", or "failed"
+RELOAD = {"status": "idle", "source": None, "version": None, "error": None, "seconds": None}
+
+_lock = threading.Lock()
+_watcher = None
+
+
+def in_progress() -> bool:
+    return _lock.locked()
+
+
+def _reload(models_dir):
+    started = time.perf_counter()
+    RELOAD.update(status="loading", source=str(models_dir or MODELS_DIR), version=None, error=None, seconds=None)
+    try:
+        predictor = preprocessor.load_predictor(models_dir)
+        RELOAD.update(status="warming_up", version=predictor.version)
+        try:
+            startup.warm_up(predictor)
+        except Exception as e:
+            raise RuntimeError(f"Warm-up failed: {e}")
+        preprocessor.activate(predictor)
+    except Exception as e:
+        RELOAD["status"] = "failed"
+        RELOAD["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        RELOAD["seconds"] = round(time.perf_counter() - started, 3)
+
+    RELOAD["status"] = "done"
+    print(f"Model bundle {predictor.version} from {predictor.source} is active ({RELOAD['seconds']} s)")
+    return predictor
+
+
+def reload(models_dir=None):
+    """
+    Loads the bundle in models_dir (default MODELS_DIR) next to the active one,
+    warms it up, and only then activates it. Requests keep being served by the
+    active predictor meanwhile, and keep it if anything fails. Returns the new predictor.
+    """
+    if not _lock.acquire(blocking=False):
+        raise RuntimeError("Reload failed: another reload is in progress")
+    try:
+        return _reload(models_dir)
+    finally:
+        _lock.release()
+
+
+def start_reload(models_dir=None) -> bool:
+    """Runs reload() in a background thread. False if a reload is already running."""
+    if not _lock.acquire(blocking=False):
+        return False
+
+    def _run():
+        try:
+            _reload(models_dir)
+        except Exception as e:
+            print(f"Model reload failed: {e}")
+        finally:
+            _lock.release()
+
+    threading.Thread(target=_run, name="model-reload", daemon=True).start()
+    return True
+
+
+def _fingerprint(models_dir):
+    try:
+        return preprocessor.assets_fingerprint(models_dir)
+    except OSError:  # a file is missing, e.g. halfway through a copy
+        return None
+
+
+def watch(models_dir=None, interval: float = MODEL_RELOAD_POLL_SECONDS):
+    """
+    Starts a daemon thread (one per process) that reloads models_dir whenever its
+    files change. A no-op when interval is 0 or the thread is already running.
+    Must be called again in every forked worker: threads do not survive the fork.
+    """
+    global _watcher
+
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return None
+    _watcher = threading.Thread(target=_watch, args=(models_dir, interval), name="model-watcher", daemon=True)
+    _watcher.start()
+    return _watcher
+
+
+def _watch(models_dir, interval: float):
+    seen = _fingerprint(models_dir)
+    pending = None
+    while True:
+        time.sleep(interval)
+        current = _fingerprint(models_dir)
+        if current is None or current == seen:
+            pending = None
+            continue
+        # Reload once the files have stopped changing for a whole interval, not mid-copy
+        if current != pending:
+            pending = current
+            continue
+        try:
+            reload(models_dir)
+        except Exception as e:
+            print(f"Model reload from {models_dir or MODELS_DIR} failed: {e}")
+        # Not retried until the files change again
+        seen, pending = current, None
@@ -0,0 +1,202 @@
+# prediction_cache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCacheBackend:
+    """In-process LRU store (one per worker process)."""
+
+    shared = False
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float):
+        """Returns (value, status) with status "hit", "miss" or "expired"."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, "miss"
+            if entry[0] <= now:
+                del self._entries[key]
+                return None, "expired"
+            self._entries.move_to_end(key)
+            return entry[1], "hit"
+
+    def set(self, key: str, value: dict, expires_at: float) -> int:
+        """Stores an entry; returns the number of entries evicted to make room."""
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCacheBackend:
+    """
+    LRU store shared by all worker processes on the host: a SQLite database that
+    should live on a memory-backed filesystem (/dev/shm by default).
+
+    Trimming to `max_size` happens every `trim_interval` writes, so the table can
+    briefly hold a few more entries than the limit.
+    """
+
+    shared = True
+
+    def __init__(self, max_size: int, path: str, trim_interval: int = 256):
+        self.max_size = max_size
+        self.path = str(path)
+        self.trim_interval = trim_interval
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS predictions_last_access ON predictions (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str, now: float):
+        conn = self._connection()
+        row = conn.execute("SELECT value, expires_at FROM predictions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, "miss"
+        if row[1] <= now:
+            conn.execute("DELETE FROM predictions WHERE key = ?", (key,))
+            return None, "expired"
+        conn.execute("UPDATE predictions SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), "hit"
+
+    def set(self, key: str, value: dict, expires_at: float) -> int:
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO predictions (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now),
+        )
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.trim_interval:
+                return 0
+        conn.execute("DELETE FROM predictions WHERE expires_at <= ?", (now,))
+        cursor = conn.execute(
+            "DELETE FROM predictions WHERE key IN "
+            "(SELECT key FROM predictions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+        return max(cursor.rowcount, 0)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM predictions")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class PredictionCache:
+    """
+    Bounded LRU + TTL cache of prediction results, keyed on canonical input records.
+
+    Keys are expected to embed the assets version (see
+    preprocessor.prediction_cache_key), so results computed with other model files
+    can never be returned; in addition, a per-worker backend is emptied the first
+    time the cache sees a new assets version. A shared backend is not: workers
+    pick up a reload one by one, and one of them clearing the table would wipe
+    the entries the others (and itself, from then on) keep writing. Entries of
+    the old version there expire by TTL or are trimmed as least recently used.
+    """
+
+    def __init__(self, backend, ttl_seconds: float):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.assets_version = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key: str, assets_version: str):
+        """Cached result for `key`, or None."""
+        self._check_version(assets_version)
+        value, status = self.backend.get(key, time.time())
+        with self._lock:
+            if status == "hit":
+                self.hits += 1
+            else:
+                self.misses += 1
+                if status == "expired":
+                    self.expirations += 1
+        return value
+
+    def set(self, key: str, value: dict, assets_version: str):
+        self._check_version(assets_version)
+        evicted = self.backend.set(key, value, time.time() + self.ttl_seconds)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def clear(self):
+        self.backend.clear()
+
+    def _check_version(self, assets_version: str):
+        if assets_version == self.assets_version:
+            return
+        with self._lock:
+            if assets_version == self.assets_version:
+                return
+            if self.assets_version is not None:
+                if not self.backend.shared:
+                    self.backend.clear()
+                self.invalidations += 1
+            self.assets_version = assets_version
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "size": len(self.backend),
+                "max_size": self.backend.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def create_prediction_cache(backend: str, max_size: int, ttl_seconds: float, shared_path: str) -> PredictionCache:
+    """Builds the cache for the configured backend ("local" or "shared")."""
+    if backend == "shared":
+        return PredictionCache(SharedCacheBackend(max_size, shared_path), ttl_seconds)
+    if backend == "local":
+        return PredictionCache(LocalCacheBackend(max_size), ttl_seconds)
+    raise ValueError(f"Unknown prediction cache backend: {backend}")
@@ -1,241 +1,806 @@
 # preprocessor.py
 
+from __future__ import annotations
+
 import joblib
-import pandas as pd
 import numpy as np
 import json
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 from pathlib import Path
 from config import (
     FINAL_MODEL_PATH, STANDARD_SCALER_PATH, ORDINAL_ENCODER_PATH, ONE_HOT_ENCODER_PATH,
     KNN_IMPUTER_PATH, PCA_TRANSFORMER_PATH, FINAL_FEATURES_LIST_PATH,
-    KNN_IMPUTE_COLS, NUM_COLS, CAT_COLS, CAT_ORDINAL_COLS,
-    BMI_BINS, BMI_LABELS, AGE_BINS, AGE_LABELS, HOMA_IR_DIVISOR, GLUCOSE_RISK_THRESHOLD
+    USER_INPUT_COLUMNS, KNN_IMPUTE_COLS, NUM_COLS, CAT_COLS, CAT_ORDINAL_COLS,
+    BMI_BINS, BMI_LABELS, AGE_BINS, AGE_LABELS, HOMA_IR_DIVISOR, GLUCOSE_RISK_THRESHOLD,
+    STRESS_LEVEL_MAPPING, STRESS_LEVEL_DEFAULT, SMOKING_LEVEL_MAPPING, SMOKING_LEVEL_DEFAULT,
+    DIET_TYPE_MAPPING, DIET_TYPE_DEFAULT, CATEGORICAL_DEFAULTS, CATEGORY_FALLBACK_CANDIDATES,
+    PREPROCESS_MODE, KNN_ENGINE, MODEL_EVALUATOR, ASSET_MMAP_MODE, MODEL_HISTORY_SIZE, MODEL_BUNDLE_PATH,
+    MODEL_FORMAT, EARLY_EXIT_FREQ, EXPLAIN_METHOD, KNN_COMPACT_SIZE, KNN_COMPACT_METHOD
 )
+from transform_plan import TransformPlan, compile_transform_plan, _to_number
+from knn_index import build_knn_index
+from knn_compact import CompactKNNImputer, build_compact_knn
+from tree_evaluator import compile_tree_ensemble
+from explain import compile_explainer
+from metrics import stage_clock, record_stage, record_batch_size, record_trees_used
+from thread_plan import model_threads
+
+# pandas is only needed by the reference pipeline and DataFrame inputs, so it is
+# imported where it is used. This only pays off with STARTUP_MODE=background: the
+# app imports in ~0.3 s instead of ~0.8 s and listens that much sooner. Unpickling
+# the artifacts imports pandas, sklearn and scipy anyway, so an eager startup
+# takes as long either way.
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Artifact file of every Predictor field loaded from disk
+ARTIFACT_PATHS = {
+    "final_model": FINAL_MODEL_PATH,
+    "standard_scaler": STANDARD_SCALER_PATH,
+    "ordinal_encoder": ORDINAL_ENCODER_PATH,
+    "one_hot_encoder": ONE_HOT_ENCODER_PATH,
+    "knn_imputer": KNN_IMPUTER_PATH,
+    "pca_transformer": PCA_TRANSFORMER_PATH,
+    "final_features_list": FINAL_FEATURES_LIST_PATH,
+}
+
+# The predictor serving requests. Replaced as a whole by activate(), never modified:
+# callers read it once (current_predictor()) and use that object for the whole request.
+ACTIVE_PREDICTOR = None
+# Predictors replaced by activate(), most recent last, kept loaded for rollback()
+PREVIOUS_PREDICTORS = []
+
+_swap_lock = threading.Lock()
+
+
+@dataclass(frozen=True, eq=False)
+class Predictor:
+    """
+    One consistent set of loaded artifacts (model, scaler, encoders, imputer, PCA,
+    feature list) and the pipeline that runs over them.
 
-# Global variables to hold the loaded assets
-FINAL_MODEL = None
-STANDARD_SCALER = None
-ORDINAL_ENCODER = None
-ONE_HOT_ENCODER = None
-KNN_IMPUTER = None
-PCA_TRANSFORMER = None
-FINAL_FEATURES_LIST = None
+    Never modified after construction: a new bundle is a new Predictor. A request
+    that holds on to one keeps scoring with the same artifacts even if another
+    bundle is activated meanwhile.
+    """
+    version: str
+    source: str
+    final_model: object
+    standard_scaler: object
+    ordinal_encoder: object
+    one_hot_encoder: object
+    knn_imputer: object
+    pca_transformer: object
+    final_features_list: list
+    transform_plan: object = None
+    knn_index: object = None
+    tree_evaluator: object = None
+    explainer: object = None
+    loaded_at: float = field(default_factory=time.time)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "preprocess_engine": "compiled" if self.transform_plan is not None else "pandas",
+            "model_evaluator": "flat" if self.tree_evaluator is not None else "booster",
+            "knn_engine": self.knn_engine,
+            "explain_method": self.explain_method if self.explainer is not None else None,
+        }
 
+    @property
+    def knn_engine(self) -> str:
+        """The KNN imputation engine actually in use (KNN_ENGINE, unless it could not be built)."""
+        if isinstance(self.knn_imputer, CompactKNNImputer):
+            return "compact"
+        return "indexed" if self.knn_index is not None else "sklearn"
+
+    @property
+    def explain_method(self) -> str:
+        """EXPLAIN_METHOD, or "tree_shap" when the flattened trees are not loaded."""
+        return "path" if EXPLAIN_METHOD == "path" and self.tree_evaluator is not None else "tree_shap"
+
+    def cache_key(self, record: dict, early_exit_margin: float = None, explain: bool = False) -> str:
+        """
+        Cache key of one input dict: a hash of its USER_INPUT_COLUMNS values after
+        numeric coercion and category sanitizing, prefixed by the bundle version
+        (and the early-exit setting, whose results differ from full evaluation, or
+        the explanation method for explained results, which always use every tree).
+        """
+        if self.transform_plan is not None:
+            canonical = self.transform_plan.canonical_record(record)
+        else:
+            # pandas mode: numeric coercion only
+            canonical = tuple(
+                (_to_number(record.get(col)) + 0.0) if col in NUM_COLS else repr(record.get(col))
+                for col in USER_INPUT_COLUMNS
+            )
+        digest = hashlib.blake2b(repr(canonical).encode(), digest_size=16).hexdigest()
+        if explain:
+            return f"{self.version}:explain-{self.explain_method}:{digest}"
+        if early_exit_margin:
+            return f"{self.version}:early-exit-{early_exit_margin:g}-{EARLY_EXIT_FREQ}:{digest}"
+        return f"{self.version}:{digest}"
+
+    def _sanitize_and_coerce(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Prepare DataFrame for transformations."""
+        import pandas as pd
+
+        df = df.copy()
+
+        # Coerce numeric for imputation columns (including raw inputs that might be numeric)
+        # NOTE: We include all raw numerical inputs here to ensure they are float/int
+        raw_num_cols = [c for c in NUM_COLS if c not in ['caffeine_missing_flag', 'HOMA_IR']]
+
+        # We must ensure all columns that should be numerical (raw or imputed) are converted
+        for col in set(raw_num_cols):
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+            else:
+                # Handle case where a required input column is entirely missing
+                df[col] = np.nan
+
+        # Sanitize categoricals for one-hot (including the newly moved 'stress_level')
+        if self.one_hot_encoder is not None and hasattr(self.one_hot_encoder, "categories_"):
+            for i, col in enumerate(CAT_COLS):
+                if col not in df.columns:
+                    continue
+                allowed = set(self.one_hot_encoder.categories_[i].tolist())
+                fallback = None
+                for cand in CATEGORY_FALLBACK_CANDIDATES:
+                    if cand in allowed:
+                        fallback = cand
+                        break
+                if fallback is None and len(allowed) > 0:
+                    fallback = next(iter(allowed))
+
+                df[col] = df[col].where(df[col].isin(allowed), fallback)
+
+        return df
+
+    def preprocess_input(self, input_df: pd.DataFrame) -> np.ndarray:
+        """
+        Applies full preprocessing (Imputation, Feature Engineering,
+        Scaling/Encoding, PCA) to raw input DataFrame.
+
+        Uses the compiled transform plan unless PREPROCESS_MODE is "pandas".
+        """
+        record_batch_size(len(input_df))
+        if self.transform_plan is not None:
+            return self.transform_plan.transform_frame(input_df)
+        return self._preprocess_input_pandas(input_df)
+
+    def preprocess_records(self, records: list) -> np.ndarray:
+        """
+        Same as preprocess_input, for a list of input dicts keyed by USER_INPUT_COLUMNS.
+        In compiled mode the records never go through a DataFrame.
+        """
+        record_batch_size(len(records))
+        if self.transform_plan is not None:
+            return self.transform_plan.transform_records(records)
+        import pandas as pd
+        return self._preprocess_input_pandas(pd.DataFrame(records, columns=USER_INPUT_COLUMNS))
+
+    def preprocess_columns(self, columns: dict, n_rows: int) -> np.ndarray:
+        """
+        Same as preprocess_input, for column-oriented input (column name -> n_rows
+        values, e.g. NumPy arrays from an Arrow batch). In compiled mode the
+        columns feed the transform plan directly, without per-row dicts.
+        """
+        record_batch_size(n_rows)
+        if self.transform_plan is not None:
+            return self.transform_plan.transform_columns(columns, n_rows)
+        import pandas as pd
+        return self._preprocess_input_pandas(pd.DataFrame(dict(columns), index=range(n_rows)))
+
+    def _preprocess_input_pandas(self, input_df: pd.DataFrame, with_features: bool = False):
+        """
+        Reference DataFrame implementation of preprocess_input. With with_features,
+        returns (scaled FINAL_FEATURES_LIST matrix, PCA matrix).
+        """
+        import pandas as pd
+
+        t = stage_clock()
+
+        # --- A. Sanitize ---
+        try:
+            df_processed = self._sanitize_and_coerce(input_df)
+        except Exception as e:
+            raise RuntimeError(f"Input validation/coercion failed: {e}")
+        t = record_stage("sanitize", t)
+
+        # --- B. Imputation & Flags ---
+        df_processed["exercise_type"] = df_processed.get("exercise_type").fillna("Undefined")
+
+        # Convert stress_level to numerical values to match training
+        if 'stress_level' in df_processed.columns:
+            df_processed['stress_level'] = df_processed['stress_level'].map(STRESS_LEVEL_MAPPING).fillna(STRESS_LEVEL_DEFAULT)
+
+        # Map user input features to training features
+        if 'smoking_level' not in df_processed.columns:
+            if 'smoking_status' in df_processed.columns:
+                df_processed['smoking_level'] = df_processed['smoking_status'].map(SMOKING_LEVEL_MAPPING).fillna(SMOKING_LEVEL_DEFAULT)
+            else:
+                df_processed['smoking_level'] = SMOKING_LEVEL_DEFAULT
+
+        if 'diet_type' not in df_processed.columns:
+            if 'dietary_habits' in df_processed.columns:
+                df_processed['diet_type'] = df_processed['dietary_habits'].map(DIET_TYPE_MAPPING).fillna(DIET_TYPE_DEFAULT)
+            else:
+                df_processed['diet_type'] = DIET_TYPE_DEFAULT
+
+        # Create missing categorical features with default values
+        for col, default in CATEGORICAL_DEFAULTS.items():
+            if col not in df_processed.columns:
+                df_processed[col] = default
+
+        try:
+            knn_data = df_processed[KNN_IMPUTE_COLS]
+            df_processed[KNN_IMPUTE_COLS] = self.knn_imputer.transform(knn_data)
+        except Exception as e:
+            raise RuntimeError(f"KNN imputation failed: {e}")
+
+        df_processed["caffeine_missing_flag"] = df_processed["caffeine_intake"].isnull().astype(int)
+        df_processed["caffeine_intake"] = df_processed["caffeine_intake"].fillna("Unknown")
+        t = record_stage("imputation", t)
+
+        # --- C. Feature Engineering ---
+        try:
+            df_processed["bmi_cat"] = pd.cut(df_processed["bmi"], bins=BMI_BINS, labels=BMI_LABELS, right=False,
+                                             include_lowest=True)
+            df_processed["age_group"] = pd.cut(df_processed["age"], bins=AGE_BINS, labels=AGE_LABELS, right=False,
+                                               include_lowest=True)
+            df_processed["HOMA_IR"] = (df_processed["glucose"] * df_processed["insulin"]) / HOMA_IR_DIVISOR
+            df_processed["diabetes_risk_flag"] = np.where(df_processed["glucose"] > GLUCOSE_RISK_THRESHOLD, "High Risk",
+                                                          "Normal/Pre-Risk")
+        except Exception as e:
+            raise RuntimeError(f"Feature engineering failed: {e}")
+        t = record_stage("feature_engineering", t)
+
+        # --- D. Scaling ---
+        # NUM_COLS now only contains the numerical features.
+        try:
+            df_processed.loc[:, NUM_COLS] = self.standard_scaler.transform(df_processed[NUM_COLS])
+        except Exception as e:
+            raise RuntimeError(f"Standard scaling failed: {e}")
+        t = record_stage("scaling", t)
+
+        # --- E. Encoding ---
+        try:
+            # Ordinal encoding uses newly engineered categorical features
+            df_processed.loc[:, CAT_ORDINAL_COLS] = self.ordinal_encoder.transform(df_processed[CAT_ORDINAL_COLS])
+        except Exception as e:
+            raise RuntimeError(f"Ordinal encoding failed: {e}")
+        t = record_stage("ordinal_encoding", t)
+
+        try:
+            # One-Hot encoding uses original categorical features + the new 'diabetes_risk_flag'
+            onehot_encoded = self.one_hot_encoder.transform(df_processed[CAT_COLS])
+            onehot_encoded_df = pd.DataFrame(
+                onehot_encoded,
+                columns=self.one_hot_encoder.get_feature_names_out(CAT_COLS),
+                index=df_processed.index,
+            )
+        except Exception as e:
+            raise RuntimeError(f"One-hot encoding failed: {e}")
+
+        # Join numerical, ordinal-encoded, and one-hot encoded features
+        df_final = df_processed.drop(columns=CAT_COLS).join(onehot_encoded_df)
+        t = record_stage("one_hot_encoding", t)
+
+        # --- F. Final Reindex + PCA ---
+        try:
+            # Ensure all columns are present and in the correct order for PCA
+            X_for_pca = df_final.reindex(columns=self.final_features_list, fill_value=0).values
+        except Exception as e:
+            raise RuntimeError(f"Final feature reindexing failed: {e}")
+        t = record_stage("reindex", t)
+
+        try:
+            X_pca = self.pca_transformer.transform(X_for_pca)
+        except Exception as e:
+            raise RuntimeError(f"PCA transformation failed: {e}")
+        record_stage("pca", t)
+
+        if with_features:
+            return np.asarray(X_for_pca, dtype=np.float64), X_pca
+        return X_pca
+
+    def _predict_probabilities(self, X_pca: np.ndarray) -> np.ndarray:
+        """Probability of the positive class for every row, from a single pass over the trees."""
+        t = stage_clock()
+        if self.tree_evaluator is not None:
+            probabilities = self.tree_evaluator.predict_proba(X_pca)
+        else:
+            # Single rows stay on one OpenMP thread; batches get the worker's planned share of the CPUs
+            num_threads = model_threads(len(X_pca))
+            if num_threads is None:
+                probabilities = self.final_model.predict_proba(X_pca)[:, 1]
+            else:
+                probabilities = self.final_model.predict_proba(X_pca, num_threads=num_threads)[:, 1]
+        record_stage("inference", t)
+        return probabilities
+
+    def _predict_early_exit(self, X_pca: np.ndarray, margin: float) -> tuple:
+        """
+        Probabilities from only as many trees as each row needs (see
+        FlatTreeEnsemble.predict_raw_early_exit), and the trees used per row.
+        With the booster evaluator LightGBM applies the same rule, but does not
+        report where it stopped, so the tree counts are None.
+        """
+        t = stage_clock()
+        if self.tree_evaluator is not None:
+            raw, trees_used = self.tree_evaluator.predict_raw_early_exit(X_pca, margin, EARLY_EXIT_FREQ)
+            probabilities = self.tree_evaluator.probability(raw)
+            record_trees_used(trees_used)
+        else:
+            options = {"pred_early_stop": True, "pred_early_stop_margin": margin,
+                       "pred_early_stop_freq": EARLY_EXIT_FREQ}
+            num_threads = model_threads(len(X_pca))
+            if num_threads is not None:
+                options["num_threads"] = num_threads
+            probabilities = self.final_model.predict_proba(X_pca, **options)[:, 1]
+            trees_used = None
+        record_stage("inference", t)
+        return probabilities, trees_used
+
+    def make_prediction(self, X_pca: np.ndarray, early_exit_margin: float = None) -> dict:
+        """
+        Performs the final prediction using the loaded model.
+
+        With an early_exit_margin, trees stop being evaluated once the outcome is
+        that clear, and the result also reports "trees_used".
+        """
+        if early_exit_margin:
+            probabilities, trees_used = self._predict_early_exit(X_pca, early_exit_margin)
+        else:
+            probabilities, trees_used = self._predict_probabilities(X_pca), None
+        probability_of_disease = float(probabilities[0])
+        # LGBMClassifier.predict is the argmax over [1 - p, p]
+        predicted_class = int(probability_of_disease > 1 - probability_of_disease)
+        prediction_label = "Disease" if predicted_class == 1 else "No Disease"
+
+        result = {
+            "prediction_label": prediction_label,
+            "probability_of_disease": round(probability_of_disease, 4),
+        }
+        if early_exit_margin:
+            result["trees_used"] = None if trees_used is None else int(trees_used[0])
+        return result
+
+    def make_batch_prediction(self, X_pca: np.ndarray, early_exit_margin: float = None) -> list:
+        """Scores every row of an N-row PCA matrix in a single pass over the model."""
+        if early_exit_margin:
+            probabilities, trees_used = self._predict_early_exit(X_pca, early_exit_margin)
+        else:
+            probabilities = self._predict_probabilities(X_pca)
+        # LGBMClassifier.predict is the argmax over [1 - p, p], so the class is
+        # derived here instead of running the ensemble a second time.
+        predicted_classes = probabilities > 1 - probabilities
+
+        results = [
+            {
+                "prediction_label": "Disease" if predicted_class else "No Disease",
+                "probability_of_disease": round(float(probability), 4),
+            }
+            for probability, predicted_class in zip(probabilities, predicted_classes)
+        ]
+        if early_exit_margin:
+            for i, result in enumerate(results):
+                result["trees_used"] = None if trees_used is None else int(trees_used[i])
+        return results
+
+    def predict_records(self, records: list, early_exit_margin: float = None) -> list:
+        """
+        Preprocesses and scores a list of input dicts in one pass. Unlike score_batch,
+        a failure is raised for the whole list (used by the micro-batcher, which
+        isolates failing records itself).
+        """
+        return self.make_batch_prediction(self.preprocess_records(records), early_exit_margin)
+
+    def explain_records(self, records: list) -> list:
+        """
+        predict_records (every tree, no early exit) with an "explanation" per
+        result: the margin attributed to each FINAL_FEATURES_LIST feature and
+        input field (see explain.Explainer), plus the base value they add to.
+        """
+        if self.explainer is None:
+            raise RuntimeError("Explanation failed: no explainer for this model bundle")
+        record_batch_size(len(records))
+        if self.transform_plan is not None:
+            plan = self.transform_plan
+            prepared = plan.prepare_features(plan.columns_from(records), len(records))
+            X_pca = plan.project(*prepared)
+            X_features = plan.scaled_features(*prepared)
+        else:
+            import pandas as pd
+            X_features, X_pca = self._preprocess_input_pandas(pd.DataFrame(records, columns=USER_INPUT_COLUMNS),
+                                                              with_features=True)
+        results = self.make_batch_prediction(X_pca)
+
+        t = stage_clock()
+        try:
+            if self.explain_method == "path":
+                contributions = self.tree_evaluator.predict_contributions(X_pca)
+            else:
+                num_threads = model_threads(len(X_pca))
+                options = {} if num_threads is None else {"num_threads": num_threads}
+                contributions = self.final_model.predict_proba(X_pca, pred_contrib=True, **options)
+            explanations = self.explainer.explain(X_features, contributions, self.explain_method)
+        except Exception as e:
+            raise RuntimeError(f"Explanation failed: {e}")
+        record_stage("explain", t)
+
+        for result, explanation in zip(results, explanations):
+            result["explanation"] = explanation
+        return results
+
+    def score_batch(self, batch, early_exit_margin: float = None) -> list:
+        """
+        Preprocesses and scores a batch (an N-row DataFrame or a list of input dicts)
+        in one vectorized pass. early_exit_margin is make_batch_prediction's.
+
+        Returns one result dict per input row, in order. If the batch as a whole
+        fails, it is bisected so that only the offending rows come back as
+        {"error": ...} entries while the rest are still scored in bulk.
+        """
+        if hasattr(batch, "iloc"):  # DataFrame, without importing pandas
+            return self._score_isolating(batch, len(batch), lambda b, idx: b.iloc[idx],
+                                         lambda b, n: self.preprocess_input(b), TransformPlan.columns_from,
+                                         self._batch_predict(early_exit_margin))
+        return self._score_isolating(batch, len(batch), lambda b, idx: [b[i] for i in idx],
+                                     lambda b, n: self.preprocess_records(b), TransformPlan.columns_from,
+                                     self._batch_predict(early_exit_margin))
+
+    def score_columns(self, columns: dict, n_rows: int, early_exit_margin: float = None) -> list:
+        """score_batch for column-oriented input (column name -> n_rows values), e.g. a decoded Arrow batch."""
+        return self._score_isolating(columns, n_rows, _take_columns, self.preprocess_columns, lambda b: b,
+                                     self._batch_predict(early_exit_margin))
+
+    def score_sweep(self, record: dict, varied: dict, n_rows: int, early_exit_margin: float = None) -> list:
+        """
+        score_batch for n_rows copies of one input dict in which only the `varied`
+        columns (column -> n_rows values) change, e.g. a what-if sweep. In compiled
+        mode the record's unchanged columns are sanitized and imputed once for
+        all rows (see TransformPlan.sweep_base).
+        """
+        plan = self.transform_plan
+        if plan is None:
+            return self.score_batch([{**record, **{col: values[i] for col, values in varied.items()}}
+                                     for i in range(n_rows)], early_exit_margin)
+
+        base = plan.sweep_base(record, varied)
+
+        def preprocess(batch, n):
+            record_batch_size(n)
+            return plan.transform_sweep(base, batch, n)
+
+        def columns_of(batch):
+            n = len(next(iter(batch.values())))
+            return {**{col: [value] * n for col, value in record.items()}, **batch}
+
+        return self._score_isolating(varied, n_rows, _take_columns, preprocess, columns_of,
+                                     self._batch_predict(early_exit_margin))
+
+    def explain_batch(self, records: list) -> list:
+        """score_batch for a list of input dicts, with the explanations of explain_records."""
+        return self._score_isolating(records, len(records), lambda b, idx: [b[i] for i in idx],
+                                     lambda b, n: b, TransformPlan.columns_from, self.explain_records)
+
+    def _batch_predict(self, early_exit_margin: float = None):
+        """make_batch_prediction with early_exit_margin, as a predict step for _score_isolating."""
+        if not early_exit_margin:
+            return self.make_batch_prediction
+        return lambda X_pca: self.make_batch_prediction(X_pca, early_exit_margin)
+
+    def _score_isolating(self, batch, n_rows: int, take, preprocess, columns_of, predict=None) -> list:
+        """
+        Scores `batch` in one pass, isolating failing rows if that fails.
+        take(batch, indices) selects rows, preprocess(batch, n_rows) runs the
+        pipeline, predict (make_batch_prediction by default) scores its output,
+        and columns_of(batch) gives the column view suspect_rows reads.
+        """
+        if n_rows == 0:
+            return []
+        predict = predict or self.make_batch_prediction
+
+        def score(indices):
+            return self._score_isolating(take(batch, indices), len(indices), take, preprocess, columns_of, predict)
+
+        try:
+            return predict(preprocess(batch, n_rows))
+        except Exception as e:
+            if n_rows == 1:
+                return [{"error": str(e)}]
+
+        # Rows the compiled plan flags as likely failures are scored one by one and the
+        # rest in bulk, instead of re-running the whole batch at every bisection level
+        plan = self.transform_plan
+        if plan is not None and n_rows > 2:
+            try:
+                suspect = plan.suspect_rows(columns_of(batch), n_rows)
+            except Exception:
+                suspect = None
+            if suspect is not None and 0 < suspect.sum() < n_rows:
+                results = [None] * n_rows
+                clean = np.flatnonzero(~suspect)
+                for i, result in zip(clean, score(clean)):
+                    results[i] = result
+                for i in np.flatnonzero(suspect):
+                    results[i] = score([i])[0]
+                return results
+
+        middle = n_rows // 2
+        return score(np.arange(middle)) + score(np.arange(middle, n_rows))
+
+
+def _take_columns(columns: dict, indices) -> dict:
+    """Rows `indices` of column-oriented input (NumPy arrays or lists)."""
+    return {
+        col: values[indices] if isinstance(values, np.ndarray) else [values[i] for i in indices]
+        for col, values in columns.items()
+    }
 
-def _sanitize_and_coerce(df: pd.DataFrame) -> pd.DataFrame:
-    """Prepare DataFrame for transformations."""
-    df = df.copy()
 
-    # Coerce numeric for imputation columns (including raw inputs that might be numeric)
-    # NOTE: We include all raw numerical inputs here to ensure they are float/int
-    raw_num_cols = [c for c in NUM_COLS if c not in ['caffeine_missing_flag', 'HOMA_IR']]
+def _load_artifact(path):
+    """
+    Loads one joblib artifact. With ASSET_MMAP_MODE set, the NumPy arrays inside
+    (e.g. the KNN imputer's training matrix) are memory-mapped from the file
+    instead of copied, so every process reading them shares the same page cache.
+    """
+    return joblib.load(path, mmap_mode=ASSET_MMAP_MODE)
 
-    # We must ensure all columns that should be numerical (raw or imputed) are converted
-    for col in set(raw_num_cols):
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-        else:
-            # Handle case where a required input column is entirely missing
-            df[col] = np.nan
 
-    # Sanitize categoricals for one-hot (including the newly moved 'stress_level')
-    if ONE_HOT_ENCODER is not None and hasattr(ONE_HOT_ENCODER, "categories_"):
-        for i, col in enumerate(CAT_COLS):
-            if col not in df.columns:
-                continue
-            allowed = set(ONE_HOT_ENCODER.categories_[i].tolist())
-            fallback = None
-            for cand in ["Unknown", "Other", "Undefined", "missing"]:
-                if cand in allowed:
-                    fallback = cand
-                    break
-            if fallback is None and len(allowed) > 0:
-                fallback = next(iter(allowed))
+def artifact_paths(models_dir=None) -> dict:
+    """{Predictor field: file} for a bundle directory (the configured paths if None)."""
+    if models_dir is None:
+        return dict(ARTIFACT_PATHS)
+    return {name: Path(models_dir) / Path(path).name for name, path in ARTIFACT_PATHS.items()}
 
-            df[col] = df[col].where(df[col].isin(allowed), fallback)
 
-    return df
+def bundle_path(models_dir=None) -> Path:
+    """The bundle file of a directory (or models_dir itself if it is a file; MODEL_BUNDLE_PATH if None)."""
+    if models_dir is None:
+        return Path(MODEL_BUNDLE_PATH)
+    if Path(models_dir).is_file():
+        return Path(models_dir)
+    return Path(models_dir) / Path(MODEL_BUNDLE_PATH).name
 
 
-def load_assets():
-    """Loads all trained model and preprocessing assets."""
-    global FINAL_MODEL, STANDARD_SCALER, ORDINAL_ENCODER, ONE_HOT_ENCODER, KNN_IMPUTER, PCA_TRANSFORMER, FINAL_FEATURES_LIST
+def _uses_bundle(models_dir, model_format: str) -> bool:
+    """
+    Whether load_predictor() reads the bundle. In "auto" mode that is the bundle
+    when it exists, unless a .joblib artifact next to it is newer: a bundle left
+    behind after new artifacts were copied in must not shadow them.
+    """
+    if model_format not in ("auto", "bundle", "joblib"):
+        raise ValueError(f"Unknown MODEL_FORMAT: {model_format}")
+    if model_format != "auto":
+        return model_format == "bundle"
+    bundle = bundle_path(models_dir)
+    if not bundle.exists():
+        return False
+    joblib_mtimes = [path.stat().st_mtime_ns for path in map(Path, artifact_paths(models_dir).values())
+                     if path.exists()]
+    if joblib_mtimes and max(joblib_mtimes) > bundle.stat().st_mtime_ns:
+        print(f"Warning: {bundle} is older than the .joblib artifacts next to it; loading the artifacts "
+              f"(re-run `python model_bundle.py convert` to rebuild it)")
+        return False
+    return True
+
+
+def assets_fingerprint(models_dir=None, model_format: str = MODEL_FORMAT) -> str:
+    """
+    Short hash of the size and modification time of every asset file load_predictor()
+    would read. In "auto" mode it covers the bundle and the .joblib files alike, so
+    changing either (and with it, possibly, which one is read) changes it.
+    """
+    if model_format == "auto" and bundle_path(models_dir).exists():
+        paths = [bundle_path(models_dir)] + [path for path in map(Path, artifact_paths(models_dir).values())
+                                             if path.exists()]
+    elif _uses_bundle(models_dir, model_format):
+        paths = [bundle_path(models_dir)]
+    else:
+        paths = artifact_paths(models_dir).values()
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = Path(path).stat()
+        digest.update(f"{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def load_predictor(models_dir=None, model_format: str = MODEL_FORMAT) -> Predictor:
+    """
+    Loads a complete set of artifacts (from models_dir, or the configured paths)
+    into a new Predictor, compiling the fast paths the configuration asks for.
+    Reads the single-file bundle or the .joblib files depending on model_format.
+    Does not put the predictor in service: see activate().
+    """
+    if _uses_bundle(models_dir, model_format):
+        return _load_predictor_from_bundle(bundle_path(models_dir))
 
-    print("Attempting to load model and preprocessors...")
+    paths = artifact_paths(models_dir)
+    print(f"Attempting to load model and preprocessors from {Path(paths['final_model']).parent}...")
     try:
-        FINAL_MODEL = joblib.load(FINAL_MODEL_PATH)
-        STANDARD_SCALER = joblib.load(STANDARD_SCALER_PATH)
-        ORDINAL_ENCODER = joblib.load(ORDINAL_ENCODER_PATH)
-        ONE_HOT_ENCODER = joblib.load(ONE_HOT_ENCODER_PATH)
-        KNN_IMPUTER = joblib.load(KNN_IMPUTER_PATH)
-        PCA_TRANSFORMER = joblib.load(PCA_TRANSFORMER_PATH)
+        version = assets_fingerprint(models_dir, "joblib")
+        artifacts = {name: _load_artifact(path) for name, path in paths.items() if name != "final_features_list"}
+        with open(paths["final_features_list"], "r") as f:
+            artifacts["final_features_list"] = json.load(f)
+        # Files replaced while they were being read would give a mixed set
+        if assets_fingerprint(models_dir, "joblib") != version:
+            raise RuntimeError("Asset files changed while they were being loaded")
+        print("All assets loaded successfully!")
+    except FileNotFoundError as e:
+        print(f"Error: Required asset not found: {e.filename}")
+        raise
+    except Exception as e:
+        print(f"An unexpected error occurred during asset loading: {e}")
+        raise
+    return _compile_predictor(version, str(Path(paths["final_model"]).parent), artifacts)
 
-        with open(FINAL_FEATURES_LIST_PATH, "r") as f:
-            FINAL_FEATURES_LIST = json.load(f)
 
-        print("All assets loaded successfully!")
+def _load_predictor_from_bundle(path: Path) -> Predictor:
+    from model_bundle import load_bundle
+
+    print(f"Attempting to load model bundle {path}...")
+    try:
+        manifest, artifacts, tree_evaluator = load_bundle(path)
+        print(f"Model bundle {manifest['bundle_version']} loaded ({manifest['created_at']}).")
     except FileNotFoundError as e:
         print(f"Error: Required asset not found: {e.filename}")
         raise
     except Exception as e:
         print(f"An unexpected error occurred during asset loading: {e}")
         raise
+    return _compile_predictor(manifest["bundle_version"], str(path), artifacts, tree_evaluator)
+
+
+def _compile_predictor(version: str, source: str, artifacts: dict, tree_evaluator=None) -> Predictor:
+    """Predictor over loaded artifacts, with the fast paths compiled (a bundle brings its flattened trees)."""
+    # Compile the fitted artifacts into the NumPy fast path. The pandas pipeline
+    # stays available as the reference, so a failure here is not fatal.
+    transform_plan = None
+    knn_index = None
+    # The compact imputer replaces KNNImputer on both pipelines, so its float64
+    # training matrix is not kept
+    if KNN_ENGINE == "compact":
+        try:
+            compact = build_compact_knn(artifacts["knn_imputer"], KNN_COMPACT_SIZE or None, KNN_COMPACT_METHOD)
+            artifacts = {**artifacts, "knn_imputer": compact}
+            print(f"Compact KNN imputer built ({len(compact.reference)} reference rows, float32).")
+        except Exception as e:
+            print(f"Could not build compact KNN imputer, using KNNImputer: {e}")
+    if PREPROCESS_MODE == "compiled":
+        if KNN_ENGINE == "indexed":
+            try:
+                knn_index = build_knn_index(artifacts["knn_imputer"])
+                print("KNN imputation index built.")
+            except Exception as e:
+                print(f"Could not build KNN imputation index, using KNNImputer: {e}")
+        try:
+            transform_plan = compile_transform_plan(
+                artifacts["one_hot_encoder"], artifacts["ordinal_encoder"], artifacts["standard_scaler"],
+                knn_index or artifacts["knn_imputer"], artifacts["pca_transformer"], artifacts["final_features_list"]
+            )
+            print("Transform plan compiled.")
+        except Exception as e:
+            print(f"Could not compile transform plan, using the pandas pipeline: {e}")
+
+    # Flatten the booster for the prediction step (a bundle stores it flattened and
+    # checked already); the parity check against LightGBM runs here, and any
+    # mismatch keeps the booster in charge.
+    if MODEL_EVALUATOR != "flat":
+        tree_evaluator = None
+    elif tree_evaluator is None:
+        try:
+            tree_evaluator = compile_tree_ensemble(artifacts["final_model"])
+            print(f"Tree evaluator compiled ({tree_evaluator.n_trees} trees, parity check passed).")
+        except Exception as e:
+            print(f"Could not compile tree evaluator, using the LightGBM booster: {e}")
+
+    # Maps attributions back through the PCA loadings; without it only explanations fail
+    try:
+        explainer = compile_explainer(artifacts["pca_transformer"], artifacts["final_features_list"])
+    except Exception as e:
+        explainer = None
+        print(f"Could not compile explainer, explanations are disabled: {e}")
 
+    return Predictor(
+        version=version, source=source, transform_plan=transform_plan,
+        knn_index=knn_index, tree_evaluator=tree_evaluator, explainer=explainer, **artifacts
+    )
 
-def preprocess_input(input_df: pd.DataFrame) -> np.ndarray:
+
+def activate(predictor: Predictor) -> Predictor:
     """
-    Applies full preprocessing (Imputation, Feature Engineering,
-    Scaling/Encoding, PCA) to raw input DataFrame.
+    Puts `predictor` in service with a single reference assignment, keeping the
+    one it replaces for rollback() (up to MODEL_HISTORY_SIZE). Returns the replaced one.
     """
-    if FINAL_MODEL is None or FINAL_FEATURES_LIST is None:
+    global ACTIVE_PREDICTOR
+
+    with _swap_lock:
+        previous = ACTIVE_PREDICTOR
+        if previous is not None and previous is not predictor and MODEL_HISTORY_SIZE > 0:
+            PREVIOUS_PREDICTORS.append(previous)
+            del PREVIOUS_PREDICTORS[:-MODEL_HISTORY_SIZE]
+        ACTIVE_PREDICTOR = predictor
+    return previous
+
+
+def rollback() -> Predictor:
+    """Re-activates the most recently replaced predictor; the active one is dropped."""
+    global ACTIVE_PREDICTOR
+
+    with _swap_lock:
+        if not PREVIOUS_PREDICTORS:
+            raise RuntimeError("Rollback failed: no previous model bundle is loaded")
+        ACTIVE_PREDICTOR = PREVIOUS_PREDICTORS.pop()
+        return ACTIVE_PREDICTOR
+
+
+def current_predictor() -> Predictor:
+    """The predictor in service. Read it once per request and use it throughout."""
+    predictor = ACTIVE_PREDICTOR
+    if predictor is None:
         raise RuntimeError("Model assets not loaded. Call load_assets() first.")
+    return predictor
 
-    # --- A. Sanitize ---
-    try:
-        df_processed = _sanitize_and_coerce(input_df)
-    except Exception as e:
-        raise RuntimeError(f"Input validation/coercion failed: {e}")
 
-    # --- B. Imputation & Flags ---
-    df_processed["exercise_type"] = df_processed.get("exercise_type").fillna("Undefined")
+def load_assets(models_dir=None) -> Predictor:
+    """Loads all trained model and preprocessing assets and puts them in service."""
+    predictor = load_predictor(models_dir)
+    activate(predictor)
+    return predictor
 
-    # Convert stress_level to numerical values to match training
-    stress_level_mapping = {
-        'Low': 1,
-        'Medium': 2, 
-        'High': 3
-    }
-    if 'stress_level' in df_processed.columns:
-        df_processed['stress_level'] = df_processed['stress_level'].map(stress_level_mapping).fillna(2)  # Default to Medium
-
-    # Map user input features to training features
-    # Create missing categorical features with default values
-    if 'sleep_quality' not in df_processed.columns:
-        df_processed['sleep_quality'] = 'Good'  # Default value
-    
-    if 'smoking_level' not in df_processed.columns:
-        # Map smoking_status to smoking_level
-        smoking_mapping = {
-            'Never': 'Non-smoker',
-            'Former Smoker': 'Non-smoker', 
-            'Current Smoker': 'Light',
-            'Heavy Smoker': 'Heavy'
-        }
-        if 'smoking_status' in df_processed.columns:
-            df_processed['smoking_level'] = df_processed['smoking_status'].map(smoking_mapping).fillna('Non-smoker')
-        else:
-            df_processed['smoking_level'] = 'Non-smoker'
-    
-    if 'occupation' not in df_processed.columns:
-        df_processed['occupation'] = 'Engineer'  # Default value
-    
-    if 'diet_type' not in df_processed.columns:
-        # Map dietary_habits to diet_type
-        diet_mapping = {
-            'Balanced': 'Omnivore',
-            'Vegetarian': 'Vegetarian',
-            'Vegan': 'Vegan',
-            'Keto': 'Keto',
-            'High Protein': 'Omnivore',
-            'Low Carb': 'Keto'
-        }
-        if 'dietary_habits' in df_processed.columns:
-            df_processed['diet_type'] = df_processed['dietary_habits'].map(diet_mapping).fillna('Omnivore')
-        else:
-            df_processed['diet_type'] = 'Omnivore'
-    
-    if 'device_usage' not in df_processed.columns:
-        df_processed['device_usage'] = 'Moderate'  # Default value
-    
-    if 'healthcare_access' not in df_processed.columns:
-        df_processed['healthcare_access'] = 'Moderate'  # Default value
-    
-    if 'insurance' not in df_processed.columns:
-        df_processed['insurance'] = 'Yes'  # Default value
-    
-    if 'sunlight_exposure' not in df_processed.columns:
-        df_processed['sunlight_exposure'] = 'Moderate'  # Default value
-    
-    if 'family_history' not in df_processed.columns:
-        df_processed['family_history'] = 'No'  # Default value
-    
-    if 'pet_owner' not in df_processed.columns:
-        df_processed['pet_owner'] = 'No'  # Default value
 
-    try:
-        knn_data = df_processed[KNN_IMPUTE_COLS]
-        df_processed[KNN_IMPUTE_COLS] = KNN_IMPUTER.transform(knn_data)
-    except Exception as e:
-        raise RuntimeError(f"KNN imputation failed: {e}")
+# The functions below run on whichever predictor is active when they are called.
+# Code making several calls for one result (preprocess, then predict) should take
+# current_predictor() once and call its methods instead.
 
-    df_processed["caffeine_missing_flag"] = df_processed["caffeine_intake"].isnull().astype(int)
-    df_processed["caffeine_intake"] = df_processed["caffeine_intake"].fillna("Unknown")
+def prediction_cache_key(record: dict, early_exit_margin: float = None, explain: bool = False) -> str:
+    return current_predictor().cache_key(record, early_exit_margin, explain)
 
-    # --- C. Feature Engineering ---
-    try:
-        df_processed["bmi_cat"] = pd.cut(df_processed["bmi"], bins=BMI_BINS, labels=BMI_LABELS, right=False,
-                                         include_lowest=True)
-        df_processed["age_group"] = pd.cut(df_processed["age"], bins=AGE_BINS, labels=AGE_LABELS, right=False,
-                                           include_lowest=True)
-        df_processed["HOMA_IR"] = (df_processed["glucose"] * df_processed["insulin"]) / HOMA_IR_DIVISOR
-        df_processed["diabetes_risk_flag"] = np.where(df_processed["glucose"] > GLUCOSE_RISK_THRESHOLD, "High Risk",
-                                                      "Normal/Pre-Risk")
-    except Exception as e:
-        raise RuntimeError(f"Feature engineering failed: {e}")
 
-    # --- D. Scaling ---
-    # NUM_COLS now only contains the numerical features.
-    try:
-        df_processed.loc[:, NUM_COLS] = STANDARD_SCALER.transform(df_processed[NUM_COLS])
-    except Exception as e:
-        raise RuntimeError(f"Standard scaling failed: {e}")
+def preprocess_input(input_df: pd.DataFrame) -> np.ndarray:
+    return current_predictor().preprocess_input(input_df)
 
-    # --- E. Encoding ---
-    try:
-        # Ordinal encoding uses newly engineered categorical features
-        df_processed.loc[:, CAT_ORDINAL_COLS] = ORDINAL_ENCODER.transform(df_processed[CAT_ORDINAL_COLS])
-    except Exception as e:
-        raise RuntimeError(f"Ordinal encoding failed: {e}")
 
-    try:
-        # One-Hot encoding uses original categorical features + the new 'diabetes_risk_flag'
-        onehot_encoded = ONE_HOT_ENCODER.transform(df_processed[CAT_COLS])
-        onehot_encoded_df = pd.DataFrame(
-            onehot_encoded,
-            columns=ONE_HOT_ENCODER.get_feature_names_out(CAT_COLS),
-            index=df_processed.index,
-        )
-    except Exception as e:
-        raise RuntimeError(f"One-hot encoding failed: {e}")
+def preprocess_records(records: list) -> np.ndarray:
+    return current_predictor().preprocess_records(records)
 
-    # Join numerical, ordinal-encoded, and one-hot encoded features
-    df_final = df_processed.drop(columns=CAT_COLS).join(onehot_encoded_df)
 
-    # --- F. Final Reindex + PCA ---
-    try:
-        # Ensure all columns are present and in the correct order for PCA
-        X_for_pca = df_final.reindex(columns=FINAL_FEATURES_LIST, fill_value=0).values
-    except Exception as e:
-        raise RuntimeError(f"Final feature reindexing failed: {e}")
+def _preprocess_input_pandas(input_df: pd.DataFrame) -> np.ndarray:
+    return current_predictor()._preprocess_input_pandas(input_df)
 
-    try:
-        X_pca = PCA_TRANSFORMER.transform(X_for_pca)
-    except Exception as e:
-        raise RuntimeError(f"PCA transformation failed: {e}")
 
-    return X_pca
+def make_prediction(X_pca: np.ndarray, early_exit_margin: float = None) -> dict:
+    return current_predictor().make_prediction(X_pca, early_exit_margin)
 
 
-def make_prediction(X_pca: np.ndarray) -> dict:
-    """Performs the final prediction using the loaded model."""
-    if FINAL_MODEL is None:
-        raise RuntimeError("Model assets not loaded. Call load_assets() first.")
+def make_batch_prediction(X_pca: np.ndarray, early_exit_margin: float = None) -> list:
+    return current_predictor().make_batch_prediction(X_pca, early_exit_margin)
 
-    probability_of_disease = FINAL_MODEL.predict_proba(X_pca)[:, 1][0]
-    predicted_class = FINAL_MODEL.predict(X_pca)[0]
-    prediction_label = "Disease" if predicted_class == 1 else "No Disease"
 
-    return {
-        "prediction_label": prediction_label,
-        "probability_of_disease": round(probability_of_disease, 4),
-    }
\ No newline at end of file
+def predict_records(records: list, early_exit_margin: float = None) -> list:
+    return current_predictor().predict_records(records, early_exit_margin)
+
+
+def explain_records(records: list) -> list:
+    return current_predictor().explain_records(records)
+
+
+def score_batch(batch, early_exit_margin: float = None) -> list:
+    return current_predictor().score_batch(batch, early_exit_margin)
+
+
+def score_columns(columns: dict, n_rows: int, early_exit_margin: float = None) -> list:
+    return current_predictor().score_columns(columns, n_rows, early_exit_margin)
+
+
+def score_sweep(record: dict, varied: dict, n_rows: int, early_exit_margin: float = None) -> list:
+    return current_predictor().score_sweep(record, varied, n_rows, early_exit_margin)
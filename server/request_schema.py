@@ -0,0 +1,306 @@
+# request_schema.py
+#
+# Validation of the input records of /predict, /predict_batch and /predict_sweep,
+# compiled once from USER_INPUT_COLUMNS, the numeric/categorical split in config.py
+# and the ranges and options of the frontend form (client/src/validate_fields.js).
+# The form definitions are snapshotted into field_specs.json, since the server
+# image does not ship the client; `python request_schema.py sync` refreshes it.
+#
+# A payload is checked and converted into a record of floats and strings in a
+# single pass over the fields, and every problem is reported as a structured
+# field error: {"field": ..., "code": ..., "message": ...}. Column-oriented
+# batches (Arrow, MessagePack) are checked the same way, a column at a time.
+
+import argparse
+import json
+import math
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from config import USER_INPUT_COLUMNS, NUM_COLS, KNN_IMPUTE_COLS, FIELD_SPECS_PATH, REQUEST_VALIDATION
+from transform_plan import _to_number
+
+FIELD_DEFINITIONS_PATH = Path(__file__).resolve().parent.parent / "client" / "src" / "validate_fields.js"
+
+# "strict": types, ranges and options; "ranges": types and ranges (unknown categories
+# still fall back as before); "off": only the presence of every field
+VALIDATION_MODES = ("strict", "ranges", "off")
+
+MISSING_FIELDS_ERROR = "Missing required features in input data"
+INVALID_FIELDS_ERROR = "Invalid input data"
+
+_FIELD_PATTERN = re.compile(r"\{\s*id:\s*'(?P<id>\w+)'(?P<body>[^{}]*)\}")
+_OPTIONS_PATTERN = re.compile(r"options:\s*\[(?P<options>[^\]]*)\]")
+_NUMBER_PATTERN = r"{}:\s*(-?[0-9.]+)"
+
+_ABSENT = object()
+
+_NONE_TYPE = type(None)
+# Element types of a column that converts to float64 as it is
+_NUMBER_TYPES = {float, int, _NONE_TYPE, np.float64, np.float32, np.int64, np.int32}
+_STRING_TYPES = {str, np.str_, _NONE_TYPE}
+
+
+def parse_field_definitions(source: str, path="validate_fields.js") -> dict:
+    """
+    Field id -> {"type": "number", "min", "max", "step"} or {"type": "select", "options"},
+    parsed from the FIELD_DEFINITIONS object of validate_fields.js.
+    """
+    specs = {}
+    for match in _FIELD_PATTERN.finditer(source):
+        body = match.group("body")
+        options = _OPTIONS_PATTERN.search(body)
+        if options:
+            specs[match.group("id")] = {
+                "type": "select",
+                "options": re.findall(r"'([^']*)'", options.group("options")),
+            }
+            continue
+        bounds = {}
+        for key in ("min", "max", "step"):
+            number = re.search(_NUMBER_PATTERN.format(key), body)
+            if number:
+                bounds[key] = float(number.group(1))
+        if "min" not in bounds or "max" not in bounds:
+            raise RuntimeError(f"Field '{match.group('id')}' in {path} has no min/max range")
+        specs[match.group("id")] = {"type": "number", "step": 1.0, **bounds}
+    if not specs:
+        raise RuntimeError(f"No field definitions found in {path}")
+    return specs
+
+
+def load_field_specs(path=FIELD_SPECS_PATH) -> dict:
+    """The field specs snapshot (field_specs.json)."""
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Cannot read the field specs at {path}: {e}")
+
+
+def _field_error(field: str, code: str, message: str, **details) -> dict:
+    return {"field": field, "code": code, "message": f"{field} {message}", **details}
+
+
+class RequestSchema:
+    """
+    Compiled checks for one input record. Numeric fields accept numbers and
+    numeric strings and come out as floats; the KNN-imputed ones may also be
+    null or "" (imputed). Categorical fields accept strings or null (the pipeline
+    falls back for null and, unless the mode is "strict", unknown values).
+    """
+
+    def __init__(self, specs: dict, mode: str = REQUEST_VALIDATION):
+        if mode not in VALIDATION_MODES:
+            raise ValueError(f"Unknown validation mode '{mode}' (expected one of {VALIDATION_MODES})")
+        self.mode = mode
+        check_ranges = mode in ("strict", "ranges")
+        self.fields = []
+        for name in USER_INPUT_COLUMNS:
+            spec = specs.get(name)
+            # Fields the form does not define follow config.py, without a range
+            numeric = spec["type"] == "number" if spec else name in NUM_COLS
+            if numeric:
+                low, high = (spec["min"], spec["max"]) if spec and check_ranges else (-math.inf, math.inf)
+                options = None
+            else:
+                low = high = None
+                options = frozenset(spec["options"]) if spec and mode == "strict" else None
+            self.fields.append((name, numeric, name in KNN_IMPUTE_COLS, low, high, options))
+
+    def parse(self, payload) -> tuple:
+        """(record, []) for a valid payload, (None, field errors) otherwise."""
+        if not isinstance(payload, dict):
+            return None, [_field_error("record", "type", "must be a JSON object")]
+        if self.mode == "off":
+            missing = [col for col in USER_INPUT_COLUMNS if col not in payload]
+            return (None, [_field_error(col, "missing", "is required") for col in missing]) if missing \
+                else (payload, [])
+
+        record = {}
+        errors = []
+        for name, numeric, nullable, low, high, options in self.fields:
+            value = payload.get(name, _ABSENT)
+            if value is _ABSENT:
+                errors.append(_field_error(name, "missing", "is required"))
+            elif numeric:
+                value_type = type(value)
+                if value_type is float or value_type is int:
+                    number = float(value)
+                elif value is None or value == "":
+                    number = math.nan
+                elif value_type is str:
+                    number = _to_number(value)
+                    if math.isnan(number):
+                        errors.append(_field_error(name, "type", "must be a number"))
+                        continue
+                else:
+                    errors.append(_field_error(name, "type", "must be a number"))
+                    continue
+                if math.isnan(number):
+                    if nullable:
+                        record[name] = None
+                    else:
+                        errors.append(_field_error(name, "null", "must not be empty"))
+                elif not low <= number <= high:
+                    errors.append(_field_error(name, "range", f"must be between {low:g} and {high:g}",
+                                               min=low, max=high))
+                else:
+                    record[name] = number
+            elif value is None or (type(value) is str and (options is None or value in options)):
+                record[name] = value
+            elif type(value) is str:
+                errors.append(_field_error(name, "option", "is not one of the allowed values",
+                                           allowed=sorted(options)))
+            else:
+                errors.append(_field_error(name, "type", "must be a string"))
+        return (None, errors) if errors else (record, errors)
+
+    def parse_columns(self, columns: dict, n_rows: int) -> tuple:
+        """
+        parse() for column-oriented input (column name -> n_rows values, e.g. a
+        decoded Arrow batch), checked a column at a time. Returns (the columns
+        of the valid rows, the indices of those rows, {row index: field errors}).
+        Numeric columns come back as float64 arrays, NaN where imputed.
+        """
+        row_errors = {}
+        rejected = np.zeros(n_rows, dtype=bool)
+
+        def report(mask, field, code, message, **details):
+            for i in np.flatnonzero(mask):
+                row_errors.setdefault(int(i), []).append(_field_error(field, code, message, **details))
+            rejected[mask] = True
+
+        typed = {}
+        for field in self.fields:
+            values = columns.get(field[0])
+            if values is None:
+                report(np.ones(n_rows, dtype=bool), field[0], "missing", "is required")
+            else:
+                typed[field[0]] = self._parse_column(field, values, n_rows, report)
+
+        valid = np.flatnonzero(~rejected)
+        if len(valid) < n_rows:
+            typed = {
+                name: values[valid] if isinstance(values, np.ndarray) else [values[i] for i in valid]
+                for name, values in typed.items()
+            }
+        return typed, valid, row_errors
+
+    def parse_values(self, name: str, values) -> tuple:
+        """
+        The checks of field `name` applied to each of `values` (e.g. the points
+        of a sweep), typed like a column of parse_columns. Returns (the typed
+        values, {position in values: field errors}).
+        """
+        field = next(field for field in self.fields if field[0] == name)
+        errors = {}
+
+        def report(mask, field_name, code, message, **details):
+            for i in np.flatnonzero(mask):
+                errors.setdefault(int(i), []).append(_field_error(field_name, code, message, **details))
+
+        return self._parse_column(field, values, len(values), report), errors
+
+    def _parse_column(self, field: tuple, values, n_rows: int, report):
+        """One column of parse_columns: its typed values, with report(mask, field, code, message) per problem."""
+        name, numeric, nullable, low, high, options = field
+        if self.mode == "off":
+            return values
+        if numeric:
+            numbers, wrong_type = _numeric_column(values)
+            report(wrong_type, name, "type", "must be a number")
+            null = np.isnan(numbers) & ~wrong_type
+            if not nullable:
+                report(null, name, "null", "must not be empty")
+            with np.errstate(invalid="ignore"):
+                out_of_range = ~((numbers >= low) & (numbers <= high)) & ~null & ~wrong_type
+            report(out_of_range, name, "range", f"must be between {low:g} and {high:g}", min=low, max=high)
+            return numbers
+
+        wrong_type = _string_column_errors(values)
+        report(wrong_type, name, "type", "must be a string")
+        if wrong_type.any():
+            values = [None if wrong else value for value, wrong in zip(values, wrong_type)]
+        if options is not None and set(values) - options - {None}:
+            unknown = np.fromiter((value is not None and value not in options for value in values),
+                                  dtype=bool, count=n_rows)
+            report(unknown, name, "option", "is not one of the allowed values", allowed=sorted(options))
+        return np.asarray(values, dtype=object)
+
+
+def _numeric_column(values) -> tuple:
+    """
+    (float64 array, mask of values that are not numbers) for one numeric column,
+    with null and "" as NaN. Applies parse()'s rules value by value only when the
+    column holds anything but numbers and nulls.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "fiu":
+        return values.astype(np.float64, copy=False), np.zeros(len(values), dtype=bool)
+    if isinstance(values, np.ndarray) and values.dtype.kind == "b":
+        return np.full(len(values), np.nan), np.ones(len(values), dtype=bool)
+    if set(map(type, values)) <= _NUMBER_TYPES:
+        return np.array(values, dtype=np.float64), np.zeros(len(values), dtype=bool)
+
+    numbers = np.full(len(values), np.nan)
+    wrong_type = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        value_type = type(value)
+        if value_type in _NUMBER_TYPES:
+            if value is not None:
+                numbers[i] = value
+        elif value_type is str or value_type is np.str_:
+            if value != "":
+                numbers[i] = _to_number(value)
+                wrong_type[i] = math.isnan(numbers[i])
+        else:
+            wrong_type[i] = True
+    return numbers, wrong_type
+
+
+def _string_column_errors(values) -> np.ndarray:
+    """Mask of the values of a categorical column that are neither strings nor null."""
+    if isinstance(values, np.ndarray) and values.dtype.kind not in "OU":
+        return np.ones(len(values), dtype=bool)
+    if set(map(type, values)) <= _STRING_TYPES:
+        return np.zeros(len(values), dtype=bool)
+    return np.fromiter((type(value) not in _STRING_TYPES for value in values), dtype=bool, count=len(values))
+
+
+def error_body(errors: list) -> dict:
+    """Response body (or batch result fields) for a rejected record."""
+    missing = [error["field"] for error in errors if error["code"] == "missing"]
+    body = {"error": MISSING_FIELDS_ERROR if len(missing) == len(errors) else INVALID_FIELDS_ERROR, "errors": errors}
+    if missing:
+        body["missing"] = missing
+    return body
+
+
+def compile_schema(mode: str = REQUEST_VALIDATION, path=FIELD_SPECS_PATH) -> RequestSchema:
+    """The RequestSchema of the field specs snapshot."""
+    return RequestSchema(load_field_specs(path), mode)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Field specs snapshot of the frontend form")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync = subparsers.add_parser("sync", help="Rewrite field_specs.json from validate_fields.js")
+    sync.add_argument("--source", default=str(FIELD_DEFINITIONS_PATH))
+    sync.add_argument("--output", default=str(FIELD_SPECS_PATH))
+    args = parser.parse_args(argv)
+
+    try:
+        specs = parse_field_definitions(Path(args.source).read_text(), args.source)
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    specs = {name: specs[name] for name in sorted(specs)}
+    Path(args.output).write_text(json.dumps(specs, indent=2) + "\n")
+    print(f"Wrote {len(specs)} field specs to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
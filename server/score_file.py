@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Offline bulk scoring of CSV / JSONL / Parquet files.
+
+Reads the input as a stream of fixed-size chunks, scores them on a pool of
+worker processes (each loads the model assets once), and writes the results
+in input order as they complete. Rows that fail go to a reject file together
+with the pipeline stage that rejected them; they never abort the run.
+
+    python score_file.py population.csv -o scores.csv --rejects rejects.jsonl
+    python score_file.py extract.jsonl -o scores.jsonl --workers 4 --chunk-size 5000 --id-column patient_id
+
+Run from the server/ directory (the model paths in config.py are relative to it).
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from config import USER_INPUT_COLUMNS
+from metrics import error_stage
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet", ".pq": "parquet"}
+RESULT_COLUMNS = ["row", "prediction_label", "probability_of_disease"]
+
+
+def detect_format(path: str, explicit: str = None) -> str:
+    if explicit:
+        return explicit
+    file_format = FORMATS.get(Path(path).suffix.lower())
+    if file_format is None:
+        raise ValueError(f"Cannot tell the format of '{path}'; pass --input-format/--output-format")
+    return file_format
+
+
+def _json_safe(value):
+    """Replaces NaN (how pandas marks empty cells) with None so rejects stay valid JSON."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "item"):  # NumPy scalars
+        return _json_safe(value.item())
+    return value
+
+
+# --- Readers ---
+# Each yields (first_row_number, chunk, parse_errors); a chunk is either a DataFrame
+# (CSV/Parquet) or a list of dicts (JSONL), both accepted by preprocessor.score_batch.
+
+def read_csv_chunks(path: str, chunk_size: int):
+    import pandas as pd
+
+    start = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        yield start, chunk.reset_index(drop=True), []
+        start += len(chunk)
+
+
+def read_parquet_chunks(path: str, chunk_size: int):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Reading Parquet requires pyarrow (pip install pyarrow)")
+
+    start = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        chunk = batch.to_pandas()
+        yield start, chunk, []
+        start += len(chunk)
+
+
+def read_jsonl_chunks(path: str, chunk_size: int):
+    start = 0
+    records, errors = [], []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = start + len(records) + len(errors)
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("line is not a JSON object")
+                records.append((row, record))
+            except ValueError as e:
+                errors.append({"row": row, "stage": "parse", "error": str(e), "record": line.rstrip("\n")})
+            if len(records) + len(errors) >= chunk_size:
+                yield start, records, errors
+                start += len(records) + len(errors)
+                records, errors = [], []
+    if records or errors:
+        yield start, records, errors
+
+
+READERS = {"csv": read_csv_chunks, "jsonl": read_jsonl_chunks, "parquet": read_parquet_chunks}
+
+
+# --- Writers ---
+
+class CsvResultWriter:
+    def __init__(self, path: str, columns: list):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        self._writer.writeheader()
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlResultWriter:
+    def __init__(self, path: str, columns: list):
+        self._file = open(path, "w")
+
+    def write(self, rows: list):
+        self._file.writelines(json.dumps(row) + "\n" for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """
+    Writes every chunk with one schema fixed up front: a Parquet file cannot change
+    column types midway, and types inferred per chunk would (an id column that is
+    all empty in one chunk, or int in one CSV chunk and float in the next).
+    The id column is written as strings, since its type is the input's.
+    """
+
+    def __init__(self, path: str, columns: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet requires pyarrow (pip install pyarrow)")
+        types = {"row": pa.int64(), "prediction_label": pa.string(), "probability_of_disease": pa.float64()}
+        self._pa = pa
+        self._schema = pa.schema([(col, types.get(col, pa.string())) for col in columns])
+        self._id_columns = [col for col in columns if col not in types]
+        self._path = path
+        self._pq = pq
+        self._writer = None
+
+    def write(self, rows: list):
+        if not rows:
+            return
+        if self._id_columns:
+            rows = [{**row, **{col: _id_text(row.get(col)) for col in self._id_columns}} for row in rows]
+        table = self._pa.Table.from_pylist(rows, schema=self._schema)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._path, self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _id_text(value):
+    """An id as text; 17.0 (how pandas reads an int column with empty cells) as "17"."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+WRITERS = {"csv": CsvResultWriter, "jsonl": JsonlResultWriter, "parquet": ParquetResultWriter}
+
+
+# --- Scoring ---
+
+def init_worker():
+    """Process pool initializer: one thread per worker and the assets loaded once."""
+    from threadpoolctl import threadpool_limits
+    from preprocessor import load_assets
+
+    threadpool_limits(limits=1)
+    load_assets()
+
+
+def score_chunk(start: int, chunk, id_column: str = None) -> tuple:
+    """
+    Scores one chunk; returns (result rows, reject rows) with row numbers
+    counted from the start of the input.
+    """
+    from preprocessor import score_batch
+
+    if isinstance(chunk, list):
+        rows = [row for row, _ in chunk]
+        records = [record for _, record in chunk]
+        missing = [[col for col in USER_INPUT_COLUMNS if col not in record] for record in records]
+        valid = [i for i, m in enumerate(missing) if not m]
+        scored = dict(zip(valid, score_batch([records[i] for i in valid])))
+        get_record = records.__getitem__
+        ids = [record.get(id_column) for record in records] if id_column else None
+    else:
+        rows = list(range(start, start + len(chunk)))
+        missing = [[] for _ in rows]
+        scored = dict(enumerate(score_batch(chunk)))
+        get_record = lambda i: chunk.iloc[i].to_dict()  # noqa: E731
+        ids = chunk[id_column].tolist() if id_column in chunk.columns else [None] * len(chunk)
+
+    results, rejects = [], []
+    for i, row in enumerate(rows):
+        result = scored.get(i)
+        if result is None or "error" in result:
+            if missing[i]:
+                stage, error = "validation", f"Missing required features in input data: {missing[i]}"
+            else:
+                stage, error = error_stage(result["error"]), result["error"]
+            record = {key: _json_safe(value) for key, value in get_record(i).items()}
+            rejects.append({"row": row, "stage": stage, "error": error, "record": record})
+            continue
+        output = {"row": row}
+        if id_column is not None:
+            output[id_column] = _json_safe(ids[i])
+        output["prediction_label"] = result["prediction_label"]
+        output["probability_of_disease"] = result["probability_of_disease"]
+        results.append(output)
+    return results, rejects
+
+
+def _check_columns(chunk):
+    if isinstance(chunk, list):
+        return  # checked per record
+    absent = [col for col in USER_INPUT_COLUMNS if col not in chunk.columns]
+    if absent:
+        raise RuntimeError(f"Input is missing required columns: {absent}")
+
+
+def score_file(input_path: str, output_path: str, rejects_path: str = None, input_format: str = None,
+               output_format: str = None, chunk_size: int = 10000, workers: int = None,
+               id_column: str = None, progress=None) -> dict:
+    """
+    Streams `input_path` through the model and writes `output_path` (and the
+    reject file). Returns run statistics.
+    """
+    input_format = detect_format(input_path, input_format)
+    output_format = detect_format(output_path, output_format)
+    rejects_path = rejects_path or str(Path(output_path).with_suffix("")) + ".rejects.jsonl"
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    columns = RESULT_COLUMNS[:1] + ([id_column] if id_column else []) + RESULT_COLUMNS[1:]
+    writer = WRITERS[output_format](output_path, columns)
+    stats = {"rows": 0, "scored": 0, "rejected": 0, "chunks": 0}
+    started = time.perf_counter()
+
+    def emit(chunk_results, parse_errors):
+        results, rejects = chunk_results
+        rejects = sorted(parse_errors + rejects, key=lambda r: r["row"])
+        writer.write(results)
+        if rejects:
+            rejects_file.writelines(json.dumps(r) + "\n" for r in rejects)
+        stats["scored"] += len(results)
+        stats["rejected"] += len(rejects)
+        stats["rows"] += len(results) + len(rejects)
+        stats["chunks"] += 1
+        if progress is not None:
+            elapsed = time.perf_counter() - started
+            progress(f"{stats['rows']} rows ({stats['rows'] / elapsed:.0f} rows/s), {stats['rejected']} rejected")
+
+    chunks = READERS[input_format](input_path, chunk_size)
+    with open(rejects_path, "w") as rejects_file:
+        try:
+            if workers <= 1:
+                init_worker()
+                for start, chunk, parse_errors in chunks:
+                    _check_columns(chunk)
+                    emit(score_chunk(start, chunk, id_column), parse_errors)
+            else:
+                # At most 2 chunks per worker in flight, consumed in submission order,
+                # so memory stays bounded and the output keeps the input order
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                    pending = deque()
+                    for start, chunk, parse_errors in chunks:
+                        _check_columns(chunk)
+                        pending.append((pool.submit(score_chunk, start, chunk, id_column), parse_errors))
+                        if len(pending) >= 2 * workers:
+                            future, errors = pending.popleft()
+                            emit(future.result(), errors)
+                    while pending:
+                        future, errors = pending.popleft()
+                        emit(future.result(), errors)
+        finally:
+            writer.close()
+
+    elapsed = time.perf_counter() - started
+    stats.update(
+        seconds=round(elapsed, 3),
+        rows_per_second=round(stats["rows"] / elapsed, 1) if elapsed > 0 else 0.0,
+        output=output_path,
+        rejects=rejects_path,
+    )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV, JSONL or Parquet file with the USER_INPUT_COLUMNS")
+    parser.add_argument("-o", "--output", required=True, help="Results file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--rejects", help="Reject file (JSONL); default: <output>.rejects.jsonl")
+    parser.add_argument("--input-format", choices=sorted(READERS))
+    parser.add_argument("--output-format", choices=sorted(WRITERS))
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows per chunk (default 10000)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--id-column", help="Input column copied to the results (e.g. a patient id)")
+    parser.add_argument("--quiet", action="store_true", help="No progress output")
+    args = parser.parse_args(argv)
+
+    progress = None if args.quiet else (lambda message: print(message, file=sys.stderr))
+    try:
+        stats = score_file(args.input, args.output, args.rejects, args.input_format, args.output_format,
+                           args.chunk_size, args.workers, args.id_column, progress)
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Scored {stats['scored']} of {stats['rows']} rows ({stats['rejected']} rejected) "
+          f"in {stats['seconds']} s: {stats['rows_per_second']} rows/s")
+    print(f"Results: {stats['output']}")
+    print(f"Rejects: {stats['rejects']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
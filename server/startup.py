@@ -0,0 +1,111 @@
+# startup.py
+
+import threading
+import time
+
+import thread_plan
+from config import WARMUP_RECORDS
+
+# Startup progress of this process, reported by / and /ready.
+# status: "starting" -> "loading" -> "warming_up" -> "ready", or "failed"
+STATE = {"status": "starting", "error": None, "timings": {}}
+
+# Set by gunicorn.conf.py when the app is preloaded in the master: warm-up is then
+# repeated in every worker after the fork (see warm_up()).
+FORK_PENDING = False
+
+_lock = threading.Lock()
+
+
+def is_ready() -> bool:
+    return STATE["status"] == "ready"
+
+
+def in_progress() -> bool:
+    return STATE["status"] in ("starting", "loading", "warming_up")
+
+
+def warm_up(predictor=None):
+    """
+    Scores WARMUP_RECORDS through the same calls /predict and /predict_batch use,
+    on `predictor` (default: the active one). Raises if any of them fails.
+    """
+    from preprocessor import current_predictor
+
+    predictor = predictor or current_predictor()
+    if FORK_PENDING:
+        # An OpenMP pool started in the gunicorn master would not survive the fork
+        # (LightGBM's booster path uses one); the workers warm it up themselves.
+        from threadpoolctl import threadpool_limits
+        with threadpool_limits(limits=1, user_api="openmp"):
+            _score_warmup_records(predictor)
+    else:
+        _score_warmup_records(predictor)
+
+
+def _score_warmup_records(predictor):
+    for record in WARMUP_RECORDS:
+        predictor.make_prediction(predictor.preprocess_records([record]))
+    predictor.predict_records(WARMUP_RECORDS)
+
+
+def run(started_at: float = None):
+    """Loads the assets and warms up the model, recording how long each step took."""
+    from preprocessor import load_assets
+
+    timings = STATE["timings"]
+    step_started = time.perf_counter()
+    if started_at is not None:
+        timings["imports_seconds"] = round(step_started - started_at, 3)
+    try:
+        STATE["status"] = "loading"
+        if not FORK_PENDING:
+            # Preloaded under gunicorn, each worker applies the plan after the fork instead
+            plan = thread_plan.apply_plan()
+            if plan is not None:
+                print(f"Thread plan: {plan['blas_threads']} BLAS/OpenMP thread(s) per request "
+                      f"({plan['cpus']:g} CPUs from {plan['cpu_source']}, {plan['concurrent_requests']} "
+                      f"concurrent request(s))")
+        load_assets()
+        timings["load_assets_seconds"] = round(time.perf_counter() - step_started, 3)
+
+        STATE["status"] = "warming_up"
+        warm_started = time.perf_counter()
+        try:
+            warm_up()
+        except Exception as e:
+            raise RuntimeError(f"Warm-up failed: {e}")
+        timings["warm_up_seconds"] = round(time.perf_counter() - warm_started, 3)
+    except Exception as e:
+        STATE["status"] = "failed"
+        STATE["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        timings["total_seconds"] = round(time.perf_counter() - (started_at or step_started), 3)
+
+    STATE["status"] = "ready"
+    print(f"Startup complete: {timings}")
+
+
+def start(mode: str, started_at: float = None):
+    """
+    Runs startup in the given mode ("eager" or "background"). Failures are recorded
+    in STATE instead of being raised.
+    """
+    with _lock:
+        if STATE["status"] != "starting":
+            return
+        STATE["status"] = "loading"
+
+    def _run():
+        try:
+            run(started_at)
+        except Exception as e:
+            print(f"Startup failed: {e}")
+
+    if mode == "background":
+        threading.Thread(target=_run, name="startup", daemon=True).start()
+    elif mode == "eager":
+        _run()
+    else:
+        raise ValueError(f"Unknown STARTUP_MODE: {mode}")
@@ -0,0 +1,98 @@
+# sweep.py
+#
+# What-if sweeps for /predict_sweep: one input record with one field varied over
+# a range (a risk curve) or two fields varied over a grid, scored as one batch
+# by Predictor.score_sweep.
+
+import math
+
+import numpy as np
+
+from config import USER_INPUT_COLUMNS, NUM_COLS, MAX_BATCH_SIZE
+
+# A curve (one field) or a grid (two fields)
+MAX_SWEEP_FIELDS = 2
+
+
+class SweepTooLarge(ValueError):
+    """More points than MAX_BATCH_SIZE (413 rather than 400)."""
+
+
+def parse_sweeps(specs) -> list:
+    """
+    Validates the "sweep" entries of a request and returns [(field, values)].
+    Each entry is {"field", "start", "stop", "steps"} (evenly spaced, numeric
+    fields only) or {"field", "values": [...]}. Raises ValueError with a message
+    fit for a 400 response (SweepTooLarge if there are too many points).
+    """
+    if isinstance(specs, dict):
+        specs = [specs]
+    if not isinstance(specs, list) or not 1 <= len(specs) <= MAX_SWEEP_FIELDS:
+        raise ValueError(f"'sweep' must be one sweep object or a list of 1 to {MAX_SWEEP_FIELDS}")
+
+    axes = []
+    for spec in specs:
+        if not isinstance(spec, dict):
+            raise ValueError("Each sweep must be an object")
+        field = spec.get("field")
+        if field not in USER_INPUT_COLUMNS:
+            raise ValueError(f"Unknown sweep field: {field!r}")
+        if any(field == seen for seen, _ in axes):
+            raise ValueError(f"Field '{field}' is swept twice")
+
+        if "values" in spec:
+            values = spec["values"]
+            if not isinstance(values, list) or not values:
+                raise ValueError(f"Sweep of '{field}': 'values' must be a non-empty list")
+            axes.append((field, np.array(values, dtype=object)))
+            continue
+
+        if field not in NUM_COLS:
+            raise ValueError(f"Sweep of '{field}': only numeric fields take a range, give 'values' instead")
+        try:
+            start, stop = float(spec["start"]), float(spec["stop"])
+            steps = spec["steps"]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Sweep of '{field}' needs numeric 'start' and 'stop' and a 'steps' count, "
+                             f"or a 'values' list")
+        if not (math.isfinite(start) and math.isfinite(stop)):
+            raise ValueError(f"Sweep of '{field}': 'start' and 'stop' must be finite")
+        if not isinstance(steps, int) or isinstance(steps, bool) or steps < 1:
+            raise ValueError(f"Sweep of '{field}': 'steps' must be a positive integer")
+        if steps > MAX_BATCH_SIZE:
+            raise SweepTooLarge(f"Sweep too large: {steps} points (maximum is {MAX_BATCH_SIZE})")
+        axes.append((field, np.linspace(start, stop, steps)))
+
+    n_points = math.prod(len(values) for _, values in axes)
+    if n_points > MAX_BATCH_SIZE:
+        raise SweepTooLarge(f"Sweep too large: {n_points} points (maximum is {MAX_BATCH_SIZE})")
+    return axes
+
+
+def grid(axes: list) -> tuple:
+    """
+    ({field: values per point}, number of points) for every combination of the
+    axis values, the last axis varying fastest (row-major, like the response).
+    """
+    n_points = math.prod(len(values) for _, values in axes)
+    varied = {}
+    repeat = n_points
+    for field, values in axes:
+        repeat //= len(values)
+        varied[field] = np.tile(np.repeat(values, repeat), n_points // (repeat * len(values)))
+    return varied, n_points
+
+
+def reshape(values: list, axes: list):
+    """Flat per-point values -> nested lists shaped like the axes (a plain list for one axis)."""
+    if len(axes) == 1:
+        return list(values)
+    width = len(axes[1][1])
+    return [list(values[i:i + width]) for i in range(0, len(values), width)]
+
+
+def point_index(i: int, axes: list) -> list:
+    """Position of flat point i along each axis."""
+    if len(axes) == 1:
+        return [i]
+    return list(divmod(i, len(axes[1][1])))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import sys
+import threading
+
+# Add current directory to path
+sys.path.append('.')
+
+import metrics
+from asgi import AsgiApp, create_app, OVERLOADED_ERROR
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+async def _request(asgi_app, method, path, body=b"", query=b"", chunk_size=None, disconnect=False):
+    """Drives one HTTP request through an ASGI app: (status, headers, body), or None without a response."""
+    chunk_size = chunk_size or max(len(body), 1)
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    if disconnect:
+        messages = messages[:1] + [{"type": "http.disconnect"}]
+        messages[0]["more_body"] = True
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(0)
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "http_version": "1.1", "method": method, "path": path, "root_path": "",
+             "query_string": query, "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+             "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]}
+    await asgi_app(scope, receive, send)
+    if not sent:
+        return None
+    headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+    return sent[0]["status"], headers, sent[1]["body"]
+
+
+def test_routes_match_the_wsgi_app():
+    import app as server_app
+    from preprocessor import load_assets
+
+    load_assets()
+    asgi_app = create_app(server_app.app, threads=2, queue_limit=2)
+    client = server_app.app.test_client()
+
+    async def scenario():
+        body = json.dumps(BASE_RECORD).encode()
+        return await asyncio.gather(
+            _request(asgi_app, "POST", "/predict", body, chunk_size=64),
+            _request(asgi_app, "POST", "/predict", body, query=b"explain=1"),
+            _request(asgi_app, "POST", "/predict_batch", json.dumps([BASE_RECORD, {"age": 45}]).encode()),
+            _request(asgi_app, "GET", "/ready"),
+        )
+
+    single, explained, batch, ready = asyncio.run(scenario())
+    expected = client.post("/predict", json=BASE_RECORD)
+    assert single[0] == 200 and json.loads(single[2]) == expected.get_json()
+    assert single[1]["x-model-version"] == expected.headers["X-Model-Version"]
+    assert "explanation" in json.loads(explained[2])
+    assert batch[0] == 200 and [r["status"] for r in json.loads(batch[2])["results"]] == ["success", "error"]
+    assert ready[0] == 200
+    print("✅ The ASGI entry point serves the same responses as the Flask app!")
+
+
+def test_saturated_pool_fails_fast():
+    from flask import Flask
+
+    release = threading.Event()
+    slow = Flask(__name__)
+
+    @slow.route("/predict", methods=["POST"])
+    def predict():
+        release.wait(5)
+        return {"status": "success"}
+
+    @slow.route("/ready")
+    def ready():
+        return {"status": "ready"}
+
+    asgi_app = AsgiApp(slow, threads=1, queue_limit=1, retry_after=2, max_body_bytes=1024)
+    rejected_before = metrics.OVERLOAD_REJECTIONS.get("/predict")
+
+    async def scenario():
+        # One request running and one queued fill the pool; the third is refused at once
+        running = [asyncio.ensure_future(_request(asgi_app, "POST", "/predict", b"{}")) for _ in range(2)]
+        while asgi_app.scoring.in_flight < 2:
+            await asyncio.sleep(0.001)
+        refused = await _request(asgi_app, "POST", "/predict", b"{}")
+        health = await _request(asgi_app, "GET", "/ready")
+        release.set()
+        return refused, health, await asyncio.gather(*running)
+
+    refused, health, served = asyncio.run(scenario())
+    assert refused[0] == 503 and refused[1]["retry-after"] == "2"
+    assert json.loads(refused[2])["error"] == OVERLOADED_ERROR
+    assert metrics.OVERLOAD_REJECTIONS.get("/predict") == rejected_before + 1
+    assert health[0] == 200, "control routes answer while scoring is saturated"
+    assert [status for status, _, _ in served] == [200, 200]
+    assert asgi_app.scoring.in_flight == 0
+
+    # Bodies over the limit get 413; a client leaving mid-upload gets nothing and holds no thread
+    assert asyncio.run(_request(asgi_app, "POST", "/predict", b"x" * 2048, chunk_size=512))[0] == 413
+    assert asyncio.run(_request(asgi_app, "POST", "/predict", b"{}", disconnect=True)) is None
+    assert asgi_app.scoring.in_flight == 0
+    assert "disease_api_overload_rejections_total" in metrics.render_prometheus()
+    print("✅ A saturated pool answers 503 with Retry-After!")
+
+
+if __name__ == "__main__":
+    test_routes_match_the_wsgi_app()
+    test_saturated_pool_fails_fast()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import joblib
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+from config import KNN_IMPUTER_PATH
+
+
+def test_memory_mapped_knn_imputer_matches_loaded_copy():
+    mapped = joblib.load(KNN_IMPUTER_PATH, mmap_mode="r")
+    loaded = joblib.load(KNN_IMPUTER_PATH)
+    assert isinstance(mapped._fit_X, np.memmap)
+    assert not mapped._fit_X.flags.writeable
+
+    X = np.array([[135.0, np.nan, 12.5, np.nan], [np.nan, 70.0, np.nan, 4000.0]])
+    assert np.array_equal(mapped.transform(X), loaded.transform(X))
+
+    print("✅ Memory-mapped artifacts behave like deserialized ones!")
+
+
+if __name__ == "__main__":
+    test_memory_mapped_knn_imputer_matches_loaded_copy()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+from app import app
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def test_batch_prediction():
+    client = app.test_client()
+
+    records = [
+        BASE_RECORD,
+        {**BASE_RECORD, "bmi": 35.2, "glucose": 180, "insulin": None},
+        {k: v for k, v in BASE_RECORD.items() if k != "glucose"},  # missing feature
+        {**BASE_RECORD, "age": 10},  # below the form's range (and the first AGE_BINS edge)
+        {**BASE_RECORD, "gender": "Female", "smoking_status": "Heavy Smoker"},
+    ]
+
+    print("Testing /predict_batch...")
+    response = client.post("/predict_batch", json={"records": records})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    body = response.get_json()
+    print(f"Response: {body}")
+
+    results = body["results"]
+    assert body["count"] == len(records)
+    assert body["succeeded"] == 3
+    assert [r["index"] for r in results] == list(range(len(records)))
+    assert [r["status"] for r in results] == ["success", "success", "error", "error", "success"]
+    assert results[2]["missing"] == ["glucose"]
+    assert [(e["field"], e["code"]) for e in results[3]["errors"]] == [("age", "range")]
+
+    # Batch results must match scoring each record on its own through /predict
+    for i in (0, 1, 4):
+        single = client.post("/predict", json=records[i]).get_json()
+        assert single["prediction_label"] == results[i]["prediction_label"]
+        assert single["probability_of_disease"] == results[i]["probability_of_disease"]
+
+    print("✅ Batch prediction matches single-record predictions!")
+
+
+def test_batch_prediction_rejects_bad_payloads():
+    client = app.test_client()
+
+    assert client.post("/predict_batch", json={"rows": []}).status_code == 400
+    empty = client.post("/predict_batch", json=[])
+    assert empty.status_code == 200 and empty.get_json()["results"] == []
+    print("✅ Malformed batch payloads rejected!")
+
+
+if __name__ == "__main__":
+    test_batch_prediction()
+    test_batch_prediction_rejects_bad_payloads()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Add current directory to path
+sys.path.append('.')
+
+from batcher import MicroBatcher
+from preprocessor import load_assets, preprocess_records, make_prediction, predict_records
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def test_batcher_groups_concurrent_calls():
+    calls = []
+    release = threading.Event()
+
+    def batch_fn(items):
+        release.wait(5)  # hold the first batch so the others queue up behind it
+        calls.append(list(items))
+        if any(item < 0 for item in items):
+            raise ValueError("negative item")
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_us=50000)
+
+    def call(item):
+        try:
+            return batcher.submit(item)
+        except ValueError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        futures = [pool.submit(call, item) for item in list(range(19)) + [-1]]
+        release.set()
+        results = [f.result(timeout=10) for f in futures]
+
+    print(f"Batches: {[len(c) for c in calls]}")
+    assert results[:19] == [item * 10 for item in range(19)]
+    assert results[19] == "negative item"
+    assert max(len(c) for c in calls) <= 8
+    stats = batcher.stats()
+    assert stats["batch_size"]["count"] >= 3
+    assert stats["queue_wait_seconds"]["count"] == stats["batch_size"]["sum"]
+    assert any(len(c) > 1 for c in calls)
+
+    print("✅ Micro-batcher groups concurrent calls and isolates failures!")
+
+
+def test_batcher_never_leaves_callers_hanging():
+    class Stop(BaseException):
+        pass
+
+    def batch_fn(items):
+        if "short" in items:
+            return items[:-1]
+        if "stop" in items:
+            raise Stop()
+        if "slow" in items:
+            time.sleep(1)
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_us=0, timeout_s=0.2)
+
+    def error_of(item):
+        try:
+            batcher.submit(item)
+        except RuntimeError as e:
+            return str(e)
+
+    # A batch_fn that drops results fails the batch instead of stranding callers
+    assert "returned 0 results for 1 items" in error_of("short")
+    # A BaseException fails the batch and stops the thread; the next call starts a new one
+    assert "Micro-batcher stopped" in error_of("stop")
+    assert batcher.submit("ok") == "ok"
+    # A caller gives up after the timeout
+    started = time.perf_counter()
+    assert "timed out" in error_of("slow") and time.perf_counter() - started < 0.9
+    time.sleep(1)
+    assert batcher.submit("ok") == "ok"
+    print("✅ Micro-batcher callers get a result or an error, never a hang!")
+
+
+def test_cancelled_callers_do_not_fail_the_batch():
+    cancelled, running = Future(), Future()
+
+    def batch_fn(items):
+        # A caller timing out mid-batch can no longer cancel: its result is still set
+        assert not running.cancel()
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_us=50000)
+    batcher._ensure_worker()
+    cancelled.cancel()  # a caller that gave up while its item was queued
+    now = time.perf_counter()
+    batcher._queue.put((1, cancelled, now))
+    batcher._queue.put((2, running, now))
+    assert batcher.submit(3) == 30
+    assert running.result(timeout=1) == 20
+    assert batcher.stats()["batch_size"]["sum"] == 2  # the cancelled item was never scored
+    print("✅ Cancelled callers are dropped without failing the rest of the batch!")
+
+
+def test_batched_predictions_match_single_predictions():
+    load_assets()
+    batcher = MicroBatcher(predict_records, max_batch_size=16, max_wait_us=5000)
+    records = [
+        BASE_RECORD,
+        {**BASE_RECORD, "bmi": 35.2, "glucose": 180, "insulin": None},
+        {**BASE_RECORD, "gender": "Female", "smoking_status": "Heavy Smoker"},
+        {**BASE_RECORD, "age": 10},  # fails ordinal encoding
+    ] * 4
+
+    with ThreadPoolExecutor(max_workers=len(records)) as pool:
+        futures = [pool.submit(batcher.submit, record) for record in records]
+
+    for record, future in zip(records, futures):
+        try:
+            expected = make_prediction(preprocess_records([record]))
+        except RuntimeError as e:
+            assert str(future.exception()) == str(e)
+            continue
+        assert future.result() == expected
+
+    print(f"Batch sizes: {batcher.stats()['batch_size']}")
+    print("✅ Micro-batched predictions match single-record predictions!")
+
+
+if __name__ == "__main__":
+    test_batcher_groups_concurrent_calls()
+    test_batcher_never_leaves_callers_hanging()
+    test_cancelled_callers_do_not_fail_the_batch()
+    test_batched_predictions_match_single_predictions()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import sys
+
+# Add current directory and the benchmarks to path
+sys.path.append('.')
+sys.path.append('benchmarks')
+
+from config import USER_INPUT_COLUMNS
+from preprocessor import load_assets, predict_records
+from load_test import saturation_point
+from run_benchmarks import bench_stages, compare_results
+from synthetic import generate_records, load_field_specs
+
+
+def test_synthetic_records_follow_frontend_ranges():
+    specs = load_field_specs()
+    assert set(specs) == set(USER_INPUT_COLUMNS)
+    assert specs["age"]["min"] == 18 and specs["insulin"]["step"] == 0.1
+    assert "Former Smoker" in specs["smoking_status"]["options"]
+
+    records = generate_records(200, seed=1, missing_rate=0.2)
+    assert records == generate_records(200, seed=1, missing_rate=0.2)  # reproducible
+    for record in records:
+        for field, spec in specs.items():
+            value = record[field]
+            if spec["type"] == "select":
+                assert value in spec["options"]
+            elif value is not None:
+                assert spec["min"] <= value <= spec["max"], (field, value)
+    assert any(record["insulin"] is None for record in records)
+
+    load_assets()
+    results = predict_records(records)
+    assert all(0.0 <= r["probability_of_disease"] <= 1.0 for r in results)
+
+    print("✅ Synthetic records stay within the frontend ranges and score!")
+
+
+def test_stage_benchmark_and_compare():
+    results = bench_stages([1, 10], seed=0, missing_rate=0.1, min_seconds=0.01)
+    compiled = results["stages/compiled/batch_10"]
+    print(f"Compiled batch of 10: {compiled}")
+    assert compiled["median_ms"] > 0 and compiled["rows_per_second"] > 0
+    assert {"stage_sanitize_ms", "stage_imputation_ms", "stage_pca_ms"} <= set(compiled)
+    assert "stage_one_hot_encoding_ms" in results["stages/pandas/batch_1"]
+
+    baseline = {"results": {"stages/x": {"median_ms": 10.0, "rows_per_second": 100.0, "calls": 5}}}
+    current = {"results": {"stages/x": {"median_ms": 13.0, "rows_per_second": 110.0, "calls": 9}}}
+    rows = {row["metric"]: row for row in compare_results(baseline, current, threshold=0.2)}
+    assert set(rows) == {"median_ms", "rows_per_second"}  # counts are not compared
+    assert rows["median_ms"]["regression"] and not rows["rows_per_second"]["regression"]
+    assert not any(row["regression"] for row in compare_results(baseline, current, threshold=0.5))
+
+    print("✅ Stage benchmark runs and regressions are flagged!")
+
+
+def test_saturation_point():
+    def step(concurrency, rps, p99, error_rate=0.0):
+        return {"concurrency": concurrency, "throughput_rps": rps, "p99_ms": p99, "error_rate": error_rate}
+
+    # Throughput flattens out after 4 clients
+    steps = [step(1, 100, 10), step(2, 190, 12), step(4, 350, 20), step(8, 360, 45), step(16, 365, 90)]
+    assert saturation_point(steps, slo_ms=100, max_error_rate=0.01)["concurrency"] == 4
+    # The SLO is missed before throughput flattens
+    assert saturation_point(steps, slo_ms=15, max_error_rate=0.01)["concurrency"] == 2
+    # Errors count as saturation too
+    steps[1]["error_rate"] = 0.05
+    assert saturation_point(steps, slo_ms=100, max_error_rate=0.01)["concurrency"] == 1
+    assert saturation_point([step(1, 10, 500)], slo_ms=100, max_error_rate=0.01) is None
+
+    print("✅ Saturation point found from the load curve!")
+
+
+if __name__ == "__main__":
+    test_synthetic_records_follow_frontend_ranges()
+    test_stage_benchmark_and_compare()
+    test_saturation_point()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import sys
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append('.')
+
+import columnar
+from config import USER_INPUT_COLUMNS, MAX_BATCH_SIZE, WARMUP_RECORDS
+from preprocessor import load_assets
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+RECORDS = [
+    BASE_RECORD,
+    {**BASE_RECORD, "gender": "Female", "age": 70, "glucose": 190, "bmi": 34.0, "smoking_status": "Heavy Smoker"},
+    {**BASE_RECORD, "insulin": None, "income": None, "caffeine_intake": None},
+    {**BASE_RECORD, "age": 29, "stress_level": "High", "exercise_type": "Unknown Sport"},
+]
+
+
+def _client():
+    import app as server_app
+    load_assets()
+    return server_app.app.test_client()
+
+
+def _json_results(client):
+    response = client.post("/predict_batch", json=RECORDS)
+    assert response.status_code == 200
+    return response.get_json()["results"]
+
+
+def _columns(records):
+    return {col: [record[col] for record in records] for col in USER_INPUT_COLUMNS}
+
+
+def test_arrow_batch_matches_json():
+    client = _client()
+    if not columnar.available("arrow"):
+        response = client.post("/predict_batch", data=b"", content_type=columnar.ARROW_STREAM)
+        assert response.status_code == 415
+        print("✅ Arrow requests get 415 without pyarrow installed!")
+        return
+
+    import pyarrow as pa
+
+    # Numeric columns as float64 (nulls included), categoricals dictionary-encoded
+    table = pa.table({
+        col: pa.array(values).dictionary_encode() if isinstance(values[0], str) else pa.array(values, pa.float64())
+        for col, values in _columns(RECORDS).items()
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=2):
+            writer.write_batch(batch)
+
+    response = client.post("/predict_batch", data=sink.getvalue().to_pybytes(), content_type=columnar.ARROW_STREAM)
+    assert response.status_code == 200 and response.mimetype == columnar.ARROW_STREAM
+    result = pa.ipc.open_stream(response.data).read_all()
+    metadata = {key.decode(): value.decode() for key, value in result.schema.metadata.items()}
+    assert metadata["model_version"] == response.headers["X-Model-Version"]
+    assert metadata["count"] == str(len(RECORDS)) == metadata["succeeded"]
+
+    expected = _json_results(client)
+    assert result.column("probability_of_disease").to_pylist() == [r["probability_of_disease"] for r in expected]
+    assert result.column("prediction_label").to_pylist() == [r["prediction_label"] for r in expected]
+    assert result.column("index").to_pylist() == list(range(len(RECORDS)))
+
+    # Malformed streams and missing columns are client errors
+    assert client.post("/predict_batch", data=b"not arrow", content_type=columnar.ARROW_STREAM).status_code == 400
+    response = client.post("/predict_batch", data=sink.getvalue().to_pybytes()[:0], content_type=columnar.ARROW_STREAM)
+    assert response.status_code == 400
+
+    print("✅ Arrow IPC batches score exactly like JSON batches!")
+
+
+def test_msgpack_batch_matches_json():
+    client = _client()
+    if not columnar.available("msgpack"):
+        response = client.post("/predict_batch", data=b"\x80", content_type=columnar.MSGPACK)
+        assert response.status_code == 415
+        print("✅ MessagePack requests get 415 without msgpack installed!")
+        return
+
+    import msgpack
+
+    columns = _columns(RECORDS)
+    # Numeric columns may also be sent as raw little-endian float64
+    columns["age"] = np.array(columns["age"], dtype="<f8").tobytes()
+    response = client.post("/predict_batch", data=msgpack.packb({"columns": columns}),
+                           content_type="application/x-msgpack")
+    assert response.status_code == 200 and response.mimetype == columnar.MSGPACK
+    body = msgpack.unpackb(response.data)
+    assert body["model_version"] == response.headers["X-Model-Version"] and body["succeeded"] == len(RECORDS)
+
+    expected = _json_results(client)
+    assert body["columns"]["probability_of_disease"] == [r["probability_of_disease"] for r in expected]
+    assert body["columns"]["error"] == [None] * len(RECORDS)
+
+    # Client errors: ragged columns, a missing field, an oversized batch
+    ragged = {**_columns(RECORDS), "age": [45]}
+    assert client.post("/predict_batch", data=msgpack.packb({"columns": ragged}),
+                       content_type=columnar.MSGPACK).status_code == 400
+    missing = {col: values for col, values in _columns(RECORDS).items() if col != "glucose"}
+    response = client.post("/predict_batch", data=msgpack.packb({"columns": missing}), content_type=columnar.MSGPACK)
+    assert response.status_code == 400 and "glucose" in response.get_json()["error"]
+    huge = {col: [values[0]] * (MAX_BATCH_SIZE + 1) for col, values in _columns(RECORDS).items()}
+    assert client.post("/predict_batch", data=msgpack.packb({"columns": huge}),
+                       content_type=columnar.MSGPACK).status_code == 413
+
+    print("✅ MessagePack batches score exactly like JSON batches!")
+
+
+def test_column_batch_validates_like_json():
+    client = _client()
+    if not columnar.available("msgpack"):
+        print("msgpack is not installed; skipping.")
+        return
+
+    import msgpack
+
+    records = RECORDS + [{**BASE_RECORD, "age": 10, "bmi": "heavy"}, {**BASE_RECORD, "glucose": None, "income": ""}]
+    columns = _columns(records)
+    # Binary numbers carry out-of-range values too
+    columns["heart_rate"] = np.array(columns["heart_rate"][:-1] + [500], dtype="<f8").tobytes()
+    response = client.post("/predict_batch", data=msgpack.packb({"columns": columns}), content_type=columnar.MSGPACK)
+    body = msgpack.unpackb(response.data)
+    assert response.status_code == 200 and body["succeeded"] == len(RECORDS)
+
+    json_records = records[:-1] + [{**records[-1], "heart_rate": 500}]
+    expected = client.post("/predict_batch", json=json_records).get_json()["results"]
+    assert body["columns"]["status"] == [r["status"] for r in expected]
+    assert body["columns"]["errors"] == [r.get("errors") for r in expected]
+    assert body["columns"]["probability_of_disease"] == [r.get("probability_of_disease") for r in expected]
+    assert [(e["field"], e["code"]) for e in body["columns"]["errors"][-1]] == [("heart_rate", "range"),
+                                                                               ("glucose", "null")]
+
+    if columnar.available("arrow"):
+        import pyarrow as pa
+
+        # Arrow columns have one type: the fields holding "heavy" and "" are sent as strings
+        table = pa.table({
+            col: pa.array([None if v is None else str(v) for v in values])
+            if any(isinstance(v, str) for v in values) and not isinstance(values[0], str) else pa.array(values)
+            for col, values in _columns(records).items()
+        })
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        response = client.post("/predict_batch", data=sink.getvalue().to_pybytes(),
+                               content_type=columnar.ARROW_STREAM)
+        result = pa.ipc.open_stream(response.data).read_all()
+        errors = result.column("errors").to_pylist()
+        assert [[(e["field"], e["code"]) for e in row] if row else None for row in errors[-2:]] == \
+            [[("age", "range"), ("bmi", "type")], [("glucose", "null")]]
+        assert errors[-2][0]["min"] == 18 and errors[-2][1]["allowed"] is None
+
+    print("✅ Column batches get the same field errors as JSON batches!")
+
+
+def test_column_batch_isolates_bad_rows():
+    predictor = load_assets()
+    columns = {col: np.array(values, dtype=object) for col, values in _columns(RECORDS).items()}
+    columns["age"] = np.array([45, float("inf"), 33, 50], dtype=object)
+
+    results = predictor.score_columns(columns, len(RECORDS))
+    expected = predictor.score_batch([{**record, "age": age} for record, age in zip(RECORDS, columns["age"])])
+    assert results == expected
+    assert predictor.score_columns({col: values[:0] for col, values in columns.items()}, 0) == []
+
+    print("✅ Column batches report failing rows like record batches!")
+
+
+if __name__ == "__main__":
+    test_arrow_batch_matches_json()
+    test_msgpack_batch_matches_json()
+    test_column_batch_validates_like_json()
+    test_column_batch_isolates_bad_rows()
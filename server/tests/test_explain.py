@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import sys
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append('.')
+
+from explain import DEFAULTS_FIELD
+from preprocessor import load_assets
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+RECORDS = [
+    BASE_RECORD,
+    {**BASE_RECORD, "glucose": 190, "insulin": None, "smoking_status": "Heavy Smoker"},
+    {**BASE_RECORD, "age": 70, "bmi": 35.0, "income": None, "caffeine_intake": None},
+    {**BASE_RECORD, "gender": "Female", "age": 22, "bmi": 19.0, "dietary_habits": "Vegan"},
+]
+
+
+def _margin(predictor, records):
+    probabilities = predictor.final_model.predict_proba(predictor.preprocess_records(records))[:, 1]
+    return np.log(probabilities / (1 - probabilities))
+
+
+def test_attributions_add_up_to_the_margin():
+    predictor = load_assets()
+    assert predictor.explainer is not None and predictor.tree_evaluator is not None
+    X_pca = predictor.preprocess_records(RECORDS)
+
+    # Path attributions share TreeSHAP's base value and add up to the same margin
+    path = predictor.tree_evaluator.predict_contributions(X_pca)
+    shap = predictor.final_model.predict_proba(X_pca, pred_contrib=True)
+    assert path.shape == shap.shape == (len(RECORDS), X_pca.shape[1] + 1)
+    assert np.allclose(path[:, -1], shap[:, -1], atol=1e-9)
+    assert np.allclose(path.sum(axis=1), shap.sum(axis=1), atol=1e-9)
+
+    margins = _margin(predictor, RECORDS)
+    booster = dataclasses.replace(predictor, tree_evaluator=None)
+    reference = dataclasses.replace(predictor, transform_plan=None)
+    assert predictor.explain_method == "path" and booster.explain_method == "tree_shap"
+    for explainer in (predictor, booster):
+        explained = explainer.explain_records(RECORDS)
+        for result, margin, plain in zip(explained, margins, predictor.predict_records(RECORDS)):
+            explanation = result.pop("explanation")
+            assert result == plain
+            assert explanation["method"] == explainer.explain_method
+            for attributions in (explanation["fields"], explanation["features"]):
+                assert abs(explanation["base_value"] + sum(attributions.values()) - margin) < 1e-4
+
+    # Every model input is credited to a user field; marital_status is not used by the model
+    fields = predictor.explain_records(RECORDS[1:2])[0]["explanation"]["fields"]
+    assert fields["marital_status"] == 0.0 and DEFAULTS_FIELD in fields
+    assert fields["glucose"] != 0.0 and fields["smoking_status"] != 0.0
+
+    # The pandas pipeline explains the same features
+    for compiled, pandas in zip(predictor.explain_records(RECORDS), reference.explain_records(RECORDS)):
+        features = compiled["explanation"]["features"]
+        assert max(abs(features[name] - value) for name, value in pandas["explanation"]["features"].items()) < 1e-6
+
+    top = sorted(fields.items(), key=lambda item: -abs(item[1]))[:3]
+    print(f"Top fields: {top}")
+    print("✅ Explanations add up to the model's margin!")
+
+
+def test_explain_endpoints():
+    import app as server_app
+
+    load_assets()
+    client = server_app.app.test_client()
+    plain = client.post("/predict", json=BASE_RECORD).get_json()
+    explained = client.post("/predict?explain=1", json=BASE_RECORD).get_json()
+    assert "explanation" not in plain
+    assert explained["probability_of_disease"] == plain["probability_of_disease"]
+    assert set(explained["explanation"]["fields"]) >= set(BASE_RECORD)
+
+    # Explained results are cached under their own key, with the explanation
+    cache = server_app.PREDICTION_CACHE
+    if cache is not None:
+        before = cache.stats()
+        again = client.post("/predict?explain=1", json={**BASE_RECORD, "age": "45"}).get_json()
+        assert again == explained
+        assert cache.stats()["hits"] == before["hits"] + 1
+        assert "explanation" not in client.post("/predict", json=BASE_RECORD).get_json()
+
+    response = client.post("/predict_batch?explain=1", json=[BASE_RECORD, {**BASE_RECORD, "age": 10}, {"age": 45}])
+    body = response.get_json()
+    assert response.status_code == 200, body
+    first, failed, missing = body["results"]
+    assert first["explanation"] == explained["explanation"]
+    assert failed["status"] == "error" and missing["status"] == "error"
+    print("✅ /predict and /predict_batch explain on request!")
+
+
+if __name__ == "__main__":
+    test_attributions_add_up_to_the_margin()
+    test_explain_endpoints()
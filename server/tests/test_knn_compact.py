@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import joblib
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+from config import KNN_IMPUTER_PATH, WARMUP_RECORDS
+from knn_compact import build_compact_knn
+import preprocessor
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def _incomplete_rows(imputer, n: int = 64) -> np.ndarray:
+    rng = np.random.default_rng(7)
+    X = imputer._fit_X[rng.integers(0, imputer._fit_X.shape[0], n)] + rng.normal(0, 1, (n, 4))
+    X = np.where(np.isnan(X), rng.uniform(1, 50, (n, 4)), X)
+    for i in range(n):
+        pattern = i % 16
+        for col in range(4):
+            if pattern & (1 << col):
+                X[i, col] = np.nan
+    return X
+
+
+def test_float32_reference_matches_knn_imputer():
+    imputer = joblib.load(KNN_IMPUTER_PATH)
+    compact = build_compact_knn(imputer)
+    assert compact.reference.dtype == np.float32 and len(compact.reference) == imputer._fit_X.shape[0]
+    assert compact.nbytes < np.asarray(imputer._fit_X).nbytes
+
+    X = _incomplete_rows(imputer)
+    expected = imputer.transform(pd.DataFrame(X, columns=imputer.feature_names_in_))
+    actual = compact.transform(X)
+    assert not np.isnan(actual).any()
+    # Only float32 rounding of the donors, or a near-tie ordered the other way
+    close = np.isclose(actual, expected, rtol=1e-5)
+    print(f"Values within float32 rounding: {close.mean():.2%}")
+    assert close.mean() > 0.97
+
+    complete = np.array([[135.0, 82.0, 12.5, 65000.0]])
+    assert compact.transform(complete) is complete
+    print("✅ The float32 reference set imputes like KNNImputer!")
+
+
+def test_prototypes_are_training_rows():
+    imputer = joblib.load(KNN_IMPUTER_PATH)
+    fit_rows = {tuple(row) for row in np.asarray(imputer._fit_X, dtype=np.float32)}
+    X = _incomplete_rows(imputer)
+    for method in ("random", "kmeans"):
+        compact = build_compact_knn(imputer, size=300, method=method)
+        assert len(compact.reference) <= 300 and compact.present.all()
+        assert all(tuple(row) in fit_rows for row in compact.reference)
+        imputed = compact.transform(X)
+        assert not np.isnan(imputed).any()
+        assert np.array_equal(imputed[~np.isnan(X)], X[~np.isnan(X)])
+
+    for size in (2, 10 ** 7):
+        try:
+            build_compact_knn(imputer, size=size)
+            raise AssertionError(f"{size} prototypes were accepted")
+        except ValueError as e:
+            print(f"Rejected {size} prototypes: {e}")
+    print("✅ Prototypes are complete training rows!")
+
+
+def test_compact_engine_serves_predictions():
+    saved = preprocessor.KNN_ENGINE, preprocessor.KNN_COMPACT_SIZE
+    preprocessor.KNN_ENGINE, preprocessor.KNN_COMPACT_SIZE = "compact", 1000
+    try:
+        predictor = preprocessor.load_predictor(model_format="joblib")
+    finally:
+        preprocessor.KNN_ENGINE, preprocessor.KNN_COMPACT_SIZE = saved
+    assert predictor.info()["knn_engine"] == "compact" and predictor.knn_index is None
+    assert len(predictor.knn_imputer.reference) == 1000
+
+    records = [BASE_RECORD, {**BASE_RECORD, "blood_pressure": None, "income": None}]
+    compiled = predictor.predict_records(records)
+    pandas = predictor.make_batch_prediction(predictor._preprocess_input_pandas(pd.DataFrame(records)))
+    assert compiled[0] == preprocessor.load_predictor(model_format="joblib").predict_records(records)[0]
+    for a, b in zip(compiled, pandas):
+        assert abs(a["probability_of_disease"] - b["probability_of_disease"]) < 1e-6
+    print("✅ KNN_ENGINE=compact serves both pipelines!")
+
+
+if __name__ == "__main__":
+    test_float32_reference_matches_knn_imputer()
+    test_prototypes_are_training_rows()
+    test_compact_engine_serves_predictions()
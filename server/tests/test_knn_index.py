@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import joblib
+import sys
+import warnings
+
+# Add current directory to path
+sys.path.append('.')
+
+from config import KNN_IMPUTER_PATH
+from knn_index import build_knn_index
+
+
+def test_indexed_knn_matches_knn_imputer():
+    print("Loading KNN imputer and building the index...")
+    imputer = joblib.load(KNN_IMPUTER_PATH)
+    index = build_knn_index(imputer)
+
+    rng = np.random.default_rng(42)
+    n = 120
+    # blood_pressure, heart_rate, insulin, income around the training data
+    X = imputer._fit_X[rng.integers(0, imputer._fit_X.shape[0], n)] + rng.normal(0, 1, (n, 4))
+    X = np.where(np.isnan(X), rng.uniform(1, 50, (n, 4)), X)
+    X[:8] = np.round(X[:8])  # integer-valued inputs, as sent by the frontend
+    # Every missingness pattern, including complete and all-missing rows
+    for i in range(n):
+        pattern = i % 16
+        for col in range(4):
+            if pattern & (1 << col):
+                X[i, col] = np.nan
+
+    expected = imputer.transform(pd.DataFrame(X, columns=imputer.feature_names_in_))
+    actual = index.transform(X)
+    print(f"Max abs difference: {np.abs(expected - actual).max()}")
+    assert not np.isnan(actual).any()
+    assert np.allclose(expected, actual, rtol=1e-15, atol=0)
+
+    # Rows sent back to the KNNImputer (near ties) keep its feature names: no warning per call
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert np.array_equal(index._transform_exact(X[:16]), expected[:16], equal_nan=True)
+
+    print("✅ Indexed KNN imputation matches KNNImputer!")
+
+
+def test_complete_rows_skip_imputation():
+    imputer = joblib.load(KNN_IMPUTER_PATH)
+    index = build_knn_index(imputer)
+
+    complete = np.array([[135.0, 82.0, 12.5, 65000.0], [120.0, 70.0, 8.0, 4000.0]])
+    assert index.transform(complete) is complete
+
+    # Invalid input still fails the way KNNImputer fails
+    try:
+        index.transform(np.array([[np.inf, 82.0, np.nan, 65000.0]]))
+        raise AssertionError("infinite input was accepted")
+    except ValueError as e:
+        print(f"Rejected infinite input: {e}")
+
+    print("✅ Complete rows bypass the imputer!")
+
+
+if __name__ == "__main__":
+    test_indexed_knn_matches_knn_imputer()
+    test_complete_rows_skip_imputation()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+import metrics
+from metrics import Histogram, record_error, STAGE_ERRORS
+from app import app
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def test_histogram_quantiles_and_errors_by_stage():
+    histogram = Histogram("test_seconds", (0.001, 0.01, 0.1))
+    for value in [0.0005] * 50 + [0.005] * 45 + [0.05] * 5:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.001
+    assert abs(histogram.quantile(0.95) - 0.01) < 1e-12  # rank 95 is the top of the second bucket
+    assert 0.01 < histogram.quantile(0.99) <= 0.1
+    lines = histogram.render()
+    assert 'test_seconds_bucket{le="0.001"} 50' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 100' in lines
+    assert "test_seconds_count 100" in lines
+
+    before = STAGE_ERRORS.get("ordinal_encoding")
+    record_error("Ordinal encoding failed: Found unknown categories [nan] in column 1 during transform")
+    assert STAGE_ERRORS.get("ordinal_encoding") == before + 1
+    print("✅ Histogram quantiles and error stages!")
+
+
+def test_metrics_endpoint():
+    import app as server_app
+    from request_schema import compile_schema
+
+    client = app.test_client()
+    client.post("/predict", json={**BASE_RECORD, "glucose": 117})
+    # Validation rejects age 10 up front; with it off, the record fails in the pipeline
+    schema, failed = server_app.REQUEST_SCHEMA, STAGE_ERRORS.get("ordinal_encoding")
+    server_app.REQUEST_SCHEMA = compile_schema("off")
+    try:
+        client.post("/predict_batch", json=[{**BASE_RECORD, "age": 10}])
+    finally:
+        server_app.REQUEST_SCHEMA = schema
+    assert STAGE_ERRORS.get("ordinal_encoding") == failed + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    for stage in ("sanitize", "imputation", "feature_engineering", "pca", "inference"):
+        if metrics.METRICS_ENABLED:
+            assert f'disease_api_stage_latency_seconds_count{{stage="{stage}"}}' in text, stage
+    assert 'disease_api_stage_errors_total{stage="ordinal_encoding"}' in text
+    assert "process_resident_memory_bytes" in text
+    print("✅ /metrics serves Prometheus text!")
+
+
+def test_timers_can_be_disabled():
+    code = (
+        "import preprocessor, metrics\n"
+        "from config import WARMUP_RECORDS\n"
+        "preprocessor.load_assets()\n"
+        "preprocessor.make_prediction(preprocessor.preprocess_records(WARMUP_RECORDS[:1]))\n"
+        "print(len(metrics.STAGE_LATENCY._children), metrics.PIPELINE_BATCH_SIZE.snapshot()['count'])\n"
+    )
+    env = {"METRICS_ENABLED": "0", "PYTHONWARNINGS": "ignore"}
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env={**os.environ, **env}).stdout
+    assert output.strip().splitlines()[-1] == "0 0", output
+    print("✅ METRICS_ENABLED=0 skips the timers!")
+
+
+if __name__ == "__main__":
+    test_histogram_quantiles_and_errors_by_stage()
+    test_metrics_endpoint()
+    test_timers_can_be_disabled()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append('.')
+
+import model_bundle
+from config import NUM_COLS, WARMUP_RECORDS
+from model_bundle import convert, load_bundle
+from preprocessor import load_predictor, artifact_paths, assets_fingerprint
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+_CONVERTED = {}
+
+
+def _bundle() -> Path:
+    """models/ converted once per test run."""
+    if "path" not in _CONVERTED:
+        directory = Path(tempfile.mkdtemp())
+        atexit.register(shutil.rmtree, directory, True)
+        _CONVERTED["manifest"] = convert("models", directory / "model.bundle")
+        _CONVERTED["path"] = directory / "model.bundle"
+    return _CONVERTED["path"]
+
+
+def _expect_rejected(path, message):
+    try:
+        load_bundle(path)
+    except RuntimeError as e:
+        assert message in str(e), str(e)
+        return
+    raise AssertionError(f"Bundle was not rejected ({message})")
+
+
+def test_bundle_scores_like_joblib_artifacts():
+    path = _bundle()
+    reference = load_predictor("models", model_format="joblib")
+    predictor = load_predictor(path.parent, model_format="auto")
+    assert predictor.version == _CONVERTED["manifest"]["bundle_version"] and predictor.source == str(path)
+
+    records = [
+        BASE_RECORD,
+        {**BASE_RECORD, "age": 70, "glucose": 190, "bmi": 34.0, "smoking_status": "Heavy Smoker"},
+        {**BASE_RECORD, "insulin": None, "income": None, "caffeine_intake": None},
+    ]
+    assert np.array_equal(predictor.preprocess_records(records), reference.preprocess_records(records))
+    assert predictor.predict_records(records) == reference.predict_records(records)
+    X = reference.preprocess_records(records)
+    assert np.array_equal(predictor.final_model.predict_proba(X), reference.final_model.predict_proba(X))
+
+    # Arrays are read-only views of the memory-mapped file, not copies
+    fit_X = predictor.knn_imputer._fit_X
+    assert not fit_X.flags.writeable and not fit_X.flags.owndata
+    assert not predictor.tree_evaluator.threshold.flags.owndata
+
+    # Same content, same version
+    again = model_bundle.write_bundle(path.parent / "again.bundle", load_bundle(path)[1],
+                                      predictor.tree_evaluator)
+    assert again["bundle_version"] == predictor.version
+
+    print(f"✅ Bundle {predictor.version} scores exactly like the .joblib files!")
+
+
+def test_bundle_rejects_any_mismatch():
+    path = _bundle()
+    manifest, data_start = model_bundle.read_manifest(path)
+    data = path.read_bytes()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        broken = Path(tmp) / "model.bundle"
+
+        flipped = bytearray(data)
+        flipped[data_start + manifest["arrays"]["knn_imputer._fit_X"]["offset"] + 3] ^= 0xFF
+        broken.write_bytes(bytes(flipped))
+        _expect_rejected(broken, "checksum mismatch in array knn_imputer._fit_X")
+
+        broken.write_bytes(data[:-100])
+        _expect_rejected(broken, "bytes, the manifest describes")
+
+        tampered = bytearray(data)
+        tampered[model_bundle.HEADER.size + 20] ^= 0x01
+        broken.write_bytes(bytes(tampered))
+        _expect_rejected(broken, "manifest checksum mismatch")
+
+        broken.write_bytes(b"PK\x03\x04" + data[4:])
+        _expect_rejected(broken, "not a model bundle")
+
+    saved = model_bundle.BUNDLE_COLUMNS
+    try:
+        model_bundle.BUNDLE_COLUMNS = {**saved, "NUM_COLS": NUM_COLS[:-1]}
+        _expect_rejected(path, "NUM_COLS in config.py differs")
+    finally:
+        model_bundle.BUNDLE_COLUMNS = saved
+
+    # Only scikit-learn/LightGBM classes are ever imported from a bundle
+    try:
+        model_bundle._decode({"__estimator__": "os.system", "state": {}}, {})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Arbitrary classes must not be restored")
+
+    print("✅ Corrupt or mismatched bundles fail fast!")
+
+
+def test_auto_mode_skips_a_stale_bundle():
+    path = _bundle()
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        for artifact in artifact_paths().values():
+            shutil.copy(artifact, directory / Path(artifact).name)
+        shutil.copy(path, directory / "model.bundle")
+        bundle_mtime = (directory / "model.bundle").stat().st_mtime
+        for artifact in directory.iterdir():
+            os.utime(artifact, (bundle_mtime - 10, bundle_mtime - 10))
+        os.utime(directory / "model.bundle", (bundle_mtime, bundle_mtime))
+        assert load_predictor(directory).version == _CONVERTED["manifest"]["bundle_version"]
+
+        # New artifacts copied in next to the old bundle: the fingerprint changes and they win
+        fingerprint = assets_fingerprint(directory)
+        final_model = directory / Path(artifact_paths()["final_model"]).name
+        os.utime(final_model, (bundle_mtime + 10, bundle_mtime + 10))
+        assert assets_fingerprint(directory) != fingerprint
+        predictor = load_predictor(directory)
+        assert predictor.version == assets_fingerprint(directory, "joblib")
+        assert load_predictor(directory, model_format="bundle").version == _CONVERTED["manifest"]["bundle_version"]
+    print("✅ A bundle older than the .joblib files does not shadow them!")
+
+
+if __name__ == "__main__":
+    test_bundle_scores_like_joblib_artifacts()
+    test_bundle_rejects_any_mismatch()
+    test_auto_mode_skips_a_stale_bundle()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import sys
+
+# Add current directory and the benchmarks to path
+sys.path.append('.')
+sys.path.append('benchmarks')
+
+from preprocessor import load_assets
+from parity_report import (
+    REFERENCE, engines, edge_case_records, random_records, score_reference, check_parity, measure_throughput
+)
+
+
+class _RightClosedBmi:
+    """An engine with a planted bug: BMI exactly on a bin edge shifts its PCA row."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def preprocess_records(self, records):
+        X = self.engine.preprocess_records(records)
+        for i, record in enumerate(records):
+            if record.get("bmi") == 18.5:
+                X[i] += 1e-3
+        return X
+
+    def preprocess_columns(self, columns, n_rows):
+        return self.preprocess_records([{col: values[i] for col, values in columns.items()} for i in range(n_rows)])
+
+    def _predict_probabilities(self, X):
+        return self.engine._predict_probabilities(X)
+
+
+def test_every_engine_matches_the_reference():
+    variants = engines(load_assets())
+    assert REFERENCE in variants and len(variants) > 2
+    records = edge_case_records() + random_records(40, seed=3)
+    assert random_records(40, seed=3) == random_records(40, seed=3)  # reproducible
+
+    expected = score_reference(variants, records)
+    report = check_parity(variants, records, batch_size=16, expected=expected)
+    for name, result in report.items():
+        print(f"{name}: {result['mismatches']} mismatches, max PCA error {result['max_pca_error']:.2e}, "
+              f"max probability error {result['max_probability_error']:.2e}, {result['rejected']} rejected")
+        assert result["mismatches"] == 0, result["examples"]
+    assert 0 < report["compiled+booster"]["rejected"] < len(records)
+
+    accepted = [record for record, (_, stage) in zip(records, expected) if stage is None]
+    throughput = measure_throughput(variants, accepted[:20], batch_size=16, min_seconds=0.05)
+    for name, result in throughput.items():
+        print(f"{name}: {result}")
+    print("✅ Every engine matches the reference pipeline!")
+
+
+def test_planted_mismatch_is_reported():
+    variants = engines(load_assets())
+    broken = {REFERENCE: variants[REFERENCE], "broken": _RightClosedBmi(variants[REFERENCE])}
+    records = edge_case_records()
+
+    result = check_parity(broken, records, batch_size=8)["broken"]
+    on_edge = sum(record.get("bmi") == 18.5 for record in records)
+    assert result["mismatches"] > 0 and all(example["record"]["bmi"] == 18.5 for example in result["examples"])
+    # Once alone, once in a batch of records and once as columns
+    assert result["mismatches"] == 3 * on_edge, (result["mismatches"], on_edge)
+    print("✅ The harness reports a planted bin-edge mismatch!")
+
+
+if __name__ == "__main__":
+    test_every_engine_matches_the_reference()
+    test_planted_mismatch_is_reported()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append('.')
+
+import app as app_module
+from app import app
+from preprocessor import prediction_cache_key
+from prediction_cache import PredictionCache, LocalCacheBackend, SharedCacheBackend
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def test_cache_keys_are_canonical():
+    key = prediction_cache_key(BASE_RECORD)
+    same = [
+        {**BASE_RECORD, "age": "45", "glucose": 110.0, "bmi": "28.5"},
+        {**BASE_RECORD, "exercise_type": "Cardio", "marital_status": "Single"},  # marital_status is unused
+        {**BASE_RECORD, "stress_level": "High"},  # stress_level is coerced to numeric first
+    ]
+    for record in same:
+        assert prediction_cache_key(record) == key, record
+
+    # Unknown categories are sanitized to the same fallback
+    assert prediction_cache_key({**BASE_RECORD, "gender": "Alien"}) == \
+        prediction_cache_key({**BASE_RECORD, "gender": "Martian"})
+
+    different = [
+        {**BASE_RECORD, "age": 46},
+        {**BASE_RECORD, "insulin": None},
+        {**BASE_RECORD, "gender": "Female"},
+        {**BASE_RECORD, "smoking_status": "Heavy Smoker"},
+    ]
+    for record in different:
+        assert prediction_cache_key(record) != key, record
+
+    print("✅ Cache keys are canonical!")
+
+
+def _exercise_backend(backend):
+    # Keys embed the assets version, as prediction_cache_key's do
+    cache = PredictionCache(backend, ttl_seconds=0.3)
+    for i in range(5):
+        cache.set(f"v1:k{i}", {"i": i}, "v1")
+    assert cache.get("v1:k4", "v1") == {"i": 4}
+    assert cache.get("missing", "v1") is None
+
+    time.sleep(0.35)
+    assert cache.get("v1:k4", "v1") is None  # expired
+
+    cache.set("v1:k1", {"i": 1}, "v1")
+    assert cache.get("v2:k1", "v2") is None  # new assets version
+    stats = cache.stats()
+    print(f"{stats['backend']}: {stats}")
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["expirations"] == 1 and stats["invalidations"] == 1
+    return cache
+
+
+def test_local_backend_lru_ttl_and_invalidation():
+    cache = _exercise_backend(LocalCacheBackend(max_size=3))
+    assert len(cache.backend) == 0  # a worker's own entries are dropped on a new version
+    for i in range(5):
+        cache.set(f"v2:k{i}", {"i": i}, "v2")
+    assert cache.get("v2:k0", "v2") is None and cache.get("v2:k4", "v2") == {"i": 4}
+    assert cache.stats()["evictions"] == 4  # 2 while filling v1, 2 while filling v2
+    print("✅ Local cache evicts by size and TTL!")
+
+
+def test_shared_backend_lru_ttl_and_invalidation():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cache.sqlite3"
+        cache = _exercise_backend(SharedCacheBackend(max_size=3, path=path, trim_interval=1))
+        # Not cleared on a new version (other workers may still write old-version entries) ...
+        assert len(cache.backend) == 1
+        for i in range(5):
+            cache.set(f"v2:k{i}", {"i": i}, "v2")
+        # ... old entries are trimmed like any other
+        assert cache.get("v2:k0", "v2") is None and cache.get("v2:k4", "v2") == {"i": 4}
+        assert len(cache.backend) == 3
+
+        # A second process-level handle on the same file sees the same entries
+        other = PredictionCache(SharedCacheBackend(max_size=3, path=path), ttl_seconds=60)
+        assert other.get("v2:k4", "v2") == {"i": 4}
+        # A worker that loads a new version later does not wipe what the others wrote
+        other.get("v3:k4", "v3")
+        assert cache.get("v2:k4", "v2") == {"i": 4}
+    print("✅ Shared cache evicts by size and TTL and is visible across handles!")
+
+
+def test_predict_uses_cache():
+    client = app.test_client()
+    if app_module.PREDICTION_CACHE is None:
+        print("Prediction cache disabled; skipping.")
+        return
+    app_module.PREDICTION_CACHE.clear()
+    before = app_module.PREDICTION_CACHE.stats()
+
+    first = client.post("/predict", json=BASE_RECORD).get_json()
+    second = client.post("/predict", json={**BASE_RECORD, "age": "45"}).get_json()
+    assert first == second
+    after = client.get("/cache_stats").get_json()
+    print(f"Cache stats: {after}")
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
+
+    # Rejected records are not cached
+    bad = {**BASE_RECORD, "age": 10}
+    assert client.post("/predict", json=bad).status_code == 400
+    assert client.post("/predict", json=bad).status_code == 400
+    print("✅ /predict serves repeated payloads from the cache!")
+
+
+if __name__ == "__main__":
+    test_cache_keys_are_canonical()
+    test_local_backend_lru_ttl_and_invalidation()
+    test_shared_backend_lru_ttl_and_invalidation()
+    test_predict_uses_cache()
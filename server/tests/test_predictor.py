@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Add current directory to path
+sys.path.append('.')
+
+import model_reload
+import preprocessor
+from preprocessor import load_assets, current_predictor
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def _copy_bundle(target: Path):
+    # shutil.copy gives the files new modification times, hence a new bundle version
+    target.mkdir(parents=True, exist_ok=True)
+    for path in preprocessor.artifact_paths().values():
+        shutil.copy(path, target / Path(path).name)
+
+
+def _restore(original):
+    preprocessor.ACTIVE_PREDICTOR = original
+    preprocessor.PREVIOUS_PREDICTORS.clear()
+
+
+def test_predictor_is_immutable():
+    predictor = load_assets()
+    assert current_predictor() is predictor
+    try:
+        predictor.final_model = None
+    except dataclasses.FrozenInstanceError:
+        pass
+    else:
+        raise AssertionError("Predictor fields must not be assignable")
+
+    # The module-level functions run on the active predictor
+    assert preprocessor.predict_records([BASE_RECORD]) == predictor.predict_records([BASE_RECORD])
+    assert preprocessor.prediction_cache_key(BASE_RECORD).startswith(predictor.version + ":")
+
+    print("✅ Predictor holds one fixed set of artifacts!")
+
+
+def test_reload_swaps_and_rolls_back():
+    import app as server_app
+
+    original = load_assets()
+    preprocessor.PREVIOUS_PREDICTORS.clear()
+    client = server_app.app.test_client()
+    saved_token = server_app.ADMIN_TOKEN
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle = Path(tmp) / "v2"
+            _copy_bundle(bundle)
+
+            # Disabled without a token, and the token is checked
+            server_app.ADMIN_TOKEN = ""
+            assert client.post("/model/reload").status_code == 403
+            server_app.ADMIN_TOKEN = "secret"
+            assert client.post("/model/reload", headers={"Authorization": "Bearer wrong"}).status_code == 401
+            auth = {"Authorization": "Bearer secret"}
+
+            # Requests keep flowing while the new bundle loads and is swapped in
+            results, errors, stop = [], [], threading.Event()
+
+            def hammer():
+                while not stop.is_set():
+                    response = client.post("/predict", json=BASE_RECORD)
+                    if response.status_code != 200:
+                        errors.append(response.get_json())
+                    else:
+                        results.append((response.headers["X-Model-Version"], response.get_json()))
+
+            threads = [threading.Thread(target=hammer) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            response = client.post("/model/reload", json={"models_dir": str(bundle), "wait": True}, headers=auth)
+            time.sleep(0.2)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            body = response.get_json()
+            print(f"/model/reload: {body}")
+            assert response.status_code == 200, body
+            new_version = body["active"]["version"]
+            assert new_version != original.version and current_predictor().source == str(bundle)
+            assert not errors, errors[:3]
+            assert {version for version, _ in results} <= {original.version, new_version}
+            assert all(body["model_version"] == version for version, body in results)
+            assert len({body["probability_of_disease"] for _, body in results}) == 1  # same model files
+
+            info = client.get("/model").get_json()
+            assert info["active"]["version"] == new_version
+            assert [p["version"] for p in info["previous"]] == [original.version]
+            assert client.get("/").headers["X-Model-Version"] == new_version
+
+            # Rollback returns to the previous bundle object, once
+            response = client.post("/model/rollback", headers=auth)
+            assert response.status_code == 200 and current_predictor() is original
+            assert client.post("/model/rollback", headers=auth).status_code == 409
+
+            # A bundle that fails to load leaves the active one in service
+            response = client.post("/model/reload", json={"models_dir": str(Path(tmp) / "missing"), "wait": True},
+                                   headers=auth)
+            assert response.status_code == 500 and current_predictor() is original
+            assert model_reload.RELOAD["status"] == "failed"
+    finally:
+        server_app.ADMIN_TOKEN = saved_token
+        _restore(original)
+
+    print("✅ Bundles are swapped atomically under load and rolled back!")
+
+
+def test_watcher_reloads_changed_files():
+    original = load_assets()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            bundle = Path(tmp)
+            _copy_bundle(bundle)
+            first = model_reload.reload(bundle)
+            watcher = threading.Thread(target=model_reload._watch, args=(bundle, 0.1), daemon=True)
+            watcher.start()
+
+            time.sleep(0.3)
+            assert current_predictor() is first  # nothing changed yet
+            _copy_bundle(bundle)
+            deadline = time.time() + 60
+            while current_predictor() is first and time.time() < deadline:
+                time.sleep(0.1)
+            assert current_predictor() is not first
+            assert current_predictor().version == preprocessor.assets_fingerprint(bundle)
+    finally:
+        _restore(original)
+
+    print("✅ Changed bundle files are picked up by the watcher!")
+
+
+def test_polling_turns_memory_mapping_off():
+    # Files the watcher reloads may be overwritten in place; mapped arrays would change under the model
+    def mmap_mode(**env):
+        base = {k: v for k, v in os.environ.items() if k not in ("ASSET_MMAP_MODE", "MODEL_RELOAD_POLL_SECONDS")}
+        return subprocess.run([sys.executable, "-c", "import config; print(config.ASSET_MMAP_MODE)"],
+                              capture_output=True, text=True, check=True, env={**base, **env}).stdout.strip()
+
+    assert mmap_mode() == "r"
+    assert mmap_mode(MODEL_RELOAD_POLL_SECONDS="5") == "None"
+    assert mmap_mode(MODEL_RELOAD_POLL_SECONDS="5", ASSET_MMAP_MODE="r") == "r"
+    print("✅ Hot reload polling loads assets without memory maps!")
+
+
+if __name__ == "__main__":
+    test_predictor_is_immutable()
+    test_reload_swaps_and_rolls_back()
+    test_watcher_reloads_changed_files()
+    test_polling_turns_memory_mapping_off()
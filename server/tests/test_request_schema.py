@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+import request_schema
+from request_schema import RequestSchema, load_field_specs, parse_field_definitions, error_body
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def _codes(errors):
+    return [(error["field"], error["code"]) for error in errors]
+
+
+def test_field_specs_match_the_frontend():
+    source = request_schema.FIELD_DEFINITIONS_PATH
+    if not source.exists():
+        print("client/ is not checked out; skipping.")
+        return
+    assert load_field_specs() == parse_field_definitions(source.read_text(), source), \
+        "field_specs.json is stale: run python request_schema.py sync"
+    print("✅ field_specs.json matches validate_fields.js!")
+
+
+def test_records_are_parsed_into_typed_values():
+    schema = RequestSchema(load_field_specs(), "ranges")
+
+    record, errors = schema.parse({**BASE_RECORD, "age": "45", "income": "", "insulin": None, "extra": 1})
+    assert errors == []
+    assert record["age"] == 45.0 and type(record["age"]) is float
+    assert record["income"] is None and record["insulin"] is None
+    assert record["gender"] == "Male" and "extra" not in record
+    # Unknown categories and null ones still reach the pipeline's fallbacks
+    assert schema.parse({**BASE_RECORD, "dietary_habits": "High Sugar", "caffeine_intake": None})[1] == []
+
+    bad = {k: v for k, v in BASE_RECORD.items() if k != "glucose"}
+    bad.update(age=10, bmi="heavy", cholesterol=None, heart_rate=True, gender=1, income=10 ** 7)
+    record, errors = schema.parse(bad)
+    assert record is None
+    assert _codes(errors) == [("gender", "type"), ("age", "range"), ("heart_rate", "type"), ("glucose", "missing"),
+                              ("cholesterol", "null"), ("bmi", "type"), ("income", "range")], errors
+    body = error_body(errors)
+    assert body["error"] == request_schema.INVALID_FIELDS_ERROR and body["missing"] == ["glucose"]
+    assert errors[1]["min"] == 18 and errors[1]["message"] == "age must be between 18 and 100"
+
+    assert schema.parse([BASE_RECORD])[1][0]["code"] == "type"
+    print("✅ Records are type-checked and range-checked in one pass!")
+
+
+def test_validation_modes():
+    specs = load_field_specs()
+    unknown = {**BASE_RECORD, "dietary_habits": "High Sugar", "age": 10}
+
+    assert _codes(RequestSchema(specs, "strict").parse(unknown)[1]) == [("age", "range"), ("dietary_habits", "option")]
+    assert _codes(RequestSchema(specs, "ranges").parse(unknown)[1]) == [("age", "range")]
+    record, errors = RequestSchema(specs, "off").parse(unknown)
+    assert errors == [] and record is unknown
+    assert _codes(RequestSchema(specs, "off").parse({"age": 45})[1])[0] == ("gender", "missing")
+
+    # Fields the form does not define follow config.py
+    without_age = {name: spec for name, spec in specs.items() if name != "age"}
+    record, errors = RequestSchema(without_age, "ranges").parse({**BASE_RECORD, "age": 10})
+    assert errors == [] and record["age"] == 10.0
+    print("✅ Validation modes!")
+
+
+def test_columns_are_parsed_like_records():
+    rows = [BASE_RECORD, {**BASE_RECORD, "age": "45", "income": "", "insulin": None},
+            {**BASE_RECORD, "dietary_habits": "High Sugar", "age": 10, "heart_rate": True},
+            {**BASE_RECORD, "bmi": "heavy", "cholesterol": None, "gender": 1}]
+    columns = {name: [row[name] for row in rows] for name in BASE_RECORD}
+    for mode in ("strict", "ranges", "off"):
+        schema = RequestSchema(load_field_specs(), mode)
+        typed, valid, row_errors = schema.parse_columns(columns, len(rows))
+        for i, row in enumerate(rows):
+            record, errors = schema.parse(row)
+            assert row_errors.get(i, []) == errors, (mode, i)
+            if record is not None:
+                j = list(valid).index(i)
+                parsed = {name: values[j] for name, values in typed.items()}
+                assert {k: None if v != v else v for k, v in parsed.items()} == record, (mode, i)
+    print("✅ Columns get the same typed values and field errors as records!")
+
+
+def test_predict_rejects_invalid_fields():
+    import app as server_app
+    from preprocessor import load_assets
+
+    load_assets()
+    client = server_app.app.test_client()
+    response = client.post("/predict", json={**BASE_RECORD, "age": 10, "bmi": "heavy"})
+    body = response.get_json()
+    assert response.status_code == 400, body
+    assert _codes(body["errors"]) == [("age", "range"), ("bmi", "type")]
+
+    response = client.post("/predict", json={"age": 45})
+    assert response.status_code == 400 and response.get_json()["error"] == request_schema.MISSING_FIELDS_ERROR
+
+    # Numeric strings score like numbers; the response parses the same with either JSON library
+    response = client.post("/predict", json={**BASE_RECORD, "age": "45"})
+    assert response.status_code == 200
+    assert json.loads(response.get_data()) == client.post("/predict", json=BASE_RECORD).get_json()
+    print(f"JSON library: {server_app.JSON_ENGINE}")
+    print("✅ /predict reports structured field errors!")
+
+
+def test_orjson_provider_matches_the_default():
+    import fast_json
+    from flask import Flask
+
+    if fast_json.orjson is None:
+        print("orjson is not installed; skipping.")
+        return
+    app = Flask(__name__)
+    assert fast_json.install(app, "json") == "json"
+    default = app.json
+    assert fast_json.install(app) == "orjson"
+    payload = {"b": [1, 2.5, None, True], "a": {"ü": "x"}, "3": "digits"}
+    with app.app_context():
+        assert json.loads(app.json.dumps(payload)) == json.loads(default.dumps(payload))
+        assert list(json.loads(app.json.response(payload).get_data())) == ["3", "a", "b"]  # sorted keys
+        assert app.json.loads(b'{"age": 45}') == {"age": 45}
+    print("✅ The orjson provider serializes like Flask's default!")
+
+
+if __name__ == "__main__":
+    test_field_specs_match_the_frontend()
+    test_records_are_parsed_into_typed_values()
+    test_validation_modes()
+    test_columns_are_parsed_like_records()
+    test_predict_rejects_invalid_fields()
+    test_orjson_provider_matches_the_default()
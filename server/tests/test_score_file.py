@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import os
+import sys
+import tempfile
+
+# Add current directory to path
+sys.path.append('.')
+
+from config import USER_INPUT_COLUMNS, WARMUP_RECORDS
+from preprocessor import load_assets, predict_records
+from score_file import score_file
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+# Row numbers of the records that must be rejected, and the stage expected for each
+BAD_ROWS = {3: "ordinal_encoding", 11: "scaling"}
+
+
+def make_records(n=24):
+    records = []
+    for i in range(n):
+        record = dict(BASE_RECORD, age=25 + i * 2, glucose=90 + i * 5, patient_id=f"P{i}")
+        if i % 4 == 1:
+            record["insulin"] = None  # imputed, not rejected
+        records.append(record)
+    records[3]["age"] = 10  # below the first age bin
+    records[11]["glucose"] = "inf"
+    return records
+
+
+def read_results(path):
+    with open(path) as f:
+        if path.endswith(".csv"):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f]
+
+
+def check_run(stats, records, output, rejects, bad_rows=BAD_ROWS):
+    results = read_results(output)
+    rejected = read_results(rejects)
+    print(f"Stats: {stats}")
+    assert stats["rows"] == len(records) and stats["rejected"] == len(rejected)
+
+    assert [int(r["row"]) for r in results] == [i for i in range(len(records)) if i not in bad_rows]
+    assert {r["row"]: r["stage"] for r in rejected} == bad_rows
+    for r in rejected:
+        if r["stage"] != "parse":  # unparsable lines are kept as raw text
+            assert r["record"]["patient_id"] == f"P{r['row']}"
+
+    valid = [{col: records[int(r["row"])][col] for col in USER_INPUT_COLUMNS} for r in results]
+    expected = predict_records(valid)
+    for result, exp in zip(results, expected):
+        assert result["patient_id"] == f"P{result['row']}"
+        assert result["prediction_label"] == exp["prediction_label"]
+        assert abs(float(result["probability_of_disease"]) - exp["probability_of_disease"]) < 1e-9
+
+
+def test_score_csv_in_process():
+    load_assets()
+    records = make_records()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "population.csv")
+        with open(source, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(records[0]))
+            writer.writeheader()
+            writer.writerows(records)
+
+        output, rejects = os.path.join(tmp, "scores.csv"), os.path.join(tmp, "rejects.jsonl")
+        stats = score_file(source, output, rejects, chunk_size=10, workers=1, id_column="patient_id")
+        assert stats["chunks"] == 3
+        check_run(stats, records, output, rejects)
+
+    print("✅ CSV scored in order with rejects isolated!")
+
+
+def test_score_jsonl_with_workers():
+    load_assets()
+    records = make_records()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "population.jsonl")
+        with open(source, "w") as f:
+            for i, record in enumerate(records):
+                f.write("{not json\n" if i == 7 else json.dumps(record) + "\n")
+
+        output = os.path.join(tmp, "scores.jsonl")
+        stats = score_file(source, output, chunk_size=8, workers=2, id_column="patient_id")
+        assert stats["rejects"].endswith("scores.rejects.jsonl")
+        check_run(stats, records, output, stats["rejects"], {**BAD_ROWS, 7: "parse"})
+
+    print("✅ JSONL scored on a worker pool, parse errors rejected!")
+
+
+def test_parquet_ids_change_type_between_chunks():
+    import pyarrow.parquet as pq
+
+    load_assets()
+    records = make_records(16)
+    for i, record in enumerate(records):
+        record["patient_id"] = None if i < 8 else 1000 + i  # the first chunk's ids are all empty
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "population.jsonl")
+        with open(source, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+        output = os.path.join(tmp, "scores.parquet")
+        stats = score_file(source, output, chunk_size=8, workers=1, id_column="patient_id")
+        assert stats["chunks"] == 2
+        table = pq.read_table(output)
+        assert [str(field.type) for field in table.schema] == ["int64", "string", "string", "double"]
+        ids = table.column("patient_id").to_pylist()
+        assert ids[:3] == [None, None, None] and ids[-1] == "1015"
+
+        # From CSV, pandas reads the ids of the first chunk as float (empty cells) and of the next as int
+        source = os.path.join(tmp, "population.csv")
+        with open(source, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(records[0]))
+            writer.writeheader()
+            writer.writerows({**record, "patient_id": "" if i == 0 else record["patient_id"] or i}
+                             for i, record in enumerate(records))
+        score_file(source, output, chunk_size=8, workers=1, id_column="patient_id")
+        ids = pq.read_table(output).column("patient_id").to_pylist()
+        assert ids[:2] == [None, "1"] and ids[-1] == "1015"
+
+    print("✅ Parquet output keeps one schema across chunks!")
+
+
+if __name__ == "__main__":
+    test_score_csv_in_process()
+    test_score_jsonl_with_workers()
+    test_parquet_ids_change_type_between_chunks()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import subprocess
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+import startup
+from app import app
+
+
+def test_ready_and_status_routes():
+    client = app.test_client()
+
+    ready = client.get("/ready")
+    body = ready.get_json()
+    print(f"/ready: {body}")
+    assert ready.status_code == 200 and body["ready"]
+    assert {"load_assets_seconds", "warm_up_seconds"} <= set(body["timings"])
+    assert client.get("/").get_json()["status"] == "API is operational"
+
+    saved = dict(startup.STATE)
+    try:
+        startup.STATE.update(status="loading")
+        assert client.get("/ready").status_code == 503
+        assert client.get("/").get_json()["status"] == "API is starting"
+        response = client.post("/predict", json={"age": 45})
+        assert response.status_code == 503 and response.headers["Retry-After"]
+
+        startup.STATE.update(status="failed", error="Required asset not found")
+        assert client.get("/ready").status_code == 503
+        home = client.get("/")
+        assert home.status_code == 503 and home.get_json()["error"] == "Required asset not found"
+    finally:
+        startup.STATE.clear()
+        startup.STATE.update(saved)
+
+    print("✅ / and /ready report startup state!")
+
+
+def test_app_import_defers_heavy_modules():
+    # Importing the request path must not pull in pandas; artifact loading may
+    code = "import sys, preprocessor, batcher, prediction_cache, transform_plan; print('pandas' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False", output
+    print("✅ pandas is only imported when needed!")
+
+
+if __name__ == "__main__":
+    test_ready_and_status_routes()
+    test_app_import_defers_heavy_modules()
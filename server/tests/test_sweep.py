@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import sys
+
+import numpy as np
+
+# Add current directory to path
+sys.path.append('.')
+
+import sweep
+from config import MAX_BATCH_SIZE, WARMUP_RECORDS
+from preprocessor import load_assets
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def _points(record, axes):
+    varied, n_points = sweep.grid(axes)
+    return [{**record, **{col: values[i] for col, values in varied.items()}} for i in range(n_points)]
+
+
+def test_sweep_matches_scoring_each_point():
+    predictor = load_assets()
+    record = {**BASE_RECORD, "insulin": None, "income": None}
+    cases = [
+        [("bmi", np.linspace(15, 45, 31))],
+        [("age", np.linspace(10, 90, 9)), ("glucose", np.linspace(60, 300, 7))],  # ages < 18 fail
+        [("insulin", np.linspace(2, 40, 5)), ("physical_activity", np.array([0, 10, 20], dtype=object))],
+        [("smoking_status", np.array(["Never", "Heavy Smoker", "bogus"], dtype=object)),
+         ("heart_rate", np.array([50, None, "fast"], dtype=object))],
+        [("caffeine_intake", np.array(["None", None], dtype=object)),
+         ("stress_level", np.array(["Low", "High", 3], dtype=object))],
+    ]
+    for axes in cases:
+        varied, n_points = sweep.grid(axes)
+        expected = predictor.score_batch(_points(record, axes))
+        assert predictor.score_sweep(record, varied, n_points) == expected, [field for field, _ in axes]
+
+    # The pandas pipeline scores every point in full
+    reference = dataclasses.replace(predictor, transform_plan=None)
+    varied, n_points = sweep.grid(cases[0])
+    assert reference.score_sweep(record, varied, n_points) == predictor.score_sweep(record, varied, n_points)
+
+    print("✅ Sweeps score every point exactly like separate records!")
+
+
+def test_sweep_endpoint():
+    import app as server_app
+
+    load_assets()
+    client = server_app.app.test_client()
+    response = client.post("/predict_sweep", json={
+        "record": BASE_RECORD,
+        "sweep": [{"field": "age", "start": 20, "stop": 90, "steps": 8},
+                  {"field": "smoking_status", "values": ["Never", "Heavy Smoker"]}],
+    })
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body["model_version"] == response.headers["X-Model-Version"]
+    assert [axis["field"] for axis in body["axes"]] == ["age", "smoking_status"]
+    assert np.array(body["probability_of_disease"], dtype=object).shape == (8, 2)
+
+    assert "errors" not in body
+    point = {**BASE_RECORD, "age": 30.0, "smoking_status": "Heavy Smoker"}
+    single = client.post("/predict", json=point).get_json()
+    assert body["probability_of_disease"][1][1] == single["probability_of_disease"]
+    assert body["prediction_label"][1][1] == single["prediction_label"]
+
+    # Points are validated like records: age 10 is out of range, so the sweep is a 400 naming the points
+    response = client.post("/predict_sweep", json={
+        "record": BASE_RECORD,
+        "sweep": [{"field": "age", "start": 10, "stop": 80, "steps": 8},
+                  {"field": "smoking_status", "values": ["Never", 3]}],
+    })
+    errors = response.get_json()["errors"]
+    assert response.status_code == 400
+    assert [(error["field"], error["index"], error["code"]) for error in errors] == \
+        [("age", 0, "range"), ("smoking_status", 1, "type")], errors
+
+    curve = client.post("/predict_sweep", json={
+        "record": BASE_RECORD, "sweep": {"field": "bmi", "start": 18, "stop": 40, "steps": 50},
+    }).get_json()
+    assert len(curve["probability_of_disease"]) == 50 and "errors" not in curve
+    print(f"BMI risk curve: {curve['probability_of_disease'][::10]}")
+
+    # Malformed sweeps are client errors
+    for bad in [None, [], {"field": "height", "values": [1]}, {"field": "gender", "start": 0, "stop": 1, "steps": 2},
+                {"field": "bmi", "start": 18, "stop": 40, "steps": 0}, {"field": "bmi", "values": []},
+                [{"field": "bmi", "values": [20]}] * 2]:
+        response = client.post("/predict_sweep", json={"record": BASE_RECORD, "sweep": bad})
+        assert response.status_code == 400, (bad, response.get_json())
+    response = client.post("/predict_sweep", json={"record": {"age": 45}, "sweep": {"field": "bmi", "values": [20]}})
+    assert response.status_code == 400 and "missing" in response.get_json()
+    too_many = [{"field": "bmi", "start": 18, "stop": 40, "steps": 1000}, {"field": "age", "values": list(range(18, 30))}]
+    assert 1000 * 12 > MAX_BATCH_SIZE
+    assert client.post("/predict_sweep", json={"record": BASE_RECORD, "sweep": too_many}).status_code == 413
+
+    print("✅ /predict_sweep returns the risk curve!")
+
+
+if __name__ == "__main__":
+    test_sweep_matches_scoring_each_point()
+    test_sweep_endpoint()
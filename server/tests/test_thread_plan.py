@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+
+# Add current directory to path
+sys.path.append('.')
+
+import thread_plan
+from thread_plan import cgroup_cpu_limit, compute_plan, model_threads
+from config import WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_cgroup_cpu_limit():
+    with tempfile.TemporaryDirectory() as root:
+        proc = os.path.join(root, "proc_self_cgroup")
+
+        # cgroup v2, limited to 1.5 CPUs in the process' own group
+        _write(proc, "0::/app.slice/api\n")
+        _write(os.path.join(root, "app.slice/api/cpu.max"), "150000 100000\n")
+        assert cgroup_cpu_limit(root, proc) == 1.5
+
+        # cgroup v2 without a limit
+        _write(os.path.join(root, "app.slice/api/cpu.max"), "max 100000\n")
+        assert cgroup_cpu_limit(root, proc) is None
+
+    with tempfile.TemporaryDirectory() as root:
+        proc = os.path.join(root, "proc_self_cgroup")
+
+        # cgroup v1 (container view: the group is mounted at the controller root)
+        _write(proc, "4:memory:/docker/abc\n2:cpu,cpuacct:/docker/abc\n")
+        _write(os.path.join(root, "cpu/cpu.cfs_quota_us"), "200000\n")
+        _write(os.path.join(root, "cpu/cpu.cfs_period_us"), "100000\n")
+        assert cgroup_cpu_limit(root, proc) == 2.0
+
+        _write(os.path.join(root, "cpu/cpu.cfs_quota_us"), "-1\n")
+        assert cgroup_cpu_limit(root, proc) is None
+
+    with tempfile.TemporaryDirectory() as root:
+        assert cgroup_cpu_limit(root, os.path.join(root, "missing")) is None
+
+    print("✅ cgroup v1/v2 CPU quotas are read!")
+
+
+def test_compute_plan():
+    plan = compute_plan(cpus=8, workers=2, threads=2, batch_rows=512)
+    assert plan["concurrent_requests"] == 4 and not plan["oversubscribed"]
+    assert plan["blas_threads"] == plan["openmp_threads"] == plan["lightgbm_batch_threads"] == 2
+    assert plan["lightgbm_single_row_threads"] == 1
+
+    # A fractional quota rounds down, and oversubscription still leaves one thread each
+    plan = compute_plan(cpus=1.5, workers=4, threads=1, batch_rows=512)
+    assert plan["cpu_budget"] == 1 and plan["oversubscribed"]
+    assert plan["blas_threads"] == plan["lightgbm_batch_threads"] == 1
+
+    print("✅ Threads are split between concurrent requests!")
+
+
+def test_applied_plan_and_diagnostics_endpoint():
+    from app import app
+    from preprocessor import predict_records
+
+    saved = thread_plan.ACTIVE_PLAN
+    omp_threads = os.environ.pop("OMP_NUM_THREADS", None)
+    try:
+        plan = thread_plan.apply_plan(compute_plan(cpus=4, workers=1, threads=1, batch_rows=100))
+        assert model_threads(1) == 1 and model_threads(99) == 1
+        assert model_threads(100) == model_threads(5000) == 4
+
+        body = app.test_client().get("/diagnostics").get_json()
+        print(f"/diagnostics: {body}")
+        assert body["plan"] == plan and body["pid"] == os.getpid()
+        assert any(pool["user_api"] == "blas" and pool["num_threads"] == 4 for pool in body["threadpools"])
+
+        # Scoring is unaffected by the thread counts
+        assert predict_records([BASE_RECORD] * 3) == predict_records([BASE_RECORD]) * 3
+
+        # A variable the operator set keeps its pool out of the plan
+        thread_plan.apply_plan(compute_plan(cpus=2, workers=1, threads=1))
+        os.environ["OMP_NUM_THREADS"] = "3"
+        plan = thread_plan.apply_plan(compute_plan(cpus=4, workers=1, threads=1))
+        assert plan["operator_environment"] == {"OMP_NUM_THREADS": "3"}
+        pools = thread_plan.diagnostics()["threadpools"]
+        assert all(pool["num_threads"] == 2 for pool in pools if pool["user_api"] == "openmp")
+        assert any(pool["user_api"] == "blas" and pool["num_threads"] == 4 for pool in pools)
+    finally:
+        if omp_threads is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = omp_threads
+        thread_plan.apply_plan(saved or compute_plan(1, 1, 1))
+        thread_plan.ACTIVE_PLAN = saved
+
+    print("✅ Thread plan applied and reported on /diagnostics!")
+
+
+if __name__ == "__main__":
+    test_cgroup_cpu_limit()
+    test_compute_plan()
+    test_applied_plan_and_diagnostics_endpoint()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+# Add current directory to path
+sys.path.append('.')
+
+import train_and_save_preprocessors as training
+from config import ONE_HOT_ENCODER_PATH, CAT_COLS, WARMUP_RECORDS
+from preprocessor import load_predictor
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+# (low, high) of the synthetic training columns
+NUM_RANGES = {
+    "age": (18, 80), "bmi": (16, 40), "waist_size": (60, 120), "blood_pressure": (90, 180),
+    "heart_rate": (50, 110), "cholesterol": (150, 280), "glucose": (70, 200), "insulin": (2, 40),
+    "work_hours": (20, 60), "physical_activity": (0, 10), "calorie_intake": (1500, 3500),
+    "sugar_intake": (10, 100), "water_intake": (1, 4), "stress_level": (1, 3),
+    "mental_health_score": (20, 100), "income": (20000, 120000),
+}
+
+
+def make_dataset(path: Path, n_rows: int = 600, seed: int = 0):
+    """Training rows with the production encoder's categories and a glucose/age driven target."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    categories = dict(zip(CAT_COLS, joblib.load(ONE_HOT_ENCODER_PATH).categories_))
+    df = pd.DataFrame({col: rng.uniform(low, high, n_rows).round(1) for col, (low, high) in NUM_RANGES.items()})
+    for col in training.RAW_CAT_COLS:
+        df[col] = rng.choice([c for c in categories[col] if c != "Unknown"], n_rows)
+    for col in ["blood_pressure", "insulin", "income"]:
+        df.loc[rng.random(n_rows) < 0.1, col] = np.nan
+    risk = (df["glucose"] - 135) / 30 + (df["age"] - 50) / 20 + rng.normal(0, 0.5, n_rows)
+    df[training.TARGET_COL] = np.where(risk > 0, "diseased", "healthy")
+    df.to_csv(path, index=False)
+
+
+def test_training_pipeline_writes_servable_artifacts():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        make_dataset(tmp / "train.csv")
+        common = [str(tmp / "train.csv"), "--cache-dir", str(tmp / "cache"), "--resample", "none"]
+
+        assert training.main(common + ["-o", str(tmp / "v1"), "--params", '{"n_estimators": 30, "num_leaves": 7}']) == 0
+        report = json.loads((tmp / "v1" / training.REPORT_FILE).read_text())
+        assert not any(stage["cached"] for stage in report["stages"].values())
+        assert report["test_roc_auc"] > 0.8, report
+
+        predictor = load_predictor(tmp / "v1", model_format="joblib")
+        assert predictor.transform_plan is not None and predictor.tree_evaluator is not None
+        assert predictor.final_model.n_estimators == 30
+        result = predictor.predict_records([BASE_RECORD])[0]
+        assert 0.0 <= result["probability_of_disease"] <= 1.0
+
+        # A new search reuses imputation, encoding, the split and PCA
+        assert training.main(common + ["-o", str(tmp / "v2"), "--n-iter", "2", "--cv", "2", "--jobs", "2"]) == 0
+        report = json.loads((tmp / "v2" / training.REPORT_FILE).read_text())
+        cached = {name: stage["cached"] for name, stage in report["stages"].items()}
+        assert cached == {"prepare": True, "encode": True, "split": True, "pca": True, "search": False,
+                          "save": False}, cached
+        assert set(report["best_params"]) == set(training.PARAM_DISTRIBUTIONS)
+        print(f"Stage timings: {report['stages']}")
+
+        # Missing columns are reported, not a traceback
+        (tmp / "bad.csv").write_text("age,bmi\n40,25\n")
+        assert training.main([str(tmp / "bad.csv"), "-o", str(tmp / "bad"), "--no-cache"]) == 1
+
+    print("✅ The training pipeline writes artifacts the server loads, and caches its stages!")
+
+
+if __name__ == "__main__":
+    test_training_pipeline_writes_servable_artifacts()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+import preprocessor
+from preprocessor import load_assets
+from transform_plan import compile_transform_plan
+from config import USER_INPUT_COLUMNS, WARMUP_RECORDS
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def _reference(records):
+    df = pd.DataFrame(records, columns=USER_INPUT_COLUMNS)
+    return preprocessor._preprocess_input_pandas(df)
+
+
+def _compiled_plan():
+    # Compiled explicitly so the test also runs with PREPROCESS_MODE=pandas
+    predictor = preprocessor.current_predictor()
+    return compile_transform_plan(
+        predictor.one_hot_encoder, predictor.ordinal_encoder, predictor.standard_scaler,
+        predictor.knn_imputer, predictor.pca_transformer, predictor.final_features_list
+    )
+
+
+def test_transform_plan_matches_pandas_pipeline():
+    load_assets()
+    plan = _compiled_plan()
+
+    records = [
+        BASE_RECORD,
+        {**BASE_RECORD, "insulin": None, "income": None},
+        {**BASE_RECORD, "gender": "Other", "caffeine_intake": None, "exercise_type": "Yoga",
+         "smoking_status": "Heavy Smoker", "dietary_habits": "Low Carb"},
+        {**BASE_RECORD, "bmi": 18.5, "age": "61", "glucose": "125.0001"},
+        {**BASE_RECORD, "age": 18, "bmi": "30", "glucose": 125, "stress_level": "High"},
+    ]
+
+    expected = _reference(records)
+    from_records = plan.transform_records(records)
+    from_frame = plan.transform_frame(pd.DataFrame(records, columns=USER_INPUT_COLUMNS))
+    print(f"Max abs difference (records): {np.abs(expected - from_records).max()}")
+    assert np.allclose(expected, from_records, rtol=0, atol=1e-9)
+    assert np.allclose(expected, from_frame, rtol=0, atol=1e-9)
+
+    # Single-record calls must match their row of the batch
+    for i, record in enumerate(records):
+        assert np.allclose(plan.transform_records([record])[0], expected[i], rtol=0, atol=1e-9)
+
+    print("✅ Compiled transform plan matches the pandas pipeline!")
+
+
+def test_transform_plan_fails_in_the_same_stage():
+    load_assets()
+    plan = _compiled_plan()
+
+    bad_records = [
+        {**BASE_RECORD, "age": 10},
+        {**BASE_RECORD, "bmi": float("inf")},
+        {**BASE_RECORD, "cholesterol": None},
+        {**BASE_RECORD, "blood_pressure": float("inf")},
+    ]
+    for record in bad_records:
+        messages = []
+        for transform in (_reference, plan.transform_records):
+            try:
+                transform([record])
+                messages.append("")
+            except RuntimeError as e:
+                messages.append(str(e))
+        stages = [m.split(":")[0] for m in messages]
+        print(f"{stages}")
+        assert stages[0] and stages[0] == stages[1]
+
+    print("✅ Compiled transform plan reports errors from the same stage!")
+
+
+def test_folded_affine_matches_scaler_and_pca():
+    load_assets()
+    plan = _compiled_plan()
+
+    records = [BASE_RECORD, {**BASE_RECORD, "gender": "Female", "bmi": 17.0, "age": 70, "glucose": 190}]
+    columns = {col: [record.get(col) for record in records] for col in USER_INPUT_COLUMNS}
+    unfolded = preprocessor.current_predictor().pca_transformer.transform(plan.build_feature_matrix(columns, len(records)))
+    folded = plan.transform_columns(columns, len(records))
+    print(f"Max abs difference (folded vs unfolded): {np.abs(folded - unfolded).max()}")
+    assert np.allclose(folded, unfolded, rtol=0, atol=1e-9)
+
+    print("✅ Folded Scaling + PCA matches the separate transforms!")
+
+
+if __name__ == "__main__":
+    test_transform_plan_matches_pandas_pipeline()
+    test_folded_affine_matches_scaler_and_pca()
+    test_transform_plan_fails_in_the_same_stage()
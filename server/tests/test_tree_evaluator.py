@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import numpy as np
+import joblib
+import sys
+
+# Add current directory to path
+sys.path.append('.')
+
+import preprocessor
+from preprocessor import load_assets, preprocess_records, make_prediction, make_batch_prediction
+from config import FINAL_MODEL_PATH, WARMUP_RECORDS
+from tree_evaluator import compile_tree_ensemble
+
+BASE_RECORD = WARMUP_RECORDS[0]
+
+
+def test_flat_trees_match_booster():
+    print("Flattening the LightGBM model...")
+    model = joblib.load(FINAL_MODEL_PATH)
+    evaluator = compile_tree_ensemble(model)
+    print(f"{evaluator.n_trees} trees, {len(evaluator.value)} nodes, depth {evaluator.max_depth}")
+
+    # Split-exercising inputs, including exact thresholds and near-zero values
+    X = evaluator.parity_sample(2000, seed=7)
+    X[:20, :5] = 1e-40
+    expected = model.predict_proba(X)
+    batched = evaluator.predict_proba(X)
+    print(f"Max abs difference (batch): {np.abs(expected[:, 1] - batched).max()}")
+    assert np.allclose(expected[:, 1], batched, rtol=0, atol=1e-12)
+    assert np.array_equal(model.predict(X), (batched > 1 - batched).astype(int))
+
+    for i in range(25):
+        single = evaluator.predict_proba(X[i:i + 1])
+        assert single.shape == (1,)
+        assert abs(single[0] - expected[i, 1]) <= 1e-12
+
+    print("✅ Flattened trees match the LightGBM booster!")
+
+
+def test_predictions_match_model():
+    load_assets()
+    records = [
+        BASE_RECORD,
+        {**BASE_RECORD, "age": 70, "glucose": 190, "bmi": 34.0, "smoking_status": "Heavy Smoker"},
+        {**BASE_RECORD, "gender": "Female", "insulin": None, "income": None},
+    ]
+    X_pca = preprocess_records(records)
+    expected = preprocessor.current_predictor().final_model.predict_proba(X_pca)[:, 1]
+    expected_classes = preprocessor.current_predictor().final_model.predict(X_pca)
+
+    batch = make_batch_prediction(X_pca)
+    for i, result in enumerate(batch):
+        single = make_prediction(X_pca[i:i + 1])
+        print(f"Row {i}: {single}")
+        assert single == result
+        assert result["probability_of_disease"] == round(float(expected[i]), 4)
+        assert result["prediction_label"] == ("Disease" if expected_classes[i] == 1 else "No Disease")
+
+    print("✅ Predictions match the LightGBM model!")
+
+
+def test_early_exit_matches_lightgbm():
+    model = joblib.load(FINAL_MODEL_PATH)
+    evaluator = compile_tree_ensemble(model)
+    booster = model.booster_
+    X = evaluator.parity_sample(1000, seed=3)
+
+    for margin, freq in [(2.0, 10), (6.0, 1), (6.0, 25), (8.0, 64)]:
+        expected = booster.predict(X, raw_score=True, pred_early_stop=True, pred_early_stop_margin=margin,
+                                   pred_early_stop_freq=freq, num_threads=1)
+        raw, trees_used = evaluator.predict_raw_early_exit(X, margin, freq)
+        assert np.allclose(raw, expected, rtol=0, atol=1e-12), np.abs(raw - expected).max()
+        assert ((trees_used % freq == 0) | (trees_used == evaluator.n_trees)).all()
+        for i in range(10):
+            single_raw, single_trees = evaluator.predict_raw_early_exit(X[i:i + 1], margin, freq)
+            assert abs(single_raw[0] - expected[i]) <= 1e-12 and single_trees[0] == trees_used[i]
+        print(f"margin {margin:g} every {freq} trees: {trees_used.mean():.0f} of {evaluator.n_trees} trees per row")
+
+    # No bound: every tree, the full margin
+    raw, trees_used = evaluator.predict_raw_early_exit(X, np.inf, 10)
+    assert np.allclose(raw, evaluator.predict_raw(X), rtol=0, atol=1e-12) and (trees_used == evaluator.n_trees).all()
+
+    print("✅ Early exit stops where LightGBM's pred_early_stop does!")
+
+
+def test_early_exit_prediction_mode():
+    predictor = load_assets()
+    records = [
+        BASE_RECORD,
+        {**BASE_RECORD, "age": 70, "glucose": 190, "bmi": 34.0, "smoking_status": "Heavy Smoker"},
+        {**BASE_RECORD, "gender": "Female", "insulin": None, "income": None},
+    ]
+    X_pca = preprocess_records(records)
+    full = make_batch_prediction(X_pca)
+    assert all("trees_used" not in result for result in full)
+
+    # A bound no margin reaches changes nothing but the report
+    exact = predictor.make_batch_prediction(X_pca, early_exit_margin=1e9)
+    assert [{k: v for k, v in r.items() if k != "trees_used"} for r in exact] == full
+    assert all(r["trees_used"] == predictor.tree_evaluator.n_trees for r in exact)
+
+    early = predictor.make_batch_prediction(X_pca, early_exit_margin=1.0)
+    for i, result in enumerate(early):
+        assert 0 < result["trees_used"] < predictor.tree_evaluator.n_trees
+        assert predictor.make_prediction(X_pca[i:i + 1], early_exit_margin=1.0) == result
+    assert predictor.cache_key(BASE_RECORD, 1.0) != predictor.cache_key(BASE_RECORD)
+
+    # The booster evaluator applies LightGBM's own early stopping, without tree counts
+    booster_predictor = dataclasses.replace(predictor, tree_evaluator=None)
+    booster_early = booster_predictor.make_batch_prediction(X_pca, early_exit_margin=1.0)
+    assert [r["probability_of_disease"] for r in booster_early] == [r["probability_of_disease"] for r in early]
+    assert all(r["trees_used"] is None for r in booster_early)
+
+    # Opted into by the deployment: /predict reports the trees used, and caches apart from full results
+    import app as server_app
+    saved = server_app.EARLY_EXIT_MARGIN
+    client = server_app.app.test_client()
+    try:
+        server_app.EARLY_EXIT_MARGIN = 1.0
+        body = client.post("/predict", json=BASE_RECORD).get_json()
+        assert body["trees_used"] == early[0]["trees_used"]
+        assert body["probability_of_disease"] == early[0]["probability_of_disease"]
+        batch = client.post("/predict_batch", json=records).get_json()["results"]
+        assert [r["trees_used"] for r in batch] == [r["trees_used"] for r in early]
+        swept = client.post("/predict_sweep", json={"record": BASE_RECORD,
+                                                    "sweep": [{"field": "age", "values": [45]}]}).get_json()
+        assert swept["base"]["trees_used"] == early[0]["trees_used"]
+        assert swept["probability_of_disease"] == [early[0]["probability_of_disease"]]
+        server_app.EARLY_EXIT_MARGIN = 0.0
+        body = client.post("/predict", json=BASE_RECORD).get_json()
+        assert "trees_used" not in body and body["probability_of_disease"] == full[0]["probability_of_disease"]
+    finally:
+        server_app.EARLY_EXIT_MARGIN = saved
+
+    print(f"Early-exit results: {early}")
+    print("✅ Early-exit mode reports the trees it used!")
+
+
+if __name__ == "__main__":
+    test_flat_trees_match_booster()
+    test_predictions_match_model()
+    test_early_exit_matches_lightgbm()
+    test_early_exit_prediction_mode()
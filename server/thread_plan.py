@@ -0,0 +1,194 @@
+# thread_plan.py
+
+import math
+import os
+
+from config import THREAD_PLAN_ENABLED, THREAD_PLAN_CPUS, THREAD_PLAN_BATCH_ROWS
+
+# Server concurrency this process runs under. gunicorn.conf.py fills it in from its
+# workers/threads settings; the Flask development server is one worker, one thread.
+SERVER = {"workers": 1, "threads": 1}
+
+# The plan in effect in this process (None until apply_plan() ran)
+ACTIVE_PLAN = None
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Read once by the BLAS/OpenMP runtimes when they are loaded
+THREAD_ENV_VARS = {
+    "OMP_NUM_THREADS": "openmp_threads",
+    "OPENBLAS_NUM_THREADS": "blas_threads",
+    "MKL_NUM_THREADS": "blas_threads",
+}
+# The runtime (threadpoolctl internal_api) each of them sizes
+THREAD_ENV_APIS = {"OMP_NUM_THREADS": "openmp", "OPENBLAS_NUM_THREADS": "openblas", "MKL_NUM_THREADS": "mkl"}
+
+# THREAD_ENV_VARS set by export_environment() rather than by the operator
+_EXPORTED = set()
+
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _own_cgroup_paths(proc_cgroup: str = "/proc/self/cgroup") -> dict:
+    """{controller: path} of this process' cgroups ("" is the unified v2 hierarchy)."""
+    paths = {}
+    for line in (_read(proc_cgroup) or "").splitlines():
+        parts = line.split(":", 2)
+        if len(parts) == 3:
+            for controller in parts[1].split(","):
+                paths[controller] = parts[2]
+    return paths
+
+
+def cgroup_cpu_limit(root: str = CGROUP_ROOT, proc_cgroup: str = "/proc/self/cgroup"):
+    """
+    CPU quota of this process' cgroup in CPUs (e.g. 1.5), or None if unlimited.
+    Reads cgroup v2 `cpu.max`, falling back to v1 `cpu.cfs_quota_us`/`cpu.cfs_period_us`.
+    Inside a container the cgroup is usually mounted at the root, so the root
+    directory is tried too.
+    """
+    paths = _own_cgroup_paths(proc_cgroup)
+
+    v2_dirs = [os.path.join(root, paths.get("", "/").lstrip("/")), root]
+    for directory in v2_dirs:
+        value = _read(os.path.join(directory, "cpu.max"))
+        if value:
+            quota, _, period = value.partition(" ")
+            if quota == "max":
+                return None
+            return int(quota) / int(period or 100000)
+
+    v1_dirs = [os.path.join(root, "cpu", paths.get("cpu", "/").lstrip("/")), os.path.join(root, "cpu"),
+               os.path.join(root, "cpu,cpuacct")]
+    for directory in v1_dirs:
+        quota = _read(os.path.join(directory, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(directory, "cpu.cfs_period_us"))
+        if quota and period:
+            return None if int(quota) <= 0 else int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> tuple:
+    """(CPUs this process may use, where that number came from)."""
+    if THREAD_PLAN_CPUS:
+        return float(THREAD_PLAN_CPUS), "THREAD_PLAN_CPUS"
+    try:
+        cpus, source = float(len(os.sched_getaffinity(0))), "affinity"
+    except AttributeError:  # not available on macOS
+        cpus, source = float(os.cpu_count() or 1), "cpu_count"
+    quota = cgroup_cpu_limit()
+    if quota is not None and quota < cpus:
+        return quota, "cgroup quota"
+    return cpus, source
+
+
+def compute_plan(cpus: float, workers: int, threads: int, batch_rows: int = THREAD_PLAN_BATCH_ROWS) -> dict:
+    """
+    Thread counts for one worker process. Every request being served
+    concurrently (workers x threads) gets an equal share of the CPUs; single-row
+    calls stay on one thread whatever the share, since waking a pool for one row
+    costs more than it saves.
+    """
+    cpu_budget = max(1, math.floor(cpus))
+    concurrent_requests = max(1, workers) * max(1, threads)
+    per_request = max(1, cpu_budget // concurrent_requests)
+    return {
+        "cpus": cpus,
+        "cpu_budget": cpu_budget,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "concurrent_requests": concurrent_requests,
+        "oversubscribed": concurrent_requests > cpu_budget,
+        "blas_threads": per_request,
+        "openmp_threads": per_request,
+        "lightgbm_single_row_threads": 1,
+        "lightgbm_batch_threads": per_request,
+        "batch_rows_threshold": batch_rows,
+    }
+
+
+def plan_for_this_process() -> dict:
+    cpus, source = available_cpus()
+    plan = compute_plan(cpus, SERVER["workers"], SERVER["threads"])
+    plan["cpu_source"] = source
+    return plan
+
+
+def export_environment(plan: dict = None) -> dict:
+    """
+    Sets OMP_NUM_THREADS / OPENBLAS_NUM_THREADS / MKL_NUM_THREADS to the plan,
+    leaving any the operator already set alone. Only effective before NumPy,
+    SciPy and LightGBM are imported. It matters for OpenMP, whose limit set at
+    runtime applies to the calling thread only: request threads started later
+    take their default from OMP_NUM_THREADS.
+    """
+    if not THREAD_PLAN_ENABLED:
+        return {}
+    plan = plan or plan_for_this_process()
+    exported = {}
+    for var, key in THREAD_ENV_VARS.items():
+        if var not in os.environ:
+            os.environ[var] = exported[var] = str(plan[key])
+            _EXPORTED.add(var)
+    return exported
+
+
+def operator_environment() -> dict:
+    """The THREAD_ENV_VARS the operator set ({var: value}), which the plan does not override."""
+    return {var: os.environ[var] for var in THREAD_ENV_VARS if var in os.environ and var not in _EXPORTED}
+
+
+def apply_plan(plan: dict = None) -> dict:
+    """
+    Limits the BLAS and OpenMP thread pools of this process to the plan (the
+    planned one unless given) and makes it the one model_threads() follows.
+    A pool whose variable the operator set (OMP_NUM_THREADS, ...) keeps that
+    size. A no-op returning None when THREAD_PLAN_ENABLED is off.
+    """
+    global ACTIVE_PLAN
+
+    if not THREAD_PLAN_ENABLED:
+        return None
+    from threadpoolctl import threadpool_limits
+
+    plan = plan or plan_for_this_process()
+    operator = operator_environment()
+    limits = {THREAD_ENV_APIS[var]: plan[key] for var, key in THREAD_ENV_VARS.items() if var not in operator}
+    if "OPENBLAS_NUM_THREADS" not in operator and "MKL_NUM_THREADS" not in operator:
+        # Every BLAS, not only the two with a variable of their own
+        del limits["openblas"], limits["mkl"]
+        limits["blas"] = plan["blas_threads"]
+    # Not used as a context manager: the limits stay in place for the life of the process
+    threadpool_limits(limits=limits)
+    ACTIVE_PLAN = plan = {**plan, "operator_environment": operator}
+    return plan
+
+
+def model_threads(n_rows: int):
+    """LightGBM num_threads for a call scoring n_rows (None: library default, no plan applied)."""
+    if ACTIVE_PLAN is None:
+        return None
+    if n_rows < ACTIVE_PLAN["batch_rows_threshold"]:
+        return ACTIVE_PLAN["lightgbm_single_row_threads"]
+    return ACTIVE_PLAN["lightgbm_batch_threads"]
+
+
+def diagnostics() -> dict:
+    """Active plan and the thread pools threadpoolctl finds loaded in this process."""
+    from threadpoolctl import threadpool_info
+
+    return {
+        "pid": os.getpid(),
+        "enabled": THREAD_PLAN_ENABLED,
+        "plan": ACTIVE_PLAN,
+        "threadpools": [
+            {key: pool.get(key) for key in ("user_api", "internal_api", "num_threads", "prefix", "version")}
+            for pool in threadpool_info()
+        ],
+    }
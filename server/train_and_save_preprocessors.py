@@ -1,94 +1,382 @@
-# import joblib
-# import pandas as pd
-# import numpy as np
-# from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder, LabelEncoder
-# from sklearn.impute import KNNImputer
-# from sklearn.decomposition import PCA
-# from lightgbm import LGBMClassifier
-# from pathlib import Path
-# from config import MODELS_DIR
-#
-# # --- MOCK DATA/OBJECTS SETUP (Replace with your actual loaded/fitted objects) ---
-# # NOTE: YOU MUST REPLACE THIS SECTION WITH YOUR ACTUAL FITTED OBJECTS
-# # AND THE DATASETS USED TO FIT THEM (df_dropped, df_scaled, X_train_resampled, etc.)
-#
-# # Example Mock Setup (You must ensure your actual data loading and fitting happens here):
-# print("Simulating model training and fitting preprocessors...")
-#
-# # 1. Mock Data Setup (Replace with your actual data loading)
-# # Assuming you load/have the pandas DataFrame 'df' (the raw data)
-# # and 'df_dropped', 'df_filled', 'df_featured' as derived in your notebook.
-#
-# # Define column lists (as defined in your original script)
-# knn_impute_cols = ['blood_pressure', 'heart_rate', 'insulin', 'income']
-# num_cols = ['age', 'blood_pressure', 'heart_rate', 'glucose', 'insulin', 'cholesterol', 'triglycerides', 'hdl', 'ldl',
-#             'bmi', 'physical_activity_level', 'stress_level', 'income', 'caffeine_missing_flag', 'HOMA_IR']
-# cat_cols = ['gender', 'smoking_status', 'alcohol_consumption', 'marital_status', 'exercise_type', 'dietary_habits',
-#             'caffeine_intake', 'diabetes_risk_flag']
-# cat_ordinal_cols = ['bmi_cat', 'age_group']
-# bmi_order = [['Underweight', 'Normal', 'Overweight', 'Obese']]
-# age_order = [['Young', 'Adult', 'Middle-aged', 'Senior']]
-#
-# # 2. Mock Fitted Objects (REPLACE WITH YOUR ACTUAL FITTED OBJECTS)
-# # You need to re-fit these objects on the data they were originally fitted on
-# # using the exact lines from your model building script, or load them if they
-# # were already saved in your notebook environment.
-#
-# # Example: Re-initialize and fit (You must load the relevant data first)
-# # For the purpose of running this script: assume you load all required dataframes
-# # and re-run the fitting steps from your initial notebook.
-#
-# # Example of KNN Imputer fit:
-# knn_imputer = KNNImputer(n_neighbors=5)
-# # knn_imputer.fit(df_dropped[knn_impute_cols]) # <-- Need real data here
-#
-# # Example of Standard Scaler fit:
-# standardencoder = StandardScaler()
-# # standardencoder.fit(df_featured[num_cols]) # <-- Need real data here
-#
-# # ... and so on for all 5 preprocessors and the final model ...
-#
-# # --- END OF MOCK/REAL DATA LOADING AND FITTING ---
-#
-# # ⚠️ IMPORTANT: Please ensure the five preprocessors below (knn_imputer, standardencoder,
-# # ordinalencoder, onehotencoder, pca) and the final_model are the EXACT objects
-# # fitted and selected in your original notebook before running the saving code.
-#
-# # --- SAVING LOGIC (Using the variables from your notebook) ---
-#
-# MODELS_DIR.mkdir(exist_ok=True)  # Ensure the models directory exists
-#
-# try:
-#     # 1. KNN Imputer
-#     # joblib.dump(knn_imputer, MODELS_DIR / 'knn_imputer.joblib')
-#     print("knn_imputer saved.")
-#
-#     # 2. Standard Scaler
-#     # joblib.dump(standardencoder, MODELS_DIR / 'standard_scaler.joblib')
-#     print("standard_scaler saved.")
-#
-#     # 3. Ordinal Encoder
-#     # joblib.dump(ordinalencoder, MODELS_DIR / 'ordinal_encoder.joblib')
-#     print("ordinal_encoder saved.")
-#
-#     # 4. One-Hot Encoder
-#     # joblib.dump(onehotencoder, MODELS_DIR / 'one_hot_encoder.joblib')
-#     print("one_hot_encoder saved.")
-#
-#     # 5. PCA Transformer
-#     # joblib.dump(pca, MODELS_DIR / 'pca_90_variance.joblib')
-#     print("pca_90_variance saved.")
-#
-#     # 6. Final Model (already done in your script, but relocated here)
-#     # joblib.dump(final_model, MODELS_DIR / 'final_diseased_prediction_model_lgbm_tuned.joblib')
-#     print("final_diseased_prediction_model_lgbm_tuned saved.")
-#
-#     print("\nSUCCESS: All required assets have been saved to the 'models/' directory.")
-#
-# except NameError as e:
-#     print(f"\nERROR: Variable {e} is not defined.")
-#     print("You must replace the Mock Setup section above with the actual fitting logic from your notebook.")
-#     print(
-#         "Ensure all preprocessor and model variables (e.g., `knn_imputer`, `standardencoder`, `final_model`) are correctly defined before the saving block.")
-# except Exception as e:
-#     print(f"An error occurred during saving: {e}")
+#!/usr/bin/env python3
+"""
+Trains every artifact the server loads (KNN imputer, scaler, encoders, PCA,
+LightGBM model and the final feature list) from a dataset file, following the
+steps of notebook/FDM_Mini_Project_correct.ipynb with the column lists of
+config.py.
+
+Stages:
+
+  prepare   read the dataset, KNN imputation (incomplete rows split over the CPUs), caffeine flag,
+            IQR outlier filter, feature engineering
+  encode    StandardScaler, OrdinalEncoder, OneHotEncoder and LabelEncoder over the whole dataset
+  split     stratified train/test split, SMOTE oversampling of the training part
+  pca       PCA keeping --pca-variance of the variance (fit on the training part)
+  search    randomized LightGBM hyperparameter search over the CPUs (or --params to skip it)
+  save      writes the artifacts, loads them the way the server does and scores the warm-up records
+
+Each stage's result is cached in --cache-dir under a hash of the dataset, the
+config.py lists and the settings of that stage and every stage before it.
+Changing only the search or model settings reruns just the search, not the
+imputation and PCA. The wall time of every stage is printed at the end and
+written to training_report.json next to the artifacts.
+
+    python train_and_save_preprocessors.py data/final_assignment_dataset_reduce_overfit.csv -o /srv/models/v2
+    python train_and_save_preprocessors.py data.csv -o /srv/models/v2 --n-iter 40 --bundle
+    python train_and_save_preprocessors.py data.csv -o /srv/models/v3 --params '{"n_estimators": 300, "max_depth": 8}'
+
+Write to a new directory and switch to it with POST /model/reload rather than
+overwriting the directory the server is watching. SMOTE needs imbalanced-learn
+(not a server dependency); --resample none trains on the split as it is.
+Run from the server/ directory.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from config import (
+    FINAL_MODEL_PATH, STANDARD_SCALER_PATH, ORDINAL_ENCODER_PATH, ONE_HOT_ENCODER_PATH, KNN_IMPUTER_PATH,
+    PCA_TRANSFORMER_PATH, FINAL_FEATURES_LIST_PATH, KNN_IMPUTE_COLS, NUM_COLS, CAT_COLS, CAT_ORDINAL_COLS,
+    HOMA_IR_DIVISOR, GLUCOSE_RISK_THRESHOLD, WARMUP_RECORDS
+)
+from transform_plan import ENGINEERED_NUM_COLS, ORDINAL_BINNING
+
+TARGET_COL = "target"
+LABEL_ENCODER_FILE = "label_encoder.joblib"
+REPORT_FILE = "training_report.json"
+
+# Search space of the tuned model (FDM_Mini_Project_Best_Model.ipynb)
+PARAM_DISTRIBUTIONS = {
+    "n_estimators": [100, 200, 300, 400],
+    "learning_rate": [0.01, 0.05, 0.1, 0.2],
+    "max_depth": [5, 8, 12, -1],
+    "num_leaves": [20, 31, 50, 70],
+    "min_child_samples": [10, 20, 50],
+}
+
+# Columns read from the dataset: every non-engineered model input plus the target
+RAW_NUM_COLS = [c for c in NUM_COLS if c not in ENGINEERED_NUM_COLS]
+RAW_CAT_COLS = [c for c in CAT_COLS if c != "diabetes_risk_flag"]
+# The notebook filters outliers over every numeric column after imputation, the caffeine flag included
+OUTLIER_COLS = [c for c in NUM_COLS if c != "HOMA_IR"]
+
+
+# --- Stage cache ---
+
+def file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, write):
+    """write(temporary path), then rename it onto path."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class StageRunner:
+    """
+    Runs the stages in order, loading a stage's result from the cache directory
+    when the same inputs and settings were run before. Each key includes the key
+    of the previous stage, so a changed setting invalidates everything after it.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.key = ""
+        self.timings = {}
+
+    def run(self, name: str, settings: dict, fn):
+        self.key = hashlib.blake2b(json.dumps([self.key, name, settings], sort_keys=True, default=str).encode(),
+                                   digest_size=12).hexdigest()
+        path = self.cache_dir / f"{name}-{self.key}.joblib" if self.cache_dir is not None else None
+        started = time.perf_counter()
+        if path is not None and path.exists():
+            result, cached = joblib.load(path), True
+        else:
+            result, cached = fn(), False
+            if path is not None:
+                _write_atomic(path, lambda tmp: joblib.dump(result, tmp))
+        seconds = time.perf_counter() - started
+        self.timings[name] = {"seconds": round(seconds, 3), "cached": cached}
+        print(f"{name:<8} {seconds:8.2f} s{'  (cached)' if cached else ''}", flush=True)
+        return result
+
+
+# --- Stages ---
+
+def read_dataset(path):
+    import pandas as pd
+
+    path = Path(path)
+    if path.suffix.lower() in (".parquet", ".pq"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    missing = [c for c in RAW_NUM_COLS + RAW_CAT_COLS + [TARGET_COL] if c not in df.columns]
+    if missing:
+        raise ValueError(f"Dataset {path} is missing columns: {missing}")
+    return df[RAW_NUM_COLS + RAW_CAT_COLS + [TARGET_COL]].copy()
+
+
+def impute(knn_imputer, X, jobs: int):
+    """
+    knn_imputer.transform(X) for a DataFrame, with the incomplete rows (the only
+    ones that need a distance computation over the whole training set) split
+    over `jobs` processes. Every row is imputed on its own, so the result does
+    not depend on the split.
+    """
+    from joblib import Parallel, delayed
+
+    incomplete = np.flatnonzero(X.isna().to_numpy().any(axis=1))
+    if jobs <= 1 or len(incomplete) < 1000:
+        return knn_imputer.transform(X)
+    imputed = X.to_numpy(dtype=np.float64, copy=True)
+    chunks = np.array_split(incomplete, jobs * 4)
+    parts = Parallel(n_jobs=jobs)(delayed(knn_imputer.transform)(X.iloc[rows]) for rows in chunks)
+    for rows, part in zip(chunks, parts):
+        imputed[rows] = part
+    return imputed
+
+
+def prepare(path, knn_neighbors: int, iqr_factor: float, jobs: int = 1) -> tuple:
+    """(engineered DataFrame, fitted KNNImputer): imputation, flags, outlier filter, feature engineering."""
+    import pandas as pd
+    from sklearn.impute import KNNImputer
+
+    df = read_dataset(path)
+    df["exercise_type"] = df["exercise_type"].fillna("Undefined")
+    knn_imputer = KNNImputer(n_neighbors=knn_neighbors).fit(df[KNN_IMPUTE_COLS])
+    df[KNN_IMPUTE_COLS] = impute(knn_imputer, df[KNN_IMPUTE_COLS], jobs)
+    df["caffeine_missing_flag"] = df["caffeine_intake"].isnull().astype(int)
+    df["caffeine_intake"] = df["caffeine_intake"].fillna("Unknown")
+
+    if iqr_factor > 0:
+        q1, q3 = df[OUTLIER_COLS].quantile(0.25), df[OUTLIER_COLS].quantile(0.75)
+        iqr = q3 - q1
+        inside = ((df[OUTLIER_COLS] >= q1 - iqr_factor * iqr) & (df[OUTLIER_COLS] <= q3 + iqr_factor * iqr)).all(axis=1)
+        df = df[inside].copy()
+
+    for col, (source, edges, labels) in ORDINAL_BINNING.items():
+        df[col] = pd.cut(df[source], bins=edges, labels=labels, right=False, include_lowest=True)
+    df["HOMA_IR"] = (df["glucose"] * df["insulin"]) / HOMA_IR_DIVISOR
+    df["diabetes_risk_flag"] = np.where(df["glucose"] > GLUCOSE_RISK_THRESHOLD, "High Risk", "Normal/Pre-Risk")
+    return df, knn_imputer
+
+
+def encode(df) -> tuple:
+    """(feature DataFrame, encoded target, fitted encoders) with the column layout the server expects."""
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder, OneHotEncoder, OrdinalEncoder, StandardScaler
+
+    df = df.copy()
+    standard_scaler = StandardScaler()
+    df[NUM_COLS] = standard_scaler.fit_transform(df[NUM_COLS])
+
+    ordinal_encoder = OrdinalEncoder(categories=[ORDINAL_BINNING[col][2] for col in CAT_ORDINAL_COLS])
+    df[CAT_ORDINAL_COLS] = ordinal_encoder.fit_transform(df[CAT_ORDINAL_COLS])
+
+    one_hot_encoder = OneHotEncoder(drop="first", handle_unknown="ignore", sparse_output=False)
+    one_hot = pd.DataFrame(one_hot_encoder.fit_transform(df[CAT_COLS]),
+                           columns=one_hot_encoder.get_feature_names_out(CAT_COLS), index=df.index)
+
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(df[TARGET_COL])
+    X = df.drop(columns=CAT_COLS + [TARGET_COL]).join(one_hot)
+    encoders = {"standard_scaler": standard_scaler, "ordinal_encoder": ordinal_encoder,
+                "one_hot_encoder": one_hot_encoder, "label_encoder": label_encoder}
+    return X, y, encoders
+
+
+def _resample(X, y, method: str, seed: int) -> tuple:
+    if method == "none":
+        return X, y
+    try:
+        from imblearn.over_sampling import SMOTE
+    except ImportError:
+        raise RuntimeError("SMOTE oversampling needs imbalanced-learn (pip install imbalanced-learn); "
+                           "pass --resample none to train without it")
+    return SMOTE(random_state=seed).fit_resample(X, y)
+
+
+def split(X, y, test_size: float, resample: str, seed: int) -> dict:
+    """Stratified split; only the training part is oversampled. The training columns are the final feature list."""
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed, stratify=y)
+    X_train, y_train = _resample(X_train, y_train, resample, seed)
+    return {"X_train": X_train, "y_train": np.asarray(y_train), "X_test": X_test, "y_test": np.asarray(y_test),
+            "final_features_list": X_train.columns.tolist()}
+
+
+def fit_pca(data: dict, variance: float, seed: int) -> dict:
+    from sklearn.decomposition import PCA
+
+    pca = PCA(n_components=variance, random_state=seed)
+    X_train_pca = pca.fit_transform(data["X_train"])
+    return {"pca_transformer": pca, "X_train_pca": X_train_pca, "X_test_pca": pca.transform(data["X_test"])}
+
+
+def search(X, y, params: dict, n_iter: int, cv: int, jobs: int, seed: int) -> dict:
+    """
+    The final LGBMClassifier: fit with `params` as given, or the best of a
+    randomized search over PARAM_DISTRIBUTIONS (ROC AUC, cv folds). The search
+    runs `jobs` candidate fits at a time, each LightGBM fit on one thread, so
+    the cores are not oversubscribed.
+    """
+    from lightgbm import LGBMClassifier
+    from sklearn.model_selection import RandomizedSearchCV
+
+    if params:
+        model = LGBMClassifier(random_state=seed, n_jobs=jobs, verbose=-1, **params)
+        return {"final_model": model.fit(X, y), "best_params": params, "cv_roc_auc": None}
+
+    searcher = RandomizedSearchCV(
+        LGBMClassifier(random_state=seed, n_jobs=1, verbose=-1), param_distributions=PARAM_DISTRIBUTIONS,
+        n_iter=n_iter, cv=cv, scoring="roc_auc", random_state=seed, n_jobs=jobs, refit=True,
+    )
+    searcher.fit(X, y)
+    model = searcher.best_estimator_
+    model.set_params(n_jobs=-1)  # served predictions pick their own thread count
+    return {"final_model": model, "best_params": searcher.best_params_,
+            "cv_roc_auc": float(searcher.best_score_)}
+
+
+def save(output: Path, artifacts: dict):
+    """Writes every artifact under the file names of config.py, each with an atomic rename."""
+    output.mkdir(parents=True, exist_ok=True)
+    paths = {
+        "knn_imputer": KNN_IMPUTER_PATH, "standard_scaler": STANDARD_SCALER_PATH,
+        "ordinal_encoder": ORDINAL_ENCODER_PATH, "one_hot_encoder": ONE_HOT_ENCODER_PATH,
+        "pca_transformer": PCA_TRANSFORMER_PATH, "final_model": FINAL_MODEL_PATH,
+    }
+    for name, path in paths.items():
+        _write_atomic(output / path.name, lambda tmp: joblib.dump(artifacts[name], tmp))
+    _write_atomic(output / LABEL_ENCODER_FILE, lambda tmp: joblib.dump(artifacts["label_encoder"], tmp))
+    _write_atomic(output / FINAL_FEATURES_LIST_PATH.name,
+                  lambda tmp: Path(tmp).write_text(json.dumps(artifacts["final_features_list"])))
+
+
+def check_served(output: Path) -> dict:
+    """Loads the written artifacts like the server (compiled plan, flattened trees) and scores WARMUP_RECORDS."""
+    import preprocessor
+
+    predictor = preprocessor.load_predictor(output, model_format="joblib")
+    if predictor.transform_plan is None or predictor.tree_evaluator is None:
+        raise RuntimeError("The trained artifacts do not compile into the server's fast paths")
+    results = predictor.predict_records(WARMUP_RECORDS)
+    return {"version": predictor.version, "warmup_probabilities": [r["probability_of_disease"] for r in results]}
+
+
+# --- Command line ---
+
+def train(args) -> dict:
+    from sklearn.metrics import roc_auc_score
+    from thread_plan import available_cpus
+
+    jobs = args.jobs or max(1, math.floor(available_cpus()[0]))
+    params = json.loads(args.params) if args.params else None
+    runner = StageRunner(None if args.no_cache else args.cache_dir)
+    started = time.perf_counter()
+
+    df, knn_imputer = runner.run("prepare", {
+        "data": file_digest(args.data), "num_cols": NUM_COLS, "cat_cols": CAT_COLS, "knn_cols": KNN_IMPUTE_COLS,
+        "binning": ORDINAL_BINNING, "homa_ir": HOMA_IR_DIVISOR, "glucose_risk": GLUCOSE_RISK_THRESHOLD,
+        "knn_neighbors": args.knn_neighbors, "iqr_factor": args.iqr_factor,
+    }, lambda: prepare(args.data, args.knn_neighbors, args.iqr_factor, jobs))
+    X, y, encoders = runner.run("encode", {"ordinal_cols": CAT_ORDINAL_COLS}, lambda: encode(df))
+    data = runner.run("split", {"test_size": args.test_size, "resample": args.resample, "seed": args.seed},
+                      lambda: split(X, y, args.test_size, args.resample, args.seed))
+    reduced = runner.run("pca", {"variance": args.pca_variance},
+                         lambda: fit_pca(data, args.pca_variance, args.seed))
+    # The search result does not depend on how many processes ran it
+    model = runner.run("search", {"params": params, "n_iter": args.n_iter, "cv": args.cv,
+                                  "space": PARAM_DISTRIBUTIONS},
+                       lambda: search(reduced["X_train_pca"], data["y_train"], params, args.n_iter, args.cv,
+                                      jobs, args.seed))
+
+    output = Path(args.output)
+    t = time.perf_counter()
+    save(output, {"knn_imputer": knn_imputer, **encoders, "pca_transformer": reduced["pca_transformer"],
+                  "final_model": model["final_model"], "final_features_list": data["final_features_list"]})
+    served = check_served(output)
+    if args.bundle:
+        import model_bundle
+        model_bundle.convert(output, output / "model.bundle")
+    runner.timings["save"] = {"seconds": round(time.perf_counter() - t, 3), "cached": False}
+    print(f"{'save':<8} {runner.timings['save']['seconds']:8.2f} s", flush=True)
+
+    test_proba = model["final_model"].predict_proba(reduced["X_test_pca"])[:, 1]
+    report = {
+        "data": str(args.data),
+        "rows_after_filter": int(len(df)),
+        "train_rows": int(len(data["y_train"])),
+        "test_rows": int(len(data["y_test"])),
+        "pca_components": int(reduced["pca_transformer"].n_components_),
+        "best_params": model["best_params"],
+        "cv_roc_auc": model["cv_roc_auc"],
+        "test_roc_auc": float(roc_auc_score(data["y_test"], test_proba)),
+        "jobs": jobs,
+        "stages": runner.timings,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "served_version": served["version"],
+    }
+    _write_atomic(output / REPORT_FILE, lambda tmp: Path(tmp).write_text(json.dumps(report, indent=2)))
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", help="Training dataset (.csv or .parquet) with the raw columns and 'target'")
+    parser.add_argument("-o", "--output", required=True, help="Directory to write the artifacts to")
+    parser.add_argument("--cache-dir", default=".training_cache", help="Stage cache (default .training_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Run every stage without reading or writing the cache")
+    parser.add_argument("--knn-neighbors", type=int, default=5)
+    parser.add_argument("--iqr-factor", type=float, default=1.5, help="Outlier filter width; 0 keeps every row")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--resample", choices=("smote", "none"), default="smote")
+    parser.add_argument("--pca-variance", type=float, default=0.90)
+    parser.add_argument("--n-iter", type=int, default=20, help="Hyperparameter candidates to try")
+    parser.add_argument("--cv", type=int, default=3, help="Cross-validation folds per candidate")
+    parser.add_argument("--params", help="JSON LightGBM parameters to fit directly instead of searching")
+    parser.add_argument("--jobs", type=int, help="Parallel imputation chunks and candidate fits "
+                                                 "(default: the available CPUs)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bundle", action="store_true", help="Also write model.bundle (see model_bundle.py)")
+    args = parser.parse_args(argv)
+
+    try:
+        report = train(args)
+    except (RuntimeError, ValueError) as e:
+        print(f"Training failed: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Test ROC AUC {report['test_roc_auc']:.4f} with {report['best_params']} "
+          f"({report['pca_components']} PCA components); total {report['total_seconds']:.1f} s")
+    print(f"Artifacts written to {args.output} (version {report['served_version']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
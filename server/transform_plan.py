@@ -0,0 +1,485 @@
+# transform_plan.py
+
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from config import (
+    USER_INPUT_COLUMNS, KNN_IMPUTE_COLS, NUM_COLS, CAT_COLS, CAT_ORDINAL_COLS,
+    BMI_BINS, BMI_LABELS, AGE_BINS, AGE_LABELS, HOMA_IR_DIVISOR, GLUCOSE_RISK_THRESHOLD,
+    STRESS_LEVEL_MAPPING, STRESS_LEVEL_DEFAULT, SMOKING_LEVEL_MAPPING, SMOKING_LEVEL_DEFAULT,
+    DIET_TYPE_MAPPING, DIET_TYPE_DEFAULT, CATEGORICAL_DEFAULTS, CATEGORY_FALLBACK_CANDIDATES
+)
+from metrics import stage_clock, record_stage
+
+# Engineered numerical features that are computed here rather than read from the input
+ENGINEERED_NUM_COLS = ['caffeine_missing_flag', 'HOMA_IR']
+
+# Categorical training features derived from a differently named user input
+DERIVED_CAT_COLS = {
+    'smoking_level': ('smoking_status', SMOKING_LEVEL_MAPPING, SMOKING_LEVEL_DEFAULT),
+    'diet_type': ('dietary_habits', DIET_TYPE_MAPPING, DIET_TYPE_DEFAULT),
+}
+
+# (engineered column, source column, bin edges, bin labels) for the ordinal features
+ORDINAL_BINNING = {
+    'bmi_cat': ('bmi', BMI_BINS, BMI_LABELS),
+    'age_group': ('age', AGE_BINS, AGE_LABELS),
+}
+
+
+def _to_number(value) -> float:
+    """Scalar equivalent of pd.to_numeric(..., errors="coerce")."""
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float, np.number, np.bool_)):
+        return float(value)
+    if isinstance(value, str):
+        # float() accepts digit separators, pandas does not
+        if "_" in value:
+            return math.nan
+        try:
+            return float(value)
+        except ValueError:
+            return math.nan
+    return math.nan
+
+
+def _coerce_numeric(values) -> np.ndarray:
+    """Coerces one input column to float64, mapping anything unparseable to NaN."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+        return values.astype(np.float64)
+    return np.fromiter((_to_number(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def _lookup_codes(values, table: dict, fallback: int) -> np.ndarray:
+    """Maps raw category values onto their index in `table`, using `fallback` for anything else."""
+    codes = np.empty(len(values), dtype=np.intp)
+    for i, value in enumerate(values):
+        try:
+            codes[i] = table.get(value, fallback)
+        except TypeError:  # unhashable input (lists, dicts, ...)
+            codes[i] = fallback
+    return codes
+
+
+@dataclass(frozen=True)
+class SweepBase:
+    """What TransformPlan.sweep_base shares between the rows of a sweep."""
+    num: np.ndarray         # (1, len(NUM_COLS)), imputed unless reimpute
+    cat_codes: list         # per CAT_COLS entry, a 1-row code array
+    num_cols: list          # NUM_COLS indices taken from the varied columns
+    cat_cols: list          # CAT_COLS indices taken from (or derived from) the varied columns
+    reimpute: bool          # a varied column feeds the KNN imputer
+
+
+class TransformPlan:
+    """
+    The preprocessing pipeline of `preprocessor.preprocess_input`, compiled from the
+    fitted artifacts into flat lookup tables so that records are turned into the
+    PCA input without building any DataFrames.
+
+    Everything that the pandas pipeline recomputes per call (allowed category sets,
+    one-hot column names, the final reindex) is resolved once here into integer
+    positions within FINAL_FEATURES_LIST.
+    """
+
+    def __init__(self, one_hot_encoder, ordinal_encoder, standard_scaler, knn_imputer,
+                 pca_transformer, final_features_list):
+        feature_positions = {name: i for i, name in enumerate(final_features_list)}
+        self.n_features = len(final_features_list)
+        self.knn_imputer = knn_imputer
+
+        # --- Numerical block (Standard Scaling) ---
+        scaler_features = list(getattr(standard_scaler, "feature_names_in_", NUM_COLS))
+        if scaler_features != NUM_COLS:
+            raise ValueError("StandardScaler features do not match NUM_COLS")
+        # Columns missing from FINAL_FEATURES_LIST are dropped by the reindex, so they are skipped here too
+        self.num_indices = np.array([j for j, c in enumerate(NUM_COLS) if c in feature_positions], dtype=np.intp)
+        self.num_positions = np.array([feature_positions[NUM_COLS[j]] for j in self.num_indices], dtype=np.intp)
+        self.scaler_mean = np.asarray(standard_scaler.mean_, dtype=np.float64)
+        self.scaler_scale = np.asarray(standard_scaler.scale_, dtype=np.float64)
+        self.raw_num_cols = [c for c in NUM_COLS if c not in ENGINEERED_NUM_COLS]
+        self.knn_col_indices = np.array([NUM_COLS.index(c) for c in KNN_IMPUTE_COLS], dtype=np.intp)
+
+        # --- Ordinal block ---
+        self.ordinal_indices = np.array([j for j, c in enumerate(CAT_ORDINAL_COLS) if c in feature_positions],
+                                        dtype=np.intp)
+        self.ordinal_positions = np.array([feature_positions[CAT_ORDINAL_COLS[j]] for j in self.ordinal_indices],
+                                          dtype=np.intp)
+        self.ordinal_bins = []
+        for j, col in enumerate(CAT_ORDINAL_COLS):
+            source, edges, labels = ORDINAL_BINNING[col]
+            categories = list(ordinal_encoder.categories_[j])
+            if any(label not in categories for label in labels):
+                raise ValueError(f"OrdinalEncoder categories for '{col}' do not cover {labels}")
+            codes = np.array([categories.index(label) for label in labels], dtype=np.float64)
+            self.ordinal_bins.append((source, np.asarray(edges, dtype=np.float64), codes))
+
+        # --- One-hot block ---
+        # For every categorical column: category -> index table, the sanitize fallback
+        # and the FINAL_FEATURES_LIST position of each category (-1 if dropped/absent).
+        feature_names = list(one_hot_encoder.get_feature_names_out(CAT_COLS))
+        self.cat_tables = []
+        self.cat_fallbacks = []
+        self.cat_positions = []
+        offset = 0
+        for i, col in enumerate(CAT_COLS):
+            categories = one_hot_encoder.categories_[i].tolist()
+            table = {category: k for k, category in enumerate(categories)}
+
+            # Same choice as _sanitize_and_coerce (including its set iteration order)
+            allowed = set(categories)
+            fallback = None
+            for cand in CATEGORY_FALLBACK_CANDIDATES:
+                if cand in allowed:
+                    fallback = cand
+                    break
+            if fallback is None and len(allowed) > 0:
+                fallback = next(iter(allowed))
+
+            drop_idx = None
+            if getattr(one_hot_encoder, "drop_idx_", None) is not None:
+                drop_idx = one_hot_encoder.drop_idx_[i]
+            positions = np.full(len(categories) + 1, -1, dtype=np.intp)  # last slot: no category
+            for k in range(len(categories)):
+                if drop_idx is not None and k == drop_idx:
+                    continue
+                positions[k] = feature_positions.get(feature_names[offset], -1)
+                offset += 1
+
+            self.cat_tables.append(table)
+            self.cat_fallbacks.append(table.get(fallback, -1))
+            self.cat_positions.append(positions)
+        if offset != len(feature_names):
+            raise ValueError("OneHotEncoder output columns do not match its categories")
+
+        self.diabetes_flag_col = CAT_COLS.index('diabetes_risk_flag')
+        diabetes_table = self.cat_tables[self.diabetes_flag_col]
+        self.diabetes_high_code = diabetes_table.get("High Risk", -1)
+        self.diabetes_normal_code = diabetes_table.get("Normal/Pre-Risk", -1)
+
+        # --- PCA ---
+        self.pca_components_t = np.ascontiguousarray(np.asarray(pca_transformer.components_, dtype=np.float64).T)
+        self.pca_mean_projection = np.asarray(pca_transformer.mean_, dtype=np.float64) @ self.pca_components_t
+        if self.pca_components_t.shape[0] != self.n_features:
+            raise ValueError("PCA input width does not match FINAL_FEATURES_LIST")
+
+        # --- Folded Scaling + PCA ---
+        # Both stages are linear, so over the FINAL_FEATURES_LIST layout
+        #   pca((x - mean) / scale) = x @ (components.T / scale) + bias
+        # for the numerical block. Ordinal codes enter unscaled and each active
+        # one-hot column just adds its row of components.T, which is gathered
+        # per category instead of multiplying the sparse indicator block.
+        components_t = self.pca_components_t
+        num_rows = components_t[self.num_positions]
+        num_mean = self.scaler_mean[self.num_indices]
+        num_scale = self.scaler_scale[self.num_indices]
+        self.affine_num_weights = np.ascontiguousarray(num_rows / num_scale[:, None])
+        self.affine_ordinal_weights = np.ascontiguousarray(components_t[self.ordinal_positions])
+        self.affine_bias = -self.pca_mean_projection - (num_mean / num_scale) @ num_rows
+
+        zero_row = np.zeros((1, components_t.shape[1]), dtype=np.float64)
+        self.affine_cat_contributions = []
+        for positions in self.cat_positions:
+            # One row per category code plus the trailing "no category" slot (-1)
+            rows = np.concatenate([components_t, zero_row])[positions]
+            self.affine_cat_contributions.append(np.ascontiguousarray(rows))
+        self.n_components = components_t.shape[1]
+
+    # --- Entry points ---
+
+    @staticmethod
+    def columns_from(batch) -> dict:
+        """Column-oriented view (column name -> values) of a DataFrame or a list of input dicts."""
+        if hasattr(batch, "columns"):
+            return {col: batch[col].to_numpy() for col in batch.columns}
+        return {col: [record.get(col) for record in batch] for col in USER_INPUT_COLUMNS}
+
+    def transform_records(self, records: list) -> np.ndarray:
+        """Transforms a list of input dicts (keys as in USER_INPUT_COLUMNS) into PCA space."""
+        return self.transform_columns(self.columns_from(records), len(records))
+
+    def transform_frame(self, input_df) -> np.ndarray:
+        """Transforms a raw input DataFrame into PCA space."""
+        return self.transform_columns(self.columns_from(input_df), len(input_df))
+
+    def transform_columns(self, columns: dict, n_rows: int) -> np.ndarray:
+        """
+        Transforms column-oriented input (column name -> sequence of raw values) into PCA space.
+
+        Columns that are absent are treated the way the pandas pipeline treats them
+        (missing numerics become NaN, missing training-only categoricals get their defaults).
+        """
+        if n_rows == 0:
+            return np.empty((0, self.n_components), dtype=np.float64)
+        num, ordinal, cat_codes = self.prepare_features(columns, n_rows)
+        return self.project(num, ordinal, cat_codes)
+
+    # --- Stages ---
+
+    def canonical_record(self, record: dict) -> tuple:
+        """
+        Hashable form of one input dict as the pipeline sees it: numerics after
+        coercion (and the stress mapping), categoricals as their sanitized category
+        index. Records with the same canonical form get the same prediction, so
+        e.g. {"age": "45"} and {"age": 45} are interchangeable. Inputs the model
+        does not use are left out.
+        """
+        derived_sources = {source: col for col, (source, _, _) in DERIVED_CAT_COLS.items()}
+        canonical = []
+        for col in USER_INPUT_COLUMNS:
+            value = record.get(col)
+            if col in self.raw_num_cols:
+                number = _to_number(value)
+                if col == 'stress_level':
+                    number = STRESS_LEVEL_MAPPING.get(number, STRESS_LEVEL_DEFAULT)
+                canonical.append(None if math.isnan(number) else number + 0.0)  # -0.0 -> 0.0
+            elif col in CAT_COLS:
+                i = CAT_COLS.index(col)
+                canonical.append(int(_lookup_codes([value], self.cat_tables[i], self.cat_fallbacks[i])[0]))
+            elif col in derived_sources:
+                derived = derived_sources[col]
+                _, mapping, default = DERIVED_CAT_COLS[derived]
+                try:
+                    mapped = mapping.get(value, default)
+                except TypeError:
+                    mapped = default
+                canonical.append(self.cat_tables[CAT_COLS.index(derived)].get(mapped, -1))
+        return tuple(canonical)
+
+    def suspect_rows(self, columns: dict, n_rows: int) -> np.ndarray:
+        """
+        Cheap, conservative per-row check for inputs that make the pipeline raise
+        (infinite numbers, NaN where nothing imputes it, age/BMI outside the bins).
+        Every failing row is flagged; a flagged row may still succeed. Used to
+        isolate bad rows in a batch without re-running the whole batch.
+        """
+        suspect = np.zeros(n_rows, dtype=bool)
+        knn_cols = set(KNN_IMPUTE_COLS)
+        for col in self.raw_num_cols:
+            if col not in columns:
+                continue
+            values = _coerce_numeric(columns[col])
+            if col == 'stress_level':
+                continue  # always mapped to a finite level
+            suspect |= np.isinf(values) | (np.abs(values) > 1e150)  # HOMA_IR could overflow
+            if col not in knn_cols and NUM_COLS.index(col) in self.num_indices:
+                suspect |= np.isnan(values)
+        for source, edges, codes in self.ordinal_bins:
+            values = _coerce_numeric(columns[source]) if source in columns else np.full(n_rows, np.nan)
+            suspect |= ~((values >= edges[0]) & (values < edges[len(codes)]))
+        return suspect
+
+    def prepare_features(self, columns: dict, n_rows: int) -> tuple:
+        """
+        Runs sanitizing, imputation and feature engineering.
+
+        Returns the unscaled NUM_COLS block, the ordinal codes for CAT_ORDINAL_COLS and,
+        per CAT_COLS entry, the category index of every row (-1 for "no category").
+        """
+        t = stage_clock()
+
+        # --- A. Sanitize ---
+        num, cat_codes = self._sanitize(columns, n_rows)
+        t = record_stage("sanitize", t)
+
+        # --- B. Imputation & Flags ---
+        self._map_inputs(columns, num, cat_codes, n_rows)
+        self._impute(num)
+        # Sanitized caffeine values are never missing; only an absent column counts as missing
+        num[:, NUM_COLS.index('caffeine_missing_flag')] = 0.0 if 'caffeine_intake' in columns else 1.0
+        t = record_stage("imputation", t)
+
+        return (num, *self._engineer(num, cat_codes, n_rows, t))
+
+    def sweep_base(self, base: dict, fields) -> SweepBase:
+        """
+        The part of prepare_features for the input dict `base` that every row of a
+        sweep over `fields` shares: its other columns sanitized and, unless one of
+        `fields` feeds the KNN imputer, imputed.
+        """
+        t = stage_clock()
+        fields = set(fields)
+        columns = {col: [value] for col, value in base.items() if col not in fields}
+        num, cat_codes = self._sanitize(columns, 1)
+        self._map_inputs(columns, num, cat_codes, 1)
+
+        num_cols = [j for j, col in enumerate(NUM_COLS) if col in fields and col in self.raw_num_cols]
+        cat_cols = [i for i, col in enumerate(CAT_COLS)
+                    if col in fields or (col in DERIVED_CAT_COLS and DERIVED_CAT_COLS[col][0] in fields)]
+        reimpute = any(NUM_COLS[j] in KNN_IMPUTE_COLS for j in num_cols)
+        if not reimpute:
+            self._impute(num)
+        num[:, NUM_COLS.index('caffeine_missing_flag')] = (
+            0.0 if 'caffeine_intake' in base or 'caffeine_intake' in fields else 1.0)
+        record_stage("sanitize", t)
+        return SweepBase(num, cat_codes, num_cols, cat_cols, reimpute)
+
+    def sweep_features(self, base: SweepBase, varied: dict, n_rows: int) -> tuple:
+        """
+        prepare_features for n_rows copies of a sweep_base record in which only the
+        `varied` columns (column -> n_rows values) change, as in a what-if sweep.
+
+        Only the varied columns are sanitized per row, and imputation is re-run
+        only if they feed it. Feature engineering runs on all rows (it is
+        vectorized), so every row comes out exactly as prepare_features would
+        produce it for the perturbed record.
+        """
+        t = stage_clock()
+        varied_num, varied_codes = self._sanitize(varied, n_rows)
+        t = record_stage("sanitize", t)
+
+        self._map_inputs(varied, varied_num, varied_codes, n_rows, only=base.cat_cols)
+        num = np.repeat(base.num, n_rows, axis=0)
+        num[:, base.num_cols] = varied_num[:, base.num_cols]
+        if base.reimpute:
+            self._impute(num)
+        cat_codes = [varied_codes[i] if i in base.cat_cols else np.repeat(codes, n_rows)
+                     for i, codes in enumerate(base.cat_codes)]
+        t = record_stage("imputation", t)
+
+        return (num, *self._engineer(num, cat_codes, n_rows, t))
+
+    def transform_sweep(self, base: SweepBase, varied: dict, n_rows: int) -> np.ndarray:
+        """Transforms n_rows variations of a sweep_base record (see sweep_features) into PCA space."""
+        if n_rows == 0:
+            return np.empty((0, self.n_components), dtype=np.float64)
+        num, ordinal, cat_codes = self.sweep_features(base, varied, n_rows)
+        return self.project(num, ordinal, cat_codes)
+
+    # --- Pipeline steps (shared by prepare_features and sweep_features) ---
+
+    def _sanitize(self, columns: dict, n_rows: int) -> tuple:
+        """Raw NUM_COLS block (NaN where not given) and category codes (None for absent columns)."""
+        try:
+            num = np.empty((n_rows, len(NUM_COLS)), dtype=np.float64)
+            for j, col in enumerate(NUM_COLS):
+                if col in self.raw_num_cols and col in columns:
+                    num[:, j] = _coerce_numeric(columns[col])
+                else:
+                    num[:, j] = np.nan
+            cat_codes = [
+                _lookup_codes(columns[col], self.cat_tables[i], self.cat_fallbacks[i]) if col in columns else None
+                for i, col in enumerate(CAT_COLS)
+            ]
+        except Exception as e:
+            raise RuntimeError(f"Input validation/coercion failed: {e}")
+        return num, cat_codes
+
+    def _map_inputs(self, columns: dict, num: np.ndarray, cat_codes: list, n_rows: int, only=None):
+        """
+        In place: maps stress levels onto their numeric scale and fills the codes of
+        categoricals that are not read from the input (derived ones, training-only
+        defaults). `only` limits the filling to these CAT_COLS indices.
+        """
+        stress_j = NUM_COLS.index('stress_level')
+        num[:, stress_j] = [STRESS_LEVEL_MAPPING.get(v, STRESS_LEVEL_DEFAULT) for v in num[:, stress_j].tolist()]
+
+        for i, col in enumerate(CAT_COLS):
+            if cat_codes[i] is not None or (only is not None and i not in only):
+                continue
+            table = self.cat_tables[i]
+            if col in DERIVED_CAT_COLS:
+                source, mapping, default = DERIVED_CAT_COLS[col]
+                values = columns.get(source)
+                if values is None:
+                    values = [None] * n_rows
+                mapped = []
+                for v in values:
+                    try:
+                        mapped.append(mapping.get(v, default))
+                    except TypeError:
+                        mapped.append(default)
+                cat_codes[i] = _lookup_codes(mapped, table, -1)
+            elif col in CATEGORICAL_DEFAULTS:
+                cat_codes[i] = np.full(n_rows, table.get(CATEGORICAL_DEFAULTS[col], -1), dtype=np.intp)
+            elif col == 'exercise_type':
+                cat_codes[i] = np.full(n_rows, table.get("Undefined", -1), dtype=np.intp)
+            elif col == 'caffeine_intake':
+                cat_codes[i] = np.full(n_rows, table.get("Unknown", -1), dtype=np.intp)
+            else:
+                cat_codes[i] = np.full(n_rows, -1, dtype=np.intp)
+
+    def _impute(self, num: np.ndarray):
+        """In place: KNN imputation of the KNN_IMPUTE_COLS block."""
+        try:
+            knn_block = num[:, self.knn_col_indices]
+            num[:, self.knn_col_indices] = self.knn_imputer.transform(knn_block)
+        except Exception as e:
+            raise RuntimeError(f"KNN imputation failed: {e}")
+
+    def _engineer(self, num: np.ndarray, cat_codes: list, n_rows: int, t: float) -> tuple:
+        """Feature engineering (in place) and the scaling/encoding input checks. Returns (ordinal, cat_codes)."""
+        # --- C. Feature Engineering ---
+        glucose = num[:, NUM_COLS.index('glucose')]
+        num[:, NUM_COLS.index('HOMA_IR')] = (glucose * num[:, NUM_COLS.index('insulin')]) / HOMA_IR_DIVISOR
+        cat_codes[self.diabetes_flag_col] = np.where(glucose > GLUCOSE_RISK_THRESHOLD,
+                                                     self.diabetes_high_code, self.diabetes_normal_code)
+
+        ordinal = np.empty((n_rows, len(CAT_ORDINAL_COLS)), dtype=np.float64)
+        for j, (source, edges, codes) in enumerate(self.ordinal_bins):
+            # pd.cut(..., right=False): bin k holds edges[k] <= x < edges[k + 1]
+            bins = np.searchsorted(edges, num[:, NUM_COLS.index(source)], side="right") - 1
+            valid = (bins >= 0) & (bins < len(codes))
+            ordinal[:, j] = np.where(valid, codes[np.clip(bins, 0, len(codes) - 1)], np.nan)
+        t = record_stage("feature_engineering", t)
+
+        # --- D. Scaling (input checks only; the arithmetic is folded into project) ---
+        if not np.isfinite(num[~np.isnan(num)]).all():
+            raise RuntimeError("Standard scaling failed: Input X contains infinity or a value too large "
+                               "for dtype('float64').")
+        t = record_stage("scaling", t)
+
+        # --- E. Encoding ---
+        for j in range(len(CAT_ORDINAL_COLS)):
+            if np.isnan(ordinal[:, j]).any():
+                raise RuntimeError(f"Ordinal encoding failed: Found unknown categories [nan] in column {j} "
+                                   f"during transform")
+        record_stage("ordinal_encoding", t)
+
+        return ordinal, cat_codes
+
+    def project(self, num: np.ndarray, ordinal: np.ndarray, cat_codes: list) -> np.ndarray:
+        """Applies the folded Scaling + PCA affine transform to prepared features."""
+        t = stage_clock()
+        num = num[:, self.num_indices]
+        if np.isnan(num).any():
+            raise RuntimeError("PCA transformation failed: Input X contains NaN.")
+
+        X_pca = num @ self.affine_num_weights
+        X_pca += ordinal[:, self.ordinal_indices] @ self.affine_ordinal_weights
+        X_pca += self.affine_bias
+        for contributions, codes in zip(self.affine_cat_contributions, cat_codes):
+            X_pca += contributions[codes]
+        record_stage("pca", t)
+        return X_pca
+
+    def build_feature_matrix(self, columns: dict, n_rows: int) -> np.ndarray:
+        """
+        Builds the scaled (n_rows, len(FINAL_FEATURES_LIST)) matrix that the pandas
+        pipeline feeds into PCA. Not used on the scoring path, which goes through project.
+        """
+        return self.scaled_features(*self.prepare_features(columns, n_rows))
+
+    def scaled_features(self, num: np.ndarray, ordinal: np.ndarray, cat_codes: list) -> np.ndarray:
+        """The scaled FINAL_FEATURES_LIST matrix of prepared features (what project maps into PCA space)."""
+        n_rows = len(num)
+        num = (num - self.scaler_mean) / self.scaler_scale
+
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        X[:, self.num_positions] = num[:, self.num_indices]
+        X[:, self.ordinal_positions] = ordinal[:, self.ordinal_indices]
+        rows = np.arange(n_rows)
+        for i in range(len(CAT_COLS)):
+            positions = self.cat_positions[i][cat_codes[i]]
+            active = positions >= 0
+            X[rows[active], positions[active]] = 1.0
+        return X
+
+
+def compile_transform_plan(one_hot_encoder, ordinal_encoder, standard_scaler, knn_imputer,
+                           pca_transformer, final_features_list) -> TransformPlan:
+    """Compiles the fitted preprocessing artifacts into a TransformPlan."""
+    return TransformPlan(one_hot_encoder, ordinal_encoder, standard_scaler, knn_imputer,
+                         pca_transformer, final_features_list)
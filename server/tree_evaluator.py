@@ -0,0 +1,388 @@
+# tree_evaluator.py
+
+import re
+import numpy as np
+
+# LightGBM's missing_type values, as stored per split
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+# LightGBM reads |x| <= kZeroThreshold (the float 1e-35f) as an exact zero
+K_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+
+class FlatTreeEnsemble:
+    """
+    A binary LightGBM booster flattened into NumPy arrays (feature index,
+    threshold, children and leaf value per node, for all trees at once).
+    node_value holds every node's expected output (the leaf values below it,
+    weighted by their training counts), which path attributions are taken from.
+
+    The two children of a split are stored next to each other, so a step down
+    a tree is `left[node] + (x > threshold[node])`. Leaves point back at
+    themselves with an infinite threshold, which lets every tree be walked for a
+    fixed number of steps (the maximum depth) without tracking finished rows.
+    """
+
+    # Rows evaluated together; keeps the (rows x trees) node arrays cache-sized
+    BLOCK_ROWS = 128
+
+    def __init__(self, booster):
+        dump = booster.dump_model()
+        if dump.get("num_class", 1) != 1 or dump.get("num_tree_per_iteration", 1) != 1:
+            raise ValueError("Only binary / single-output boosters can be flattened")
+        if dump.get("average_output"):
+            raise ValueError("Averaged (random forest) boosters are not supported")
+        match = re.match(r"binary sigmoid:([0-9.eE+-]+)", dump.get("objective", ""))
+        if match is None:
+            raise ValueError(f"Unsupported objective: {dump.get('objective')}")
+        self.sigmoid = float(match.group(1))
+        self.n_features = dump["max_feature_idx"] + 1
+
+        features, thresholds, lefts = [], [], []
+        default_lefts, missing_types, values, counts = [], [], [], []
+
+        def allocate():
+            features.append(0)
+            thresholds.append(np.inf)
+            lefts.append(len(lefts))
+            default_lefts.append(True)
+            missing_types.append(MISSING_NONE)
+            values.append(0.0)
+            counts.append(0)
+            return len(features) - 1
+
+        roots = []
+        max_depth = 0
+        for tree in dump["tree_info"]:
+            root = allocate()
+            roots.append(root)
+            stack = [(root, tree["tree_structure"], 0)]
+            while stack:
+                index, node, depth = stack.pop()
+                if "split_feature" not in node:
+                    values[index] = node["leaf_value"]
+                    counts[index] = node.get("leaf_count", 0)
+                    max_depth = max(max_depth, depth)
+                    continue
+                if node["decision_type"] != "<=":
+                    raise ValueError("Categorical splits are not supported")
+                features[index] = node["split_feature"]
+                thresholds[index] = node["threshold"]
+                default_lefts[index] = node["default_left"]
+                missing_types[index] = _MISSING_TYPES[node["missing_type"]]
+                left = allocate()
+                allocate()  # right child lives at left + 1
+                lefts[index] = left
+                stack.append((left, node["left_child"], depth + 1))
+                stack.append((left + 1, node["right_child"], depth + 1))
+
+        self.n_trees = len(roots)
+        self.max_depth = max_depth
+        self.roots = np.array(roots, dtype=np.int32)
+        self.feature = np.array(features, dtype=np.int32)
+        self.threshold = np.array(thresholds, dtype=np.float64)
+        self.left = np.array(lefts, dtype=np.int32)
+        self.default_left = np.array(default_lefts, dtype=bool)
+        self.missing_type = np.array(missing_types, dtype=np.int8)
+        self.value = np.array(values, dtype=np.float64)
+        self.node_value = _expected_values(self.value, np.array(counts, dtype=np.float64), self.left)
+        # With only "None" splits a missing value simply compares as 0.0
+        self.simple_missing = bool((self.missing_type == MISSING_NONE).all())
+
+    # Arrays and scalars that fully describe a flattened ensemble (see model_bundle.py)
+    STATE_ARRAYS = ("roots", "feature", "threshold", "left", "default_left", "missing_type", "value", "node_value")
+    STATE_SCALARS = ("sigmoid", "n_features", "n_trees", "max_depth")
+
+    def state(self) -> tuple:
+        """({name: array}, {name: scalar}) from which from_state() rebuilds this ensemble."""
+        return ({name: getattr(self, name) for name in self.STATE_ARRAYS},
+                {name: getattr(self, name) for name in self.STATE_SCALARS})
+
+    @classmethod
+    def from_state(cls, arrays: dict, scalars: dict) -> "FlatTreeEnsemble":
+        """Rebuilds a flattened ensemble from state() without the booster (the arrays are used as given)."""
+        ensemble = cls.__new__(cls)
+        for name in cls.STATE_ARRAYS:
+            setattr(ensemble, name, arrays[name])
+        for name in cls.STATE_SCALARS:
+            setattr(ensemble, name, scalars[name])
+        if len(ensemble.roots) != ensemble.n_trees:
+            raise ValueError("Tree count does not match the stored roots")
+        ensemble.simple_missing = bool((ensemble.missing_type == MISSING_NONE).all())
+        return ensemble
+
+    # --- Raw scores ---
+
+    def _prepare(self, X: np.ndarray) -> np.ndarray:
+        """X as float64, with the values LightGBM reads as 0.0 already replaced."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] < self.n_features:
+            raise ValueError(f"Expected a 2-D array with {self.n_features} features, got shape {X.shape}")
+        # LightGBM drops near-zero entries when it reads a dense row, so they compare as 0.0
+        tiny = np.abs(X) <= K_ZERO_THRESHOLD
+        if tiny.any():
+            X = np.where(tiny, 0.0, X)
+        if self.simple_missing and np.isnan(X).any():
+            X = np.where(np.isnan(X), 0.0, X)
+        return X
+
+    def predict_raw(self, X: np.ndarray) -> np.ndarray:
+        """Sum of the leaf values of all trees (the margin) for every row of X."""
+        return self._sum_trees(self._prepare(X), self.roots)
+
+    def _sum_trees(self, X: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        """Sum of the leaf values of the trees starting at `roots`, for every row of a prepared X."""
+        if len(X) == 1 and self.simple_missing:
+            return np.array([float(self.value[self._walk_one(X[0], roots)].sum())])
+
+        X = np.ascontiguousarray(X)
+        raw = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = X[start:start + self.BLOCK_ROWS]
+            raw[start:start + len(block)] = self.value[self._leaves(block, roots)].sum(axis=1)
+        return raw
+
+    def _leaf_values(self, X: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        """Leaf value of every (row, tree) pair, for the trees starting at `roots` and a prepared X."""
+        if len(X) == 1 and self.simple_missing:
+            return self.value[self._walk_one(X[0], roots)][None, :]
+
+        X = np.ascontiguousarray(X)
+        values = np.empty((len(X), len(roots)), dtype=np.float64)
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = X[start:start + self.BLOCK_ROWS]
+            values[start:start + len(block)] = self.value[self._leaves(block, roots)]
+        return values
+
+    def _walk_one(self, x: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        """Single-row path: the leaf reached in every tree, walked on 1-D arrays."""
+        nodes = roots
+        feature, threshold, left = self.feature, self.threshold, self.left
+        for _ in range(self.max_depth):
+            nodes = left[nodes] + (x[feature[nodes]] > threshold[nodes])
+        return nodes
+
+    def _leaves(self, X: np.ndarray, roots: np.ndarray) -> np.ndarray:
+        """Leaf node index reached by every (row, tree) pair of a block of rows."""
+        n_rows, n_cols = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int32) * n_cols)[:, None]
+        nodes = np.broadcast_to(roots, (n_rows, len(roots)))
+        for _ in range(self.max_depth):
+            nodes = self._step(flat_X, row_offsets, nodes)
+        return nodes
+
+    def _step(self, flat_X: np.ndarray, row_offsets: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        """One step down every tree: the child of each (row, tree) node (a leaf stays put)."""
+        x = flat_X[row_offsets + self.feature[nodes]]
+        threshold = self.threshold[nodes]
+        if self.simple_missing:
+            go_right = x > threshold
+        else:
+            missing_type = self.missing_type[nodes]
+            is_nan = np.isnan(x)
+            x = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, x)
+            is_missing = (((missing_type == MISSING_ZERO) & (np.abs(x) <= K_ZERO_THRESHOLD))
+                          | ((missing_type == MISSING_NAN) & is_nan))
+            go_right = np.where(is_missing, ~self.default_left[nodes], x > threshold)
+        return self.left[nodes] + go_right
+
+    # --- Attributions ---
+
+    def predict_contributions(self, X: np.ndarray) -> np.ndarray:
+        """
+        Path attributions of every row: each split on the way to a leaf credits
+        its feature with the change in expected value between the node and the
+        child taken. Laid out like booster.predict(X, pred_contrib=True), i.e.
+        (rows, n_features + 1) with the ensemble's expected value last, and each
+        row sums to its margin. Unlike LightGBM's TreeSHAP values these come
+        from a single walk down each tree, at about the cost of predict_raw.
+        """
+        X = np.ascontiguousarray(self._prepare(X))
+        contributions = np.empty((len(X), self.n_features + 1), dtype=np.float64)
+        contributions[:, -1] = self.node_value[self.roots].sum()
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = X[start:start + self.BLOCK_ROWS]
+            contributions[start:start + len(block), :-1] = self._path_contributions(block)
+        return contributions
+
+    def _path_contributions(self, X: np.ndarray) -> np.ndarray:
+        """Per-feature sum of the expected-value changes along the paths of a block of rows."""
+        n_rows, n_cols = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int32) * n_cols)[:, None]
+        cells = (np.arange(n_rows, dtype=np.intp) * self.n_features)[:, None]
+        totals = np.zeros(n_rows * self.n_features, dtype=np.float64)
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+        for _ in range(self.max_depth):
+            children = self._step(flat_X, row_offsets, nodes)
+            # Leaves step onto themselves and add nothing
+            totals += np.bincount((cells + self.feature[nodes]).ravel(),
+                                  weights=(self.node_value[children] - self.node_value[nodes]).ravel(),
+                                  minlength=len(totals))
+            nodes = children
+        return totals.reshape(n_rows, self.n_features)
+
+    # --- Early exit ---
+
+    # Trees walked per pass over the rows of a batch that are still running; the
+    # finished rows are dropped between passes.
+    EARLY_EXIT_PASS_TREES = 50
+    # A single row walks up to this many trees one at a time in plain Python (about
+    # 1 us per tree) before handing the rest to one NumPy pass (about 90 us, mostly
+    # fixed call overhead), which bounds the cost for rows that run long.
+    EARLY_EXIT_SCALAR_TREES = 50
+
+    def predict_raw_early_exit(self, X: np.ndarray, margin: float, freq: int) -> tuple:
+        """
+        Margins that stop adding trees once the outcome is clear. After every
+        `freq` trees, a row whose partial margin m has 2 * |m| > margin is done;
+        this is LightGBM's pred_early_stop rule for binary models, so the result
+        matches booster.predict(X, raw_score=True, pred_early_stop=True, ...).
+        Returns (margins, number of trees used per row).
+        """
+        if freq < 1:
+            raise ValueError(f"Early-exit frequency must be at least 1, got {freq}")
+        X = self._prepare(X)
+        if len(X) == 1 and self.simple_missing:
+            raw, n_trees = self._early_exit_one(X[0], margin, freq)
+            return np.array([raw]), np.array([n_trees], dtype=np.int32)
+
+        raw = np.zeros(len(X), dtype=np.float64)
+        trees_used = np.full(len(X), self.n_trees, dtype=np.int32)
+        # Passes end on a check, so every check sees all the trees before it
+        step = -(-self.EARLY_EXIT_PASS_TREES // freq) * freq
+        active = np.arange(len(X))
+        for start in range(0, self.n_trees, step):
+            end = min(start + step, self.n_trees)
+            partial = raw[active, None] + np.cumsum(self._leaf_values(X[active], self.roots[start:end]), axis=1)
+            # Tree counts after which the rule is checked (not after the last tree: nothing is left to skip)
+            checks = np.arange(start + freq, min(end, self.n_trees - 1) + 1, freq)
+            if len(checks):
+                exceeded = 2.0 * np.abs(partial[:, checks - start - 1]) > margin
+                stopped = exceeded.any(axis=1)
+                stop_at = checks[exceeded.argmax(axis=1)[stopped]]
+                raw[active[stopped]] = partial[stopped, stop_at - start - 1]
+                trees_used[active[stopped]] = stop_at
+            else:
+                stopped = np.zeros(len(active), dtype=bool)
+            raw[active[~stopped]] = partial[~stopped, -1]
+            active = active[~stopped]
+            if len(active) == 0:
+                break
+        return raw, trees_used
+
+    def _early_exit_one(self, x: np.ndarray, margin: float, freq: int) -> tuple:
+        """
+        predict_raw_early_exit for one prepared row: (margin, trees used). The
+        first trees are walked one by one and the rule is checked at every
+        `freq`-th of them, so a row decided early costs only the trees it used.
+        """
+        nodes, value, roots = self._node_lists()
+        row = x.tolist()
+        scalar_trees = min(max(self.EARLY_EXIT_SCALAR_TREES // freq, 1) * freq, self.n_trees)
+        raw = 0.0
+        for tree in range(scalar_trees):
+            node = roots[tree]
+            feature, threshold, left = nodes[node]
+            while left != node:  # leaves point back at themselves
+                node = left + (row[feature] > threshold)
+                feature, threshold, left = nodes[node]
+            raw += value[node]
+            if (tree + 1) % freq == 0 and tree + 1 < self.n_trees and 2.0 * abs(raw) > margin:
+                return raw, tree + 1
+        if scalar_trees == self.n_trees:
+            return raw, self.n_trees
+
+        # Summed in tree order after the walked part, as LightGBM adds them
+        leaves = self.value[self._walk_one(x, self.roots[scalar_trees:])]
+        partial = np.cumsum(np.concatenate(([raw], leaves)))[1:]
+        checks = np.arange(scalar_trees + freq, self.n_trees, freq)
+        exceeded = np.flatnonzero(2.0 * np.abs(partial[checks - scalar_trees - 1]) > margin)
+        n_trees = int(checks[exceeded[0]]) if len(exceeded) else self.n_trees
+        return float(partial[n_trees - scalar_trees - 1]), n_trees
+
+    def _node_lists(self) -> tuple:
+        """
+        ([(feature, threshold, left) per node], leaf values, roots) as Python
+        lists, which are faster than the arrays one element at a time. Built on
+        first use.
+        """
+        lists = self.__dict__.get("_lists")
+        if lists is None:
+            nodes = list(zip(self.feature.tolist(), self.threshold.tolist(), self.left.tolist()))
+            lists = self._lists = (nodes, self.value.tolist(), self.roots.tolist())
+        return lists
+
+    # --- Probabilities ---
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probability of the positive class for every row of X."""
+        return self.probability(self.predict_raw(X))
+
+    def probability(self, raw: np.ndarray) -> np.ndarray:
+        """Margins -> probability of the positive class."""
+        return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+
+    def parity_sample(self, n_rows: int = 512, seed: int = 0) -> np.ndarray:
+        """
+        Inputs that exercise both sides of the splits: values drawn around each
+        feature's thresholds, plus rows that sit exactly on thresholds.
+        """
+        rng = np.random.default_rng(seed)
+        X = np.zeros((n_rows, self.n_features))
+        internal = np.isfinite(self.threshold)
+        for f in range(self.n_features):
+            split_thresholds = self.threshold[internal & (self.feature == f)]
+            if len(split_thresholds) == 0:
+                X[:, f] = rng.standard_normal(n_rows)
+                continue
+            low, high = split_thresholds.min(), split_thresholds.max()
+            margin = max(high - low, 1.0) * 0.1
+            X[:, f] = rng.uniform(low - margin, high + margin, n_rows)
+            on_threshold = rng.random(n_rows) < 0.25
+            X[on_threshold, f] = rng.choice(split_thresholds, on_threshold.sum())
+        return X
+
+    def check_parity(self, booster, n_rows: int = 512, tolerance: float = 1e-9) -> float:
+        """
+        Compares the flattened evaluator with the booster itself on `parity_sample`
+        (batched and row by row). Raises ValueError if they disagree.
+        """
+        X = self.parity_sample(n_rows)
+        # Single-threaded: an OpenMP pool started here would not survive a fork into gunicorn workers
+        expected = booster.predict(X, raw_score=True, num_threads=1)
+        batched = self.predict_raw(X)
+        single = np.array([self.predict_raw(X[i:i + 1])[0] for i in range(min(n_rows, 32))])
+        max_error = max(np.abs(expected - batched).max(), np.abs(expected[:len(single)] - single).max())
+        if not max_error <= tolerance:
+            raise ValueError(f"Flattened trees disagree with the booster (max raw score error {max_error:g})")
+        return float(max_error)
+
+
+def _expected_values(value: np.ndarray, count: np.ndarray, left: np.ndarray) -> np.ndarray:
+    """
+    Expected output of every node: the mean of the leaf values below it, weighted
+    by the training rows that reached each leaf (the cover TreeSHAP also uses).
+    Children are always stored after their parent, so one backward pass suffices.
+    """
+    weighted, count, left = (value * count).tolist(), count.tolist(), left.tolist()
+    internal = [i for i in range(len(left)) if left[i] != i]
+    for i in reversed(internal):
+        child = left[i]
+        count[i] = count[child] + count[child + 1]
+        weighted[i] = weighted[child] + weighted[child + 1]
+    expected = value.copy()
+    for i in internal:
+        if count[i] > 0:
+            expected[i] = weighted[i] / count[i]
+    return expected
+
+
+def compile_tree_ensemble(model) -> FlatTreeEnsemble:
+    """Flattens a fitted LGBMClassifier (or its booster) and verifies it against LightGBM."""
+    booster = getattr(model, "booster_", model)
+    ensemble = FlatTreeEnsemble(booster)
+    ensemble.check_parity(booster)
+    return ensemble